@@ -1,48 +1,203 @@
-import json
-from django.contrib import admin
-from django.http import HttpResponse
-from django.core.serializers.json import DjangoJSONEncoder
+from django.contrib import admin, messages
+from django.contrib.auth.hashers import make_password
+from django.core.paginator import Paginator
+from django.db import connection
+from django.utils.functional import cached_property
+from django.contrib.admin.views.main import ORDER_VAR
+from django.urls import reverse
+from django.utils.html import format_html
+from django.utils.text import capfirst
+
+from . import credentials, jobs, patient_search
 from .models import (
     Role, User, Specialization, Office, Doctor, Patient,
     Diagnosis, Service, AppointmentBooking, Appointment,
-    Prescription, PerformedService
+    Prescription, PerformedService, WorkTemplate, ScheduleException, DoctorDailyStats,
+    ExportJob
 )
 
-@admin.action(description=' Скачать выбранных в JSON')
-def export_to_json(modeladmin, request, queryset):
-    data = list(queryset.values('full_name', 'phone', 'med_card_number', 'birth_date', 'address'))
+class EstimatedCountPaginator(Paginator):
+    """Для больших выборок берет число строк из оценки планировщика PostgreSQL вместо COUNT(*).
+
+    Точный подсчет выполняется, только если оценка меньше EXACT_LIMIT.
+    """
+
+    EXACT_LIMIT = 10000
 
-    response_data = json.dumps(data, ensure_ascii=False, indent=4, cls=DjangoJSONEncoder)
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if connection.vendor == 'postgresql' and hasattr(queryset, 'query'):
+            sql, params = queryset.order_by().values('pk').query.sql_with_params()
+            with connection.cursor() as cursor:
+                cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+                estimate = cursor.fetchone()[0][0]['Plan']['Plan Rows']
+            if estimate >= self.EXACT_LIMIT:
+                return int(estimate)
+        return super().count
 
-    response = HttpResponse(response_data, content_type='application/json')
-    response['Content-Disposition'] = 'attachment; filename="patients_export.json"'
-    return response
+
+class ScaledAdmin(admin.ModelAdmin):
+    """Настройки списка для больших таблиц: без полного COUNT(*) и с оценкой числа строк."""
+
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    list_per_page = 50
+
+
+@admin.action(description=' Скачать выбранных в JSON')
+def export_to_json(modeladmin, request, queryset):
+    # Выгрузка выполняется воркером export_worker; здесь только постановка в очередь
+    ids = sorted(queryset.values_list('id', flat=True))
+    job = jobs.enqueue('patients', {'ids': ids, 'address': True})
+    url = reverse('export_job', args=[job.id])
+    modeladmin.message_user(
+        request,
+        format_html('Выгрузка поставлена в очередь: <a href="{}">задание #{}</a>', url, job.id),
+        messages.INFO,
+    )
 
 @admin.register(Patient)
-class PatientAdmin(admin.ModelAdmin):
+class PatientAdmin(ScaledAdmin):
     list_display = ('full_name', 'phone', 'med_card_number')
-    search_fields = ('full_name', 'med_card_number')
+    # search_fields оставлены для строки поиска; сам поиск — core.patient_search
+    search_fields = ('full_name', 'med_card_number', 'phone')
     actions = [export_to_json]
 
+    def get_search_results(self, request, queryset, search_term):
+        if not search_term.strip():
+            return queryset, False
+        results = patient_search.search(search_term, queryset)
+        # Без явной сортировки по колонке — сначала лучшие совпадения
+        if ORDER_VAR in request.GET:
+            results = results.order_by(*queryset.query.order_by)
+        return results, False
+
+
 admin.site.register(Role)
-admin.site.register(User)
 admin.site.register(Specialization)
 admin.site.register(Office)
 
 
+@admin.register(User)
+class UserAdmin(admin.ModelAdmin):
+    list_display = ('login', 'role')
+    list_filter = ('role',)
+    search_fields = ('login',)
+
+    def save_model(self, request, obj, form, change):
+        # В поле вводится новый пароль; в базу попадает только хеш
+        if 'password' in form.changed_data and not credentials.is_hashed(obj.password):
+            obj.password = make_password(obj.password)
+        super().save_model(request, obj, form, change)
+
+
 @admin.register(Doctor)
 class DoctorAdmin(admin.ModelAdmin):
     list_display = ('full_name', 'specialization', 'license_number')
+    list_select_related = ('specialization',)
+    search_fields = ('full_name', 'license_number')
 
 
 @admin.register(AppointmentBooking)
-class BookingAdmin(admin.ModelAdmin):
+class BookingAdmin(ScaledAdmin):
     list_display = ('date_time', 'doctor', 'patient', 'status')
-    list_filter = ('status', 'doctor')
+    # Фильтр по врачу заполнял боковую панель всей таблицей врачей; специализаций единицы
+    list_filter = ('status', 'doctor__specialization')
+    list_select_related = ('doctor__specialization', 'patient')
+    autocomplete_fields = ('doctor', 'patient')
+    date_hierarchy = 'date_time'
+    ordering = ('-date_time',)
+
+    def get_deleted_objects(self, objs, request):
+        # Внешнего ключа appointments.booking_id на секционированной таблице нет
+        # (миграция 0008): записи с проведенным приемом показываются как защищенные
+        deleted, model_count, perms_needed, protected = super().get_deleted_objects(objs, request)
+        visits = Appointment.objects.filter(booking__in=objs).select_related(
+            'booking__patient', 'booking__doctor__specialization'
+        )
+        protected = list(protected) + [
+            format_html('{}: {}', capfirst(Appointment._meta.verbose_name), visit) for visit in visits
+        ]
+        return deleted, model_count, perms_needed, protected
+
+
+@admin.register(Diagnosis)
+class DiagnosisAdmin(admin.ModelAdmin):
+    list_display = ('code_icd', 'name')
+    search_fields = ('code_icd', 'name')
+    ordering = ('code_icd',)
+
+
+@admin.register(Service)
+class ServiceAdmin(admin.ModelAdmin):
+    list_display = ('name', 'cost')
+    search_fields = ('name',)
+
+
+# __str__ приема выводит запись, а она — пациента и врача со специализацией
+_APPOINTMENT_RELATED = ('appointment__booking__patient', 'appointment__booking__doctor__specialization')
+
+
+@admin.register(Appointment)
+class AppointmentAdmin(ScaledAdmin):
+    list_display = ('booking', 'diagnosis')
+    list_select_related = ('booking__patient', 'booking__doctor__specialization', 'diagnosis')
+    raw_id_fields = ('booking',)
+    autocomplete_fields = ('diagnosis',)
+    date_hierarchy = 'booking__date_time'
+    ordering = ('-booking__date_time',)
+
+
+@admin.register(Prescription)
+class PrescriptionAdmin(ScaledAdmin):
+    list_display = ('medication_name', 'appointment')
+    list_select_related = _APPOINTMENT_RELATED
+    raw_id_fields = ('appointment',)
+    search_fields = ('medication_name',)
+    ordering = ('-id',)
+
+
+@admin.register(PerformedService)
+class PerformedServiceAdmin(ScaledAdmin):
+    list_display = ('appointment', 'service', 'count')
+    list_select_related = _APPOINTMENT_RELATED + ('service',)
+    raw_id_fields = ('appointment',)
+    autocomplete_fields = ('service',)
+    ordering = ('-id',)
+
+
+@admin.register(WorkTemplate)
+class WorkTemplateAdmin(admin.ModelAdmin):
+    list_display = ('doctor', 'office', 'weekday', 'start_time', 'end_time', 'slot_minutes')
+    list_filter = ('weekday',)
+
+
+@admin.register(ScheduleException)
+class ScheduleExceptionAdmin(admin.ModelAdmin):
+    list_display = ('date', 'doctor', 'office', 'start_time', 'end_time', 'reason')
+    date_hierarchy = 'date'
+
+
+
+@admin.register(DoctorDailyStats)
+class DoctorDailyStatsAdmin(admin.ModelAdmin):
+    list_display = ('day', 'doctor', 'status', 'visit_count', 'revenue')
+    list_filter = ('status', 'doctor__specialization')
+    list_select_related = ('doctor__specialization',)
+    date_hierarchy = 'day'
+
+    # Таблица заполняется пересчетом (core.stats), ручное редактирование не нужно
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
 
 
-admin.site.register(Diagnosis)
-admin.site.register(Service)
-admin.site.register(Appointment)
-admin.site.register(Prescription)
-admin.site.register(PerformedService)
\ No newline at end of file
+@admin.register(ExportJob)
+class ExportJobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'kind', 'status', 'progress', 'total', 'created_at', 'finished_at')
+    list_filter = ('status', 'kind')
+    readonly_fields = ('params_hash', 'file_path', 'error', 'started_at', 'finished_at')
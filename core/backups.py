@@ -0,0 +1,510 @@
+import gzip
+import hashlib
+import io
+import json
+import os
+import shutil
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from django.apps import apps
+from django.conf import settings
+from django.core.management.color import no_style
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection, transaction
+from django.db.models import Max, Q
+
+from . import partitions
+from .models import (
+    Patient, AppointmentBooking, DoctorDailyStats, ExportJob, RowChange,
+)
+
+# Снимок — каталог <BACKUP_ROOT>/<id>/ с файлами данных и manifest.json
+# (режим, размеры и sha256 всех файлов, водяные знаки id по таблицам).
+# Файлы больше BACKUP_CHUNK_MB режутся на части. Готовые файлы сразу
+# передаются загрузчику, который копирует их в хранилище параллельно с дампом.
+
+
+
+def _dependency_order(models):
+    """Модели так, что каждая идет после тех, на которые ссылается (порядок объявления сохраняется)."""
+    pending = list(models)
+    ordered = []
+    while pending:
+        for model in pending:
+            targets = {
+                field.related_model for field in model._meta.concrete_fields
+                if field.is_relation and field.related_model is not model
+            }
+            if all(target in ordered or target not in pending for target in targets):
+                ordered.append(model)
+                pending.remove(model)
+                break
+        else:
+            raise ValueError(f'Циклические ссылки между моделями: {pending}')
+    return ordered
+
+
+# Все таблицы приложения; порядок важен для восстановления — сначала справочники, затем зависимые.
+# Журнал изменений — служебный, в снимок не входит.
+MODELS = _dependency_order(model for model in apps.get_app_config('core').get_models() if model is not RowChange)
+
+# Изменение, записанное в журнал до начала снимка, но закоммиченное после чтения
+# таблицы, попадет в следующий инкремент, если транзакция была короче этого запаса
+CHANGE_LOG_OVERLAP = timedelta(minutes=10)
+
+MANIFEST = 'manifest.json'
+
+
+def backup_root():
+    return str(getattr(settings, 'BACKUP_ROOT', 'backups'))
+
+
+def chunk_bytes():
+    return getattr(settings, 'BACKUP_CHUNK_MB', 64) * 1024 * 1024
+
+
+def sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class LocalObjectStore:
+    """Хранилище снимков на локальном/смонтированном диске: <root>/<snapshot>/<файл>."""
+
+    def __init__(self, root):
+        self.root = str(root)
+
+    def put(self, snapshot_id, name, path):
+        target = os.path.join(self.root, snapshot_id, name)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        shutil.copyfile(path, target + '.part')
+        if sha256(target + '.part') != sha256(path):
+            os.remove(target + '.part')
+            raise IOError(f'Контрольная сумма не совпала: {name}')
+        os.replace(target + '.part', target)
+
+    def snapshots(self):
+        if not os.path.isdir(self.root):
+            return []
+        return sorted(
+            name for name in os.listdir(self.root)
+            if os.path.exists(os.path.join(self.root, name, MANIFEST))
+        )
+
+    def delete(self, snapshot_id):
+        shutil.rmtree(os.path.join(self.root, snapshot_id), ignore_errors=True)
+
+
+class Uploader:
+    """Фоновая загрузка файлов снимка в хранилище с повторами."""
+
+    def __init__(self, store, workers=2, retries=3):
+        self.store = store
+        self.retries = retries
+        self.pool = ThreadPoolExecutor(max_workers=workers)
+        self.futures = []
+
+    def _put(self, snapshot_id, name, path):
+        for attempt in range(1, self.retries + 1):
+            try:
+                self.store.put(snapshot_id, name, path)
+                return name
+            except OSError:
+                if attempt == self.retries:
+                    raise
+
+    def submit(self, snapshot_id, name, path):
+        self.futures.append(self.pool.submit(self._put, snapshot_id, name, path))
+
+    def wait(self):
+        self.pool.shutdown(wait=True)
+        return [future.result() for future in self.futures]
+
+
+class Snapshot:
+    def __init__(self, mode, root=None, on_file=None):
+        self.id = f"{datetime.now():%Y-%m-%d_%H-%M-%S}_{mode}"
+        self.path = os.path.join(root or backup_root(), self.id)
+        self.on_file = on_file
+        self.manifest = {
+            'id': self.id,
+            'mode': mode,
+            'created_at': datetime.now().isoformat(),
+            'files': [],
+        }
+        os.makedirs(self.path, exist_ok=True)
+
+    def _register(self, path):
+        name = os.path.relpath(path, self.path)
+        self.manifest['files'].append({'name': name, 'size': os.path.getsize(path), 'sha256': sha256(path)})
+        if self.on_file:
+            self.on_file(self.id, name, path)
+
+    def add_file(self, path):
+        """Зарегистрировать готовый файл, разрезав его на части при необходимости."""
+        limit = chunk_bytes()
+        if os.path.getsize(path) <= limit:
+            self._register(path)
+            return
+
+        with open(path, 'rb') as source:
+            part = 0
+            for block in iter(lambda: source.read(limit), b''):
+                part_path = f'{path}.part{part:04d}'
+                with open(part_path, 'wb') as target:
+                    target.write(block)
+                self._register(part_path)
+                part += 1
+        os.remove(path)
+
+    def finish(self, **extra):
+        self.manifest.update(extra)
+        path = os.path.join(self.path, MANIFEST)
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.manifest, f, ensure_ascii=False, indent=2)
+        # Манифест загружается последним: снимок без него в хранилище считается неполным
+        if self.on_file:
+            self.on_file(self.id, MANIFEST, path)
+
+
+class NdjsonChunkWriter:
+    """Строки таблицы в файлы <table>.<n>.ndjson.gz не больше chunk_bytes (до сжатия)."""
+
+    encoder = DjangoJSONEncoder(ensure_ascii=False)
+
+    def __init__(self, snapshot, table):
+        self.snapshot = snapshot
+        self.table = table
+        self.limit = chunk_bytes()
+        self.part = 0
+        self.file = None
+        self.written = 0
+        self.rows = 0
+
+    def _open(self):
+        self.path = os.path.join(self.snapshot.path, f'{self.table}.{self.part:04d}.ndjson.gz')
+        self.file = gzip.open(self.path, 'wt', encoding='utf-8', compresslevel=6)
+        self.written = 0
+
+    def _close(self):
+        if self.file:
+            self.file.close()
+            self.file = None
+            self.snapshot.add_file(self.path)
+            self.part += 1
+
+    def write(self, row):
+        if self.file is None:
+            self._open()
+        line = self.encoder.encode(row) + '\n'
+        self.file.write(line)
+        self.written += len(line)
+        self.rows += 1
+        if self.written >= self.limit:
+            self._close()
+
+    def close(self):
+        self._close()
+        return self.rows
+
+
+def watermarks():
+    return {model._meta.db_table: model.objects.aggregate(m=Max('id'))['m'] or 0 for model in MODELS}
+
+
+def latest_manifest(root=None):
+    root = root or backup_root()
+    if not os.path.isdir(root):
+        return None
+    for name in sorted(os.listdir(root), reverse=True):
+        path = os.path.join(root, name, MANIFEST)
+        if os.path.exists(path):
+            with open(path, encoding='utf-8') as f:
+                manifest = json.load(f)
+            if manifest.get('watermarks'):
+                return manifest
+    return None
+
+
+def change_log_enabled():
+    """Ведется ли журнал изменений row_changes (миграция 0010, только PostgreSQL)."""
+    if connection.vendor != 'postgresql':
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT to_regproc('row_changes_log') IS NOT NULL")
+        return cursor.fetchone()[0]
+
+
+def _logged_ids(model, previous):
+    since = datetime.fromisoformat(previous['created_at']) - CHANGE_LOG_OVERLAP
+    return RowChange.objects.filter(table_name=model._meta.db_table, changed_at__gte=since).values('row_id')
+
+
+def _changed_rows(model, previous):
+    """Строки, изменившиеся после предыдущего снимка."""
+    condition = Q(id__gt=previous['watermarks'].get(model._meta.db_table, 0))
+    if previous.get('change_log'):
+        # Журнал велся с начала предыдущего снимка: изменения и удаления известны точно
+        return model.objects.filter(condition | Q(id__in=_logged_ids(model, previous)))
+
+    since = datetime.fromisoformat(previous['created_at'])
+    if model is Patient:
+        condition |= Q(updated_at__gte=since)
+    elif model is AppointmentBooking:
+        # У записей нет отметки изменения; статус меняется вокруг даты приема,
+        # поэтому повторно выгружается окно от начала прошлого снимка.
+        window = timedelta(days=getattr(settings, 'BACKUP_BOOKING_WINDOW_DAYS', 30))
+        condition |= Q(date_time__gte=since - window)
+    elif model is DoctorDailyStats:
+        # Пересчитывается вслед за записями — то же окно по дню
+        window = timedelta(days=getattr(settings, 'BACKUP_BOOKING_WINDOW_DAYS', 30))
+        condition |= Q(day__gte=(since - window).date())
+    elif model is ExportJob:
+        condition |= Q(finished_at__gte=since) | Q(status__in=[ExportJob.STATUS_PENDING, ExportJob.STATUS_RUNNING])
+    else:
+        # Без журнала изменения остальных таблиц не отследить — выгружаются целиком
+        condition = Q()
+    return model.objects.filter(condition)
+
+
+def full_tables(previous):
+    """Таблицы, которые инкремент без журнала изменений выгружает целиком."""
+    if previous.get('change_log'):
+        return []
+    tracked = (Patient, AppointmentBooking, DoctorDailyStats, ExportJob)
+    return [model._meta.db_table for model in MODELS if model not in tracked]
+
+
+def deleted_rows(previous):
+    """id строк, удаленных после предыдущего снимка, по таблицам (только с журналом изменений)."""
+    if not previous.get('change_log'):
+        return {}
+    deleted = {}
+    for model in MODELS:
+        ids = sorted(set(
+            _logged_ids(model, previous).exclude(row_id__in=model.objects.values('id')).values_list('row_id', flat=True)
+        ))
+        if ids:
+            deleted[model._meta.db_table] = ids
+    return deleted
+
+
+def trim_change_log(manifest):
+    """Записи журнала, которые не понадобятся инкременту после снимка manifest."""
+    since = datetime.fromisoformat(manifest['created_at']) - CHANGE_LOG_OVERLAP
+    return RowChange.objects.filter(changed_at__lt=since).delete()[0]
+
+
+def dump_rows(snapshot, previous=None):
+    """Построчная выгрузка таблиц в NDJSON; при previous — только изменения после него."""
+    counts = {}
+    for model in MODELS:
+        fields = [field.attname for field in model._meta.concrete_fields]
+        queryset = _changed_rows(model, previous) if previous else model.objects.all()
+        writer = NdjsonChunkWriter(snapshot, model._meta.db_table)
+        for row in queryset.order_by('id').values(*fields).iterator(chunk_size=2000):
+            writer.write(row)
+        counts[model._meta.db_table] = writer.close()
+    return counts
+
+
+def _pg_command(program, *args):
+    db = settings.DATABASES['default']
+    env = os.environ.copy()
+    env['PGPASSWORD'] = str(db.get('PASSWORD') or '')
+    return [
+        program,
+        '-h', db.get('HOST') or 'localhost',
+        '-p', str(db.get('PORT') or 5432),
+        '-U', db.get('USER') or '',
+        *args,
+    ], env
+
+
+def dump_pg(snapshot, jobs):
+    """pg_dump в формате каталога с -j потоками; FileNotFoundError/CalledProcessError при неудаче."""
+    target = os.path.join(snapshot.path, 'pgdump')
+    cmd, env = _pg_command(
+        'pg_dump', '-F', 'd', '-j', str(jobs), '-Z', '6', '-b', '-f', target,
+        settings.DATABASES['default']['NAME'],
+    )
+    subprocess.run(cmd, env=env, check=True)
+
+    for name in sorted(os.listdir(target)):
+        snapshot.add_file(os.path.join(target, name))
+
+
+def load_manifest(path):
+    with open(os.path.join(path, MANIFEST), encoding='utf-8') as f:
+        return json.load(f)
+
+
+def verify(path, manifest):
+    """Имена файлов снимка с неверной контрольной суммой или отсутствующих."""
+    broken = []
+    for entry in manifest['files']:
+        file_path = os.path.join(path, entry['name'])
+        if not os.path.exists(file_path) or sha256(file_path) != entry['sha256']:
+            broken.append(entry['name'])
+    return broken
+
+
+def logical_files(manifest):
+    """Исходные файлы снимка -> упорядоченный список их частей."""
+    files = {}
+    for entry in manifest['files']:
+        name, _, part = entry['name'].rpartition('.part')
+        if not name or not part.isdigit():
+            name = entry['name']
+        files.setdefault(name, []).append(entry['name'])
+    return {name: sorted(parts) for name, parts in files.items()}
+
+
+class _Concatenated(io.RawIOBase):
+    """Последовательное чтение частей файла как одного потока."""
+
+    def __init__(self, paths):
+        self.files = iter(paths)
+        self.current = None
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while True:
+            if self.current is None:
+                path = next(self.files, None)
+                if path is None:
+                    return 0
+                self.current = open(path, 'rb')
+            read = self.current.readinto(buffer)
+            if read:
+                return read
+            self.current.close()
+            self.current = None
+
+
+def open_logical(path, parts):
+    return io.BufferedReader(_Concatenated([os.path.join(path, part) for part in parts]))
+
+
+def restore_rows(path, manifest, batch_size=5000, log=None):
+    """Загрузка NDJSON-снимка пачками bulk_create в порядке зависимостей таблиц.
+
+    Существующие строки обновляются (upsert по ключу таблицы), поэтому
+    инкременты накатываются поверх базового снимка.
+    """
+    files = logical_files(manifest)
+    counts = {}
+    for model in MODELS:
+        table = model._meta.db_table
+        names = sorted(name for name in files if name.startswith(f'{table}.') and name.endswith('.ndjson.gz'))
+        unique_fields = _conflict_fields(model)
+        update_fields = [
+            field.name for field in model._meta.concrete_fields
+            if not field.primary_key and field.name not in unique_fields
+        ]
+        loaded = 0
+
+        with transaction.atomic():
+            for name in names:
+                with gzip.open(open_logical(path, files[name]), 'rt', encoding='utf-8') as f:
+                    batch = []
+                    for line in f:
+                        batch.append(model(**json.loads(line)))
+                        if len(batch) >= batch_size:
+                            _upsert(model, batch, unique_fields, update_fields)
+                            loaded += len(batch)
+                            batch = []
+                    if batch:
+                        _upsert(model, batch, unique_fields, update_fields)
+                        loaded += len(batch)
+
+        counts[table] = loaded
+        if log:
+            log(f'{table}: {loaded}')
+
+    # Удаления инкремента — от зависимых таблиц к справочникам
+    deleted = manifest.get('deleted', {})
+    for model in reversed(MODELS):
+        ids = deleted.get(model._meta.db_table)
+        if ids:
+            removed = model.objects.filter(id__in=ids).delete()[1].get(model._meta.label, 0)
+            if log:
+                log(f'{model._meta.db_table}: удалено {removed}')
+
+    _reset_sequences()
+    return counts
+
+
+def _conflict_fields(model):
+    # Первичный ключ секционированной таблицы записей — (id, date_time), уникального
+    # индекса только по id нет (миграция 0008), и ON CONFLICT (id) не примется
+    if model is AppointmentBooking and connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            if partitions.is_partitioned(cursor):
+                return ['id', 'date_time']
+    return ['id']
+
+
+def _follow_moves(model, batch):
+    """Перенесенные на другое время записи сначала переносятся и в базе:
+    по ключу (id, date_time) они иначе вставились бы второй строкой с тем же id."""
+    # Из NDJSON время приходит строкой
+    to_python = model._meta.get_field('date_time').to_python
+    times = {obj.id: to_python(obj.date_time) for obj in batch}
+    for pk, dt in model.objects.filter(id__in=times).values_list('id', 'date_time'):
+        if dt != times[pk]:
+            model.objects.filter(id=pk).update(date_time=times[pk])
+
+
+def _upsert(model, batch, unique_fields, update_fields):
+    if unique_fields != ['id']:
+        _follow_moves(model, batch)
+    model.objects.bulk_create(
+        batch, update_conflicts=True, unique_fields=unique_fields, update_fields=update_fields,
+    )
+
+
+def _reset_sequences():
+    statements = connection.ops.sequence_reset_sql(no_style(), MODELS)
+    with connection.cursor() as cursor:
+        for sql in statements:
+            cursor.execute(sql)
+
+
+def restore_pg(path, manifest, jobs):
+    """pg_restore снимка в формате каталога (части файлов предварительно склеиваются)."""
+    target = os.path.join(path, 'pgdump.restore')
+    os.makedirs(target, exist_ok=True)
+    try:
+        for name, parts in logical_files(manifest).items():
+            if not name.startswith('pgdump' + os.sep):
+                continue
+            with open_logical(path, parts) as source, open(os.path.join(target, os.path.basename(name)), 'wb') as out:
+                shutil.copyfileobj(source, out)
+
+        cmd, env = _pg_command(
+            'pg_restore', '-j', str(jobs), '--clean', '--if-exists', '-d',
+            settings.DATABASES['default']['NAME'], target,
+        )
+        subprocess.run(cmd, env=env, check=True)
+    finally:
+        shutil.rmtree(target, ignore_errors=True)
+
+
+def prune(snapshots, delete, keep):
+    """Оставить keep последних полных снимков и инкременты после самого старого из них."""
+    full = [name for name in snapshots if not name.endswith('_incremental')]
+    if len(full) <= keep:
+        return []
+    oldest_kept = full[-keep]
+    removed = [name for name in snapshots if name < oldest_kept]
+    for name in removed:
+        delete(name)
+    return removed
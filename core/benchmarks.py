@@ -0,0 +1,341 @@
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import tempfile
+import time
+import tracemalloc
+from contextlib import ExitStack
+from datetime import date, datetime, timedelta
+from importlib import import_module
+
+from django.conf import settings
+from django.db import connection, connections, transaction
+from django.db.models import Max
+from django.http import HttpRequest
+from django.test import Client
+from django.urls import reverse
+
+from . import backups, principal, slots
+from .metrics import RequestStats
+from .models import (
+    User, Doctor, Patient, Diagnosis, Service, AppointmentBooking, Appointment, PerformedService, Prescription,
+)
+from .principal import ROLE_ADMIN
+
+# Набор замеров горячих путей приложения: время (p50/p95), число и время SQL,
+# пиковая память Python. Результат — JSON, который можно сравнить с прошлым
+# прогоном (compare()), чтобы увидеть регрессию между версиями.
+# Замеры идут через django.test.Client со всеми middleware, без сети.
+
+CASES = {}
+
+
+class Case:
+    def __init__(self, name, func, setup=None, repeat=None):
+        self.name = name
+        self.func = func
+        self.setup = setup
+        # Тяжелые замеры (полный бэкап) повторяются не больше repeat раз
+        self.repeat = repeat
+
+
+def case(name, setup=None, repeat=None):
+    def decorator(func):
+        CASES[name] = Case(name, func, setup, repeat)
+        return func
+    return decorator
+
+
+def _host():
+    for host in settings.ALLOWED_HOSTS:
+        if host and host != '*' and not host.startswith('.'):
+            return host
+    return 'localhost'
+
+
+def _client(user):
+    """Client с сессией пользователя, как после входа через login_view."""
+    client = Client(HTTP_HOST=_host())
+    request = HttpRequest()
+    request.session = import_module(settings.SESSION_ENGINE).SessionStore()
+    principal.login(request, user)
+    request.session.save()
+    client.cookies[settings.SESSION_COOKIE_NAME] = request.session.session_key
+    return client
+
+
+def _consume(response):
+    """Дочитывает ответ (в том числе потоковый) и возвращает его размер в байтах."""
+    if response.status_code >= 400:
+        raise RuntimeError(f'HTTP {response.status_code}')
+    try:
+        if response.streaming:
+            return sum(len(chunk) for chunk in response.streaming_content)
+        return len(response.content)
+    finally:
+        response.close()
+
+
+class Context:
+    """Пользователи и данные, на которых выполняются замеры."""
+
+    def __init__(self, doctor_id=None, export_rows=100000, report_days=30):
+        bookings = AppointmentBooking.objects.filter(doctor__user__isnull=False)
+        if doctor_id is not None:
+            bookings = bookings.filter(doctor_id=doctor_id)
+        # Врач последнего завершенного приема: у него есть и история, и будущие записи
+        latest = bookings.filter(status='Completed').order_by('-date_time').values('doctor_id').first()
+        if latest is None:
+            raise ValueError('Нет завершенных приемов у врача с учетной записью (см. generate_clinic).')
+        self.doctor = Doctor.objects.select_related('user').get(id=latest['doctor_id'])
+
+        pending = bookings.filter(doctor=self.doctor, status='Scheduled').order_by('-date_time').first()
+        if pending is None:
+            raise ValueError(f'У врача {self.doctor.id} нет записей со статусом Scheduled.')
+        self.pending_booking_id = pending.id
+        self.slot_day = pending.date_time.date()
+
+        patient = (AppointmentBooking.objects.filter(patient__user__isnull=False)
+                   .order_by('-date_time').values('patient_id').first())
+        admin = User.objects.filter(role_id=ROLE_ADMIN).first()
+        if patient is None or admin is None:
+            raise ValueError('Нужны пациент с учетной записью и записями и администратор.')
+        self.patient = Patient.objects.select_related('user').get(id=patient['patient_id'])
+
+        self.doctor_client = _client(self.doctor.user)
+        self.patient_client = _client(self.patient.user)
+        self.admin_client = _client(admin)
+
+        max_patient = Patient.objects.aggregate(m=Max('id'))['m'] or 0
+        self.export_after_id = max(0, max_patient - export_rows)
+        self.report_to = date.today()
+        self.report_from = self.report_to - timedelta(days=report_days)
+
+        self.diagnosis_id = Diagnosis.objects.values_list('id', flat=True).first()
+        self.service_ids = list(Service.objects.values_list('id', flat=True)[:3])
+
+    def describe(self):
+        return {
+            'doctor_id': self.doctor.id,
+            'patient_id': self.patient.id,
+            'pending_booking_id': self.pending_booking_id,
+            'slot_day': self.slot_day.isoformat(),
+            'export_after_id': self.export_after_id,
+            'report_from': self.report_from.isoformat(),
+            'report_to': self.report_to.isoformat(),
+        }
+
+
+def _slots_url(ctx):
+    return f"{reverse('ajax_slots')}?doctor_id={ctx.doctor.id}&date={ctx.slot_day.isoformat()}"
+
+
+@case('load_slots')
+def load_slots(ctx):
+    return _consume(ctx.patient_client.get(_slots_url(ctx)))
+
+
+@case('load_slots_cold', setup=lambda ctx: slots.invalidate(ctx.doctor.id, ctx.slot_day))
+def load_slots_cold(ctx):
+    return _consume(ctx.patient_client.get(_slots_url(ctx)))
+
+
+@case('dashboard_doctor')
+def dashboard_doctor(ctx):
+    return _consume(ctx.doctor_client.get(reverse('dashboard')))
+
+
+@case('dashboard_patient')
+def dashboard_patient(ctx):
+    return _consume(ctx.patient_client.get(reverse('dashboard')))
+
+
+@case('export_json')
+def export_json(ctx):
+    return _consume(ctx.admin_client.get(reverse('export_json'), {'after_id': ctx.export_after_id}))
+
+
+@case('export_ndjson')
+def export_ndjson(ctx):
+    return _consume(ctx.admin_client.get(
+        reverse('export_json'), {'after_id': ctx.export_after_id, 'format': 'ndjson'}
+    ))
+
+
+@case('export_csv')
+def export_csv(ctx):
+    return _consume(ctx.admin_client.get(reverse('export_csv'), {
+        'date_from': ctx.report_from.isoformat(), 'date_to': ctx.report_to.isoformat(),
+    }))
+
+
+@case('export_xlsx')
+def export_xlsx(ctx):
+    return _consume(ctx.doctor_client.get(reverse('export_doctor_xlsx'), {
+        'date_from': ctx.report_from.isoformat(), 'date_to': ctx.report_to.isoformat(),
+    }))
+
+
+@case('doctor_complete_form')
+def doctor_complete_form(ctx):
+    return _consume(ctx.doctor_client.get(reverse('doctor_complete', args=[ctx.pending_booking_id])))
+
+
+@case('doctor_complete')
+def doctor_complete(ctx):
+    data = {
+        'diagnosis': ctx.diagnosis_id,
+        'complaints': 'Замер производительности',
+        'services': ctx.service_ids,
+        'prescriptions': 'Парацетамол\nИбупрофен',
+    }
+    # Прием завершается и откатывается, чтобы каждый повтор работал с той же записью
+    with transaction.atomic():
+        response = ctx.doctor_client.post(reverse('doctor_complete', args=[ctx.pending_booking_id]), data)
+        transaction.set_rollback(True)
+    if response.status_code != 302:
+        raise RuntimeError(f'Форма не принята: HTTP {response.status_code}')
+    return _consume(response)
+
+
+def _dump(previous):
+    root = tempfile.mkdtemp(prefix='bench-backup-')
+    try:
+        snapshot = backups.Snapshot('bench', root=root)
+        counts = backups.dump_rows(snapshot, previous)
+        snapshot.finish(counts=counts)
+        return sum(entry['size'] for entry in snapshot.manifest['files'])
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+@case('backup_incremental')
+def backup_incremental(ctx):
+    # Как ежедневный инкремент: изменения за сутки после снимка с текущими водяными знаками
+    previous = {
+        'created_at': (datetime.now() - timedelta(days=1)).isoformat(),
+        'watermarks': backups.watermarks(),
+    }
+    return _dump(previous)
+
+
+@case('backup_full', repeat=1)
+def backup_full(ctx):
+    return _dump(None)
+
+
+def _measure_once(case, ctx):
+    if case.setup:
+        case.setup(ctx)
+    stats = RequestStats()
+    with ExitStack() as stack:
+        for alias in connections:
+            stack.enter_context(connections[alias].execute_wrapper(stats))
+        started = time.perf_counter()
+        size = case.func(ctx)
+        elapsed = time.perf_counter() - started
+    return elapsed, stats, size
+
+
+def _peak_memory(case, ctx):
+    # Отдельный прогон: tracemalloc замедляет код и исказил бы время
+    if case.setup:
+        case.setup(ctx)
+    tracemalloc.start()
+    try:
+        case.func(ctx)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def _percentile(values, share):
+    return values[min(len(values) - 1, int(len(values) * share))]
+
+
+def measure(case, ctx, repeat, warmup=1):
+    repeat = min(repeat, case.repeat or repeat)
+    for _ in range(warmup if case.repeat is None else 0):
+        case.func(ctx)
+
+    timings = []
+    queries = []
+    sql = []
+    size = 0
+    for _ in range(repeat):
+        elapsed, stats, size = _measure_once(case, ctx)
+        timings.append(elapsed * 1000)
+        queries.append(stats.queries)
+        sql.append(stats.sql_seconds * 1000)
+    timings.sort()
+
+    return {
+        'runs': repeat,
+        'p50_ms': round(statistics.median(timings), 3),
+        'p95_ms': round(_percentile(timings, 0.95), 3),
+        'min_ms': round(timings[0], 3),
+        'max_ms': round(timings[-1], 3),
+        'queries': max(queries),
+        'sql_ms': round(statistics.median(sql), 3),
+        'peak_kb': round(_peak_memory(case, ctx) / 1024, 1) if case.repeat is None else None,
+        'bytes': size,
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=settings.BASE_DIR,
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def dataset():
+    models = (Doctor, Patient, AppointmentBooking, Appointment, PerformedService, Prescription)
+    return {model._meta.db_table: model.objects.count() for model in models}
+
+
+def run(names, ctx, repeat, on_result=None):
+    results = {}
+    for name in names:
+        results[name] = measure(CASES[name], ctx, repeat)
+        if on_result:
+            on_result(name, results[name])
+    return {
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'revision': git_revision(),
+        'database': connection.vendor,
+        'dataset': dataset(),
+        'context': ctx.describe(),
+        'repeat': repeat,
+        'cases': results,
+    }
+
+
+def save(report, path):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+
+
+def load(path):
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def compare(baseline, current, threshold=0.1):
+    """[(имя, p50 было, p50 стало, изменение, запросов было, стало, регрессия)] по общим замерам."""
+    rows = []
+    for name, result in current['cases'].items():
+        before = baseline['cases'].get(name)
+        if before is None:
+            continue
+        change = (result['p50_ms'] - before['p50_ms']) / before['p50_ms'] if before['p50_ms'] else 0.0
+        regression = change > threshold or result['queries'] > before['queries']
+        rows.append((name, before['p50_ms'], result['p50_ms'], change,
+                     before['queries'], result['queries'], regression))
+    return rows
@@ -0,0 +1,53 @@
+from django.db import connection, transaction, IntegrityError
+
+from .models import AppointmentBooking
+from .schedule import bookable, get_calendar
+
+
+class BookingError(Exception):
+    pass
+
+
+class SlotUnavailable(BookingError):
+    """Время не входит в график врача."""
+
+
+class SlotTaken(BookingError):
+    """Время уже занято другой записью."""
+
+
+def _lock_slot(doctor_id, dt):
+    # Транзакционная advisory-блокировка на пару (врач, минута): конкурирующие
+    # записи на один слот выстраиваются в очередь, а не падают на уникальном индексе.
+    if connection.vendor == 'postgresql':
+        minute = int(dt.timestamp()) // 60
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_advisory_xact_lock(%s, %s)', [doctor_id, minute])
+
+
+def book_slot(patient, doctor_id, dt):
+    calendar = get_calendar()
+    minute = dt.hour * 60 + dt.minute
+    if not bookable(dt.date()) or doctor_id not in calendar.doctor_offices or dt.second or dt.microsecond:
+        raise SlotUnavailable(dt)
+    if minute not in {start for start, step in calendar.slot_starts(doctor_id, dt.date())}:
+        raise SlotUnavailable(dt)
+
+    try:
+        with transaction.atomic():
+            _lock_slot(doctor_id, dt)
+            taken = AppointmentBooking.objects.filter(
+                doctor_id=doctor_id, date_time=dt
+            ).exclude(status='Canceled').exists()
+            if taken:
+                raise SlotTaken(dt)
+
+            return AppointmentBooking.objects.create(
+                patient=patient,
+                doctor_id=doctor_id,
+                date_time=dt,
+                status='Scheduled'
+            )
+    except IntegrityError:
+        # Уникальный частичный индекс appointment_bookings_active_slot_uniq
+        raise SlotTaken(dt)
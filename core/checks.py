@@ -0,0 +1,16 @@
+from django.conf import settings
+from django.core.checks import Warning, register, Tags
+
+
+@register(Tags.caches, deploy=True)
+def check_shared_cache(app_configs, **kwargs):
+    # Индекс слотов и версии кэшей (core.versioning) сбрасываются в том воркере,
+    # где прошла запись; с LocMemCache остальные воркеры отдают устаревшие данные
+    backend = settings.CACHES.get('default', {}).get('BACKEND', '')
+    if backend.endswith('LocMemCache'):
+        return [Warning(
+            'Кэш по умолчанию — LocMemCache, он не общий для процессов.',
+            hint='Задайте CACHE_BACKEND и CACHE_LOCATION (например, Redis) для нескольких воркеров.',
+            id='core.W001',
+        )]
+    return []
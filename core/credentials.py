@@ -0,0 +1,117 @@
+import ipaddress
+import threading
+import time
+
+from django.conf import settings
+from django.contrib.auth.hashers import check_password, identify_hasher, make_password
+from django.utils.crypto import constant_time_compare
+
+from .models import User
+
+# Проверка логина и пароля. Пароли хранятся хешами (PASSWORD_HASHERS);
+# строки со старым открытым паролем распознаются по отсутствию известного
+# алгоритма и перехешируются при первом успешном входе.
+
+
+def is_hashed(value):
+    try:
+        identify_hasher(value)
+    except ValueError:
+        return False
+    return True
+
+
+def _store(user, password):
+    user.password = make_password(password)
+    user.save(update_fields=['password'])
+
+
+def authenticate(login, password):
+    """Пользователь при верных логине и пароле, иначе None."""
+    user = User.objects.select_related('patient', 'doctor').filter(login=login).first()
+    if user is None:
+        # Тратим столько же времени, сколько на проверку хеша, чтобы не выдавать существование логина
+        make_password(password)
+        return None
+
+    if not is_hashed(user.password):
+        if not constant_time_compare(user.password, password):
+            return None
+        _store(user, password)
+        return user
+
+    if check_password(password, user.password, setter=lambda raw: _store(user, raw)):
+        return user
+    return None
+
+
+class TokenBucket:
+    """Ведро токенов в памяти процесса: capacity попыток, пополнение rate токенов в секунду."""
+
+    MAX_KEYS = 10000
+
+    def __init__(self, capacity, rate):
+        self.capacity = capacity
+        self.rate = rate
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def allow(self, key):
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (self.capacity, now))
+            tokens = min(self.capacity, tokens + (now - updated) * self.rate)
+            allowed = tokens >= 1
+            self._buckets[key] = (tokens - 1 if allowed else tokens, now)
+            if len(self._buckets) > self.MAX_KEYS:
+                self._prune(now)
+        return allowed
+
+    def _prune(self, now):
+        # Полные ведра ничем не отличаются от отсутствующих
+        full = [key for key, (tokens, updated) in self._buckets.items()
+                if tokens + (now - updated) * self.rate >= self.capacity]
+        for key in full:
+            del self._buckets[key]
+
+
+def _bucket(setting, default):
+    attempts, period = getattr(settings, setting, default)
+    return TokenBucket(attempts, attempts / period)
+
+
+# Основное ограничение — по логину: перебор пароля к одной учетной записи.
+# Лимит по адресу отдельный и заметно больше: за одним адресом (NAT клиники,
+# прокси) входит много разных пользователей.
+login_limiter = _bucket('LOGIN_RATE_LIMIT', (10, 60))
+ip_limiter = _bucket('LOGIN_IP_RATE_LIMIT', (100, 60))
+
+
+def _trusted(address, networks):
+    try:
+        return any(ipaddress.ip_address(address) in network for network in networks)
+    except ValueError:
+        return False
+
+
+def client_address(request):
+    """Адрес клиента. X-Forwarded-For учитывается, только если запрос пришел от
+    доверенного прокси (TRUSTED_PROXIES): берется ближайший к нам недоверенный адрес,
+    подставленные клиентом значения левее него игнорируются."""
+    address = request.META.get('REMOTE_ADDR', '')
+    networks = [ipaddress.ip_network(value, strict=False) for value in getattr(settings, 'TRUSTED_PROXIES', ())]
+    if not networks or not _trusted(address, networks):
+        return address
+    forwarded = [value.strip() for value in request.META.get('HTTP_X_FORWARDED_FOR', '').split(',') if value.strip()]
+    for hop in reversed(forwarded):
+        if not _trusted(hop, networks):
+            return hop
+    return forwarded[0] if forwarded else address
+
+
+def login_allowed(request, login):
+    # Токен по логину списывается и при исчерпанном лимите адреса: иначе перебор
+    # одной учетной записи с разных адресов обходил бы ограничение по логину
+    by_login = login_limiter.allow(f'login:{login.lower()}')
+    by_address = ip_limiter.allow(f'ip:{client_address(request)}')
+    return by_login and by_address
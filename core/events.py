@@ -0,0 +1,112 @@
+import asyncio
+import json
+import logging
+import threading
+
+from django.conf import settings
+from django.db import connection
+
+# События занятости слотов для страницы записи (Server-Sent Events, см. views.slot_events).
+# Сигналы записей (core.signals) после коммита публикуют «занят»/«освобожден»
+# для (врач, день). В PostgreSQL событие уходит через NOTIFY и доходит до всех
+# ASGI-воркеров, каждый слушает канал одним соединением (LISTEN); на других
+# базах рассылается только подписчикам этого процесса.
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = 'slot_events'
+TAKEN = 'taken'
+RELEASED = 'released'
+# После переподключения к БД события могли потеряться: клиенты перечитывают слоты
+RESYNC = 'resync'
+
+
+def _uses_notify():
+    return connection.vendor == 'postgresql'
+
+
+class Subscription:
+    def __init__(self, key, loop):
+        self.key = key
+        self.loop = loop
+        self.queue = asyncio.Queue()
+
+
+class Broker:
+    """Подписчики этого процесса по (врач, день ISO)."""
+
+    def __init__(self):
+        self._subscribers = {}
+        self._lock = threading.Lock()
+        self._listener = None
+
+    def subscribe(self, doctor_id, day):
+        subscription = Subscription((doctor_id, day.isoformat()), asyncio.get_running_loop())
+        with self._lock:
+            self._subscribers.setdefault(subscription.key, set()).add(subscription)
+        if _uses_notify() and (self._listener is None or self._listener.done()):
+            self._listener = subscription.loop.create_task(self._listen())
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.key)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[subscription.key]
+
+    def dispatch(self, event):
+        # Вызывается из любого потока: очереди принадлежат циклам событий подписчиков
+        with self._lock:
+            if event['event'] == RESYNC:
+                targets = [s for subscribers in self._subscribers.values() for s in subscribers]
+            else:
+                targets = list(self._subscribers.get((event['doctor_id'], event['date']), ()))
+        for subscription in targets:
+            subscription.loop.call_soon_threadsafe(subscription.queue.put_nowait, event)
+
+    async def _listen(self):
+        import psycopg
+
+        db = settings.DATABASES['default']
+        params = {
+            'dbname': db['NAME'], 'user': db.get('USER'), 'password': db.get('PASSWORD'),
+            'host': db.get('HOST') or None, 'port': db.get('PORT') or None,
+        }
+        delay = 1
+        connected_before = False
+        while True:
+            try:
+                async with await psycopg.AsyncConnection.connect(autocommit=True, **params) as conn:
+                    await conn.execute(f'LISTEN {CHANNEL}')
+                    if connected_before:
+                        self.dispatch({'event': RESYNC})
+                    connected_before = True
+                    delay = 1
+                    async for notify in conn.notifies():
+                        self.dispatch(json.loads(notify.payload))
+            except (psycopg.Error, OSError) as exc:
+                logger.warning('LISTEN %s: %s, повтор через %d с', CHANNEL, exc, delay)
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 30)
+
+
+broker = Broker()
+
+
+def publish(doctor_id, dt, kind):
+    """Событие слота; вызывать после коммита (transaction.on_commit).
+
+    Сбой рассылки только пишется в лог: запись уже сохранена, а страницы
+    перечитают слоты при следующей смене даты или врача.
+    """
+    event = {'event': kind, 'doctor_id': doctor_id, 'date': dt.date().isoformat(), 'time': f'{dt:%H:%M}'}
+    try:
+        if _uses_notify():
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT pg_notify(%s, %s)', [CHANNEL, json.dumps(event)])
+        else:
+            broker.dispatch(event)
+    except Exception:
+        logger.exception('Событие слота %s не отправлено', event)
@@ -0,0 +1,254 @@
+import csv
+import re
+from datetime import datetime, time, timedelta
+
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Font, Alignment
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connections
+from django.db.models import Max
+from django.db.models.functions import Length
+
+from .models import AppointmentBooking, Patient
+from .routers import read_db
+
+# Выгрузки формируются генераторами: строки читаются из БД пачками
+# (серверный курсор), а клиенту уходят буферы фиксированного размера.
+# Генераторы дочитываются уже после выхода из представления, поэтому БД
+# для чтения (реплика под use_replica) фиксируется при их создании.
+
+CHUNK_SIZE = 2000
+BUFFER_SIZE = 64 * 1024
+
+PATIENT_FIELDS = ('id', 'full_name', 'phone', 'med_card_number', 'birth_date')
+
+_encoder = DjangoJSONEncoder(ensure_ascii=False)
+
+
+def _buffered(parts, size=BUFFER_SIZE):
+    buffer = []
+    length = 0
+    for part in parts:
+        buffer.append(part)
+        length += len(part)
+        if length >= size:
+            yield ''.join(buffer).encode('utf-8')
+            buffer = []
+            length = 0
+    if buffer:
+        yield ''.join(buffer).encode('utf-8')
+
+
+def iter_json_array(rows):
+    def parts():
+        yield '['
+        separator = ''
+        for row in rows:
+            yield separator
+            yield _encoder.encode(row)
+            separator = ',\n'
+        yield ']'
+    return _buffered(parts())
+
+
+def iter_ndjson(rows):
+    return _buffered(_encoder.encode(row) + '\n' for row in rows)
+
+
+def _counting(rows, progress, every=CHUNK_SIZE):
+    """Пробрасывает строки, сообщая progress(n) о числе обработанных каждые every строк."""
+    done = 0
+    for done, row in enumerate(rows, 1):
+        yield row
+        if done % every == 0:
+            progress(done)
+    progress(done)
+
+
+def patient_filters(params):
+    """Фильтры инкрементальной выгрузки из GET-параметров; ValueError при неверных значениях."""
+    filters = {}
+    if params.get('after_id'):
+        filters['after_id'] = int(params['after_id'])
+    if params.get('updated_since'):
+        filters['updated_since'] = datetime.fromisoformat(params['updated_since'])
+    return filters
+
+
+def patients_queryset(after_id=None, updated_since=None, ids=None, fields=PATIENT_FIELDS):
+    queryset = Patient.objects.order_by('id')
+    if ids is not None:
+        queryset = queryset.filter(id__in=ids)
+    if after_id is not None:
+        queryset = queryset.filter(id__gt=after_id)
+    if updated_since is not None:
+        queryset = queryset.filter(updated_at__gte=updated_since)
+    return queryset.values(*fields)
+
+
+def iter_patients(fmt='json', progress=None, **filters):
+    rows = patients_queryset(**filters).using(read_db()).iterator(chunk_size=CHUNK_SIZE)
+    if progress:
+        rows = _counting(rows, progress)
+    return iter_ndjson(rows) if fmt == 'ndjson' else iter_json_array(rows)
+
+
+class _Echo:
+    """Псевдо-файл для csv.writer: возвращает строку вместо записи."""
+
+    def write(self, value):
+        return value
+
+
+def _parse_date(value):
+    return datetime.strptime(value, '%Y-%m-%d').date() if value else None
+
+
+def report_filters(params):
+    """Период и специализация отчета из GET-параметров; ValueError при неверных значениях."""
+    specialization = params.get('specialization')
+    return {
+        'date_from': _parse_date(params.get('date_from')),
+        'date_to': _parse_date(params.get('date_to')),
+        'specialization_id': int(specialization) if specialization else None,
+    }
+
+
+def _server_side_rows(sql, params, using='default'):
+    # chunked_cursor() в PostgreSQL открывает именованный (серверный) курсор
+    with connections[using].chunked_cursor() as cursor:
+        cursor.execute(sql, params)
+        while True:
+            rows = cursor.fetchmany(CHUNK_SIZE)
+            if not rows:
+                break
+            yield from rows
+
+
+def doctors_report_rows(date_from=None, date_to=None, specialization_id=None):
+    # Отчет читает предрасчитанную doctor_daily_stats (см. core.stats).
+    # Условия на статистику стоят в LEFT JOIN, чтобы врачи без приемов
+    # оставались в отчете с нулем.
+    join_conditions = ["st.status = 'Completed'"]
+    params = []
+    if date_from:
+        join_conditions.append('st.day >= %s')
+        params.append(date_from)
+    if date_to:
+        join_conditions.append('st.day <= %s')
+        params.append(date_to)
+
+    where = ''
+    if specialization_id:
+        where = 'WHERE d.specialization_id = %s'
+        params.append(specialization_id)
+
+    sql = f"""
+        SELECT d.full_name, s.name, o.number,
+               COALESCE(SUM(st.visit_count), 0) as visit_count,
+               COALESCE(SUM(st.revenue), 0) as revenue
+        FROM clinic.doctors d
+        JOIN clinic.specializations s ON d.specialization_id = s.id
+        LEFT JOIN clinic.offices o ON d.office_id = o.id
+        LEFT JOIN clinic.doctor_daily_stats st
+            ON d.id = st.doctor_id AND {' AND '.join(join_conditions)}
+        {where}
+        GROUP BY d.id, d.full_name, s.name, o.number
+        ORDER BY visit_count DESC
+    """
+    return _server_side_rows(sql, params, read_db())
+
+
+def iter_doctors_report_csv(progress=None, **filters):
+    writer = csv.writer(_Echo(), delimiter=';')
+    rows = doctors_report_rows(**filters)
+    if progress:
+        rows = _counting(rows, progress)
+
+    def parts():
+        yield '\ufeff'
+        yield writer.writerow(['ФИО Врача', 'Специализация', 'Кабинет', 'Количество приемов', 'Выручка'])
+        for row in rows:
+            yield writer.writerow(row)
+    return _buffered(parts())
+
+
+SCHEDULE_HEADERS = ['Дата и Время', 'Пациент', 'Телефон', 'Статус', 'Жалобы (если есть)']
+SCHEDULE_STATUS = 'Ожидает приема'
+
+
+def schedule_filters(params):
+    """Период выгрузки расписания из GET-параметров; ValueError при неверных значениях."""
+    return {
+        'date_from': _parse_date(params.get('date_from')),
+        'date_to': _parse_date(params.get('date_to')),
+    }
+
+
+def schedule_queryset(doctor, date_from=None, date_to=None):
+    queryset = AppointmentBooking.objects.filter(doctor=doctor, status='Scheduled')
+    if date_from:
+        queryset = queryset.filter(date_time__gte=datetime.combine(date_from, time.min))
+    if date_to:
+        queryset = queryset.filter(date_time__lt=datetime.combine(date_to + timedelta(days=1), time.min))
+    return queryset.order_by('date_time')
+
+
+def _schedule_widths(queryset):
+    # Ширины колонок считаются агрегатом в БД: в write-only режиме их нужно
+    # задать до первой строки, а второй проход по ячейкам невозможен.
+    lengths = queryset.aggregate(
+        name_len=Max(Length('patient__full_name')),
+        phone_len=Max(Length('patient__phone')),
+        complaints_len=Max(Length('appointment__complaints')),
+    )
+    columns = [16, lengths['name_len'], lengths['phone_len'], len(SCHEDULE_STATUS), lengths['complaints_len']]
+    return [max(len(header), length or 1) + 5 for header, length in zip(SCHEDULE_HEADERS, columns)]
+
+
+def _sheet_title(doctor, used):
+    title = re.sub(r'[\\/*?:\[\]]', '', doctor.full_name)[:24].strip() or 'Врач'
+    title = f'{title} {doctor.id}'
+    while title in used:
+        title += '_'
+    used.add(title)
+    return title
+
+
+def write_schedule_xlsx(fileobj, doctors, date_from=None, date_to=None, progress=None):
+    wb = Workbook(write_only=True)
+    used_titles = set()
+
+    for number, doctor in enumerate(doctors, 1):
+        title = 'План приемов' if len(doctors) == 1 else _sheet_title(doctor, used_titles)
+        ws = wb.create_sheet(title=title)
+        queryset = schedule_queryset(doctor, date_from, date_to)
+
+        for column, width in enumerate(_schedule_widths(queryset)):
+            ws.column_dimensions[chr(ord('A') + column)].width = width
+
+        header = []
+        for value in SCHEDULE_HEADERS:
+            cell = WriteOnlyCell(ws, value=value)
+            cell.font = Font(bold=True)
+            cell.alignment = Alignment(horizontal='center')
+            header.append(cell)
+        ws.append(header)
+
+        rows = queryset.values_list(
+            'date_time', 'patient__full_name', 'patient__phone', 'appointment__complaints'
+        ).iterator(chunk_size=CHUNK_SIZE)
+        for date_time, full_name, phone, complaints in rows:
+            ws.append([
+                date_time.strftime('%d.%m.%Y %H:%M'),
+                full_name,
+                phone,
+                SCHEDULE_STATUS,
+                complaints or '-',
+            ])
+
+        if progress:
+            progress(number)
+
+    wb.save(fileobj)
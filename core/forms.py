@@ -1,19 +1,132 @@
+from datetime import date, timedelta
+
 from django import forms
 from django.core.exceptions import ValidationError
+from django.urls import reverse
+from django.forms.models import ModelChoiceIteratorValue
+from django.utils.choices import BaseChoiceIterator
 from .models import Specialization, Doctor, AppointmentBooking, Diagnosis, Service, Appointment
+from . import refcache, schedule
+from .visits import Visit
+
+
+class CachedChoiceIterator(BaseChoiceIterator):
+    """Варианты выбора из закэшированного справочника вместо запроса к queryset."""
+
+    def __init__(self, field):
+        self.field = field
+
+    def __iter__(self):
+        if self.field.empty_label is not None:
+            yield ('', self.field.empty_label)
+        for row in refcache.get(self.field.table).rows:
+            yield (ModelChoiceIteratorValue(row.pk, row), self.field.label_from_instance(row))
+
+    def __len__(self):
+        return len(refcache.get(self.field.table).rows) + (self.field.empty_label is not None)
+
+    def __bool__(self):
+        return self.field.empty_label is not None or bool(refcache.get(self.field.table).rows)
+
+
+class AutocompleteMixin:
+    """Выводит в <select> только выбранные значения; остальные подгружаются поиском (core.lookup)."""
+
+    def __init__(self, url, attrs=None):
+        self.url = url
+        super().__init__(attrs)
+
+    def get_context(self, name, value, attrs):
+        context = super().get_context(name, value, attrs)
+        context['widget']['attrs']['data-autocomplete-url'] = reverse(self.url)
+        return context
+
+    def optgroups(self, name, value, attrs=None):
+        field = self.choices.field
+        table = refcache.get(field.table)
+        groups = []
+        for index, pk in enumerate(v for v in value if v):
+            row = table.get(pk)
+            if row is not None:
+                option = self.create_option(name, row.pk, field.label_from_instance(row), True, index, attrs=attrs)
+                groups.append((None, [option], index))
+        return groups
+
+
+class AutocompleteSelect(AutocompleteMixin, forms.Select):
+    pass
+
+
+class AutocompleteSelectMultiple(AutocompleteMixin, forms.SelectMultiple):
+    pass
+
+
+class CachedModelChoiceField(forms.ModelChoiceField):
+    """ModelChoiceField, который строит варианты и проверяет значение по refcache."""
+
+    iterator = CachedChoiceIterator
+
+    def __init__(self, table, queryset, **kwargs):
+        self.table = table
+        super().__init__(queryset, **kwargs)
+
+    def _get_choices(self):
+        return self.iterator(self)
+
+    choices = property(_get_choices, forms.ChoiceField.choices.fset)
+
+    def to_python(self, value):
+        if value in self.empty_values:
+            return None
+        row = refcache.get(self.table).get(value)
+        if row is None:
+            raise ValidationError(self.error_messages['invalid_choice'], code='invalid_choice')
+        return row
+
+
+class CachedModelMultipleChoiceField(forms.ModelMultipleChoiceField):
+    iterator = CachedChoiceIterator
+
+    def __init__(self, table, queryset, **kwargs):
+        self.table = table
+        super().__init__(queryset, **kwargs)
+
+    def _get_choices(self):
+        return self.iterator(self)
+
+    choices = property(_get_choices, forms.ChoiceField.choices.fset)
+
+    def _check_values(self, value):
+        try:
+            value = frozenset(value)
+        except TypeError:
+            raise ValidationError(self.error_messages['invalid_list'], code='invalid_list')
+        table = refcache.get(self.table)
+        rows = []
+        for pk in value:
+            row = table.get(pk)
+            if row is None:
+                raise ValidationError(
+                    self.error_messages['invalid_choice'], code='invalid_choice', params={'value': pk}
+                )
+            rows.append(row)
+        return rows
+
 
 class LoginForm(forms.Form):
     login = forms.CharField(label='Логин', max_length=100, widget=forms.TextInput(attrs={'class': 'form-control'}))
     password = forms.CharField(label='Пароль', widget=forms.PasswordInput(attrs={'class': 'form-control'}))
 
 class BookingForm(forms.ModelForm):
-    specialization = forms.ModelChoiceField(
+    specialization = CachedModelChoiceField(
+        'specializations',
         queryset=Specialization.objects.all(),
         label="1. Выберите специализацию",
         required=False,
         widget=forms.Select(attrs={'class': 'form-select', 'id': 'id_specialization'})
     )
-    doctor = forms.ModelChoiceField(
+    doctor = CachedModelChoiceField(
+        'doctors',
         queryset=Doctor.objects.all(),
         label="2. Выберите врача",
         widget=forms.Select(attrs={'class': 'form-select', 'id': 'id_doctor'})
@@ -28,22 +141,64 @@ class BookingForm(forms.ModelForm):
         model = AppointmentBooking
         fields = ['specialization', 'doctor', 'date_time']
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Календарь ограничен окном записи, для которого загружаются рабочие дни врача
+        today = date.today()
+        self.fields['date'].widget.attrs.update({
+            'min': today.isoformat(),
+            'max': (today + timedelta(days=schedule.horizon_days() - 1)).isoformat(),
+        })
+
 class DoctorCompleteForm(forms.ModelForm):
-    diagnosis = forms.ModelChoiceField(
+    diagnosis = CachedModelChoiceField(
+        'diagnoses',
         queryset=Diagnosis.objects.all(),
         label="Поставить диагноз",
-        widget=forms.Select(attrs={'class': 'form-select'})
+        widget=AutocompleteSelect('ajax_diagnoses', attrs={'class': 'form-select'})
     )
     complaints = forms.CharField(
         label="Жалобы",
         widget=forms.Textarea(attrs={'class': 'form-control', 'rows': 3})
     )
-    services = forms.ModelMultipleChoiceField(
+    services = CachedModelMultipleChoiceField(
+        'services',
         queryset=Service.objects.all(),
         label="Оказанные услуги",
-        widget=forms.SelectMultiple(attrs={'class': 'form-select', 'style': 'height: 150px'})
+        widget=AutocompleteSelectMultiple('ajax_services', attrs={'class': 'form-select', 'style': 'height: 150px'})
+    )
+    prescriptions = forms.CharField(
+        label="Назначения",
+        required=False,
+        widget=forms.Textarea(attrs={'class': 'form-control', 'rows': 3})
     )
 
     class Meta:
         model = Appointment
-        fields = ['diagnosis', 'complaints', 'services']
\ No newline at end of file
+        fields = ['diagnosis', 'complaints', 'services']
+
+    def clean(self):
+        cleaned_data = super().clean()
+        # Количество по каждой услуге приходит отдельным полем count_<id>
+        counts = {}
+        for service in cleaned_data.get('services') or []:
+            try:
+                counts[service.pk] = int(self.data.get(f'count_{service.pk}') or 1)
+            except ValueError:
+                counts[service.pk] = 0
+            if counts[service.pk] < 1:
+                self.add_error('services', f'Неверное количество для услуги «{service.name}»')
+        cleaned_data['service_counts'] = counts
+        cleaned_data['prescription_list'] = [
+            line.strip()[:200] for line in cleaned_data.get('prescriptions', '').splitlines() if line.strip()
+        ]
+        return cleaned_data
+
+    def visit(self, booking_id):
+        return Visit(
+            booking_id,
+            complaints=self.cleaned_data['complaints'],
+            diagnosis_id=self.cleaned_data['diagnosis'].pk,
+            services=self.cleaned_data['service_counts'],
+            prescriptions=self.cleaned_data['prescription_list'],
+        )
\ No newline at end of file
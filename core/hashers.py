@@ -0,0 +1,12 @@
+from django.conf import settings
+from django.contrib.auth.hashers import PBKDF2PasswordHasher
+
+
+class ClinicPBKDF2PasswordHasher(PBKDF2PasswordHasher):
+    """PBKDF2 с числом итераций из настроек (PASSWORD_PBKDF2_ITERATIONS).
+
+    При смене числа итераций must_update() срабатывает при следующем входе
+    и хеш пересчитывается с новой стоимостью.
+    """
+
+    iterations = getattr(settings, 'PASSWORD_PBKDF2_ITERATIONS', PBKDF2PasswordHasher.iterations)
@@ -0,0 +1,213 @@
+import hashlib
+import json
+import os
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+
+from . import exports
+from .models import Doctor, ExportJob
+from .principal import ROLE_ADMIN, ROLE_DOCTOR
+from .routers import use_replica
+
+# Фоновые выгрузки: задание ставится в очередь (таблица export_jobs),
+# команда export_worker выполняет его в пуле процессов и кладет файл в EXPORT_ROOT.
+# Одинаковые задания в пределах EXPORT_CACHE_TTL отдаются из готового файла.
+
+
+def _write_chunks(path, chunks):
+    with open(path, 'wb') as f:
+        for chunk in chunks:
+            f.write(chunk)
+
+
+def _run_patients(path, params, progress):
+    filters = exports.patient_filters(params)
+    fields = exports.PATIENT_FIELDS
+    if params.get('ids') is not None:
+        filters['ids'] = params['ids']
+    if params.get('address'):
+        fields += ('address',)
+
+    progress(0, exports.patients_queryset(**filters).count())
+    chunks = exports.iter_patients(params.get('format', 'json'), progress=progress, fields=fields, **filters)
+    _write_chunks(path, chunks)
+
+
+def _run_doctors_report(path, params, progress):
+    _write_chunks(path, exports.iter_doctors_report_csv(progress=progress, **exports.report_filters(params)))
+
+
+def _run_schedule(path, params, progress):
+    doctors = list(Doctor.objects.filter(id__in=params['doctors']).order_by('full_name'))
+    progress(0, len(doctors))
+    with open(path, 'wb') as f:
+        exports.write_schedule_xlsx(f, doctors, progress=progress, **exports.schedule_filters(params))
+
+
+KINDS = {
+    'patients': {
+        'run': _run_patients,
+        'extension': lambda params: 'ndjson' if params.get('format') == 'ndjson' else 'json',
+        'content_type': 'application/json',
+        # Персональные данные пациентов — только администратор
+        'roles': (ROLE_ADMIN,),
+    },
+    'doctors_report': {
+        'run': _run_doctors_report,
+        'extension': lambda params: 'csv',
+        'content_type': 'text/csv',
+        'roles': (ROLE_ADMIN,),
+    },
+    'schedule': {
+        'run': _run_schedule,
+        'extension': lambda params: 'xlsx',
+        'content_type': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+        'roles': (ROLE_ADMIN, ROLE_DOCTOR),
+    },
+}
+
+
+def export_root():
+    root = str(getattr(settings, 'EXPORT_ROOT', 'exports'))
+    os.makedirs(root, exist_ok=True)
+    return root
+
+
+def _ttl():
+    return timedelta(seconds=getattr(settings, 'EXPORT_CACHE_TTL', 3600))
+
+
+def _timeout():
+    return timedelta(seconds=getattr(settings, 'EXPORT_JOB_TIMEOUT', 2 * 3600))
+
+
+def artifact_path(job):
+    return os.path.join(export_root(), job.file_path) if job.file_path else None
+
+
+def params_hash(kind, params):
+    payload = json.dumps([kind, params], sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def enqueue(kind, params, user_id=None):
+    if kind not in KINDS:
+        raise ValueError(kind)
+
+    digest = params_hash(kind, params)
+    job = (
+        ExportJob.objects
+        .filter(params_hash=digest)
+        .filter(
+            Q(status=ExportJob.STATUS_PENDING)
+            | Q(status=ExportJob.STATUS_RUNNING, started_at__gte=datetime.now() - _timeout())
+            | Q(status=ExportJob.STATUS_DONE, finished_at__gte=datetime.now() - _ttl())
+        )
+        .order_by('-created_at')
+        .first()
+    )
+    if job and (job.status != ExportJob.STATUS_DONE or os.path.exists(artifact_path(job))):
+        return job
+
+    return ExportJob.objects.create(kind=kind, params=params, params_hash=digest, requested_by_id=user_id)
+
+
+def claim(limit):
+    """Забрать до limit заданий из очереди; параллельные воркеры не получат одни и те же."""
+    with transaction.atomic():
+        ids = list(
+            ExportJob.objects
+            .select_for_update(skip_locked=True)
+            .filter(status=ExportJob.STATUS_PENDING)
+            .order_by('created_at')
+            .values_list('id', flat=True)[:limit]
+        )
+        ExportJob.objects.filter(id__in=ids).update(status=ExportJob.STATUS_RUNNING, started_at=datetime.now())
+    return ids
+
+
+def requeue_stale():
+    """Вернуть в очередь задания, зависшие в RUNNING дольше EXPORT_JOB_TIMEOUT (упавший воркер)."""
+    return ExportJob.objects.filter(
+        status=ExportJob.STATUS_RUNNING, started_at__lt=datetime.now() - _timeout()
+    ).update(status=ExportJob.STATUS_PENDING, started_at=None, progress=0)
+
+
+def run(job_id):
+    job = ExportJob.objects.get(id=job_id)
+    kind = KINDS[job.kind]
+    relative = f"{job.id}_{job.kind}.{kind['extension'](job.params)}"
+    path = os.path.join(export_root(), relative)
+
+    def progress(done, total=None):
+        fields = {'progress': done}
+        if total is not None:
+            fields['total'] = total
+        ExportJob.objects.filter(id=job.id).update(**fields)
+
+    try:
+        with use_replica():
+            kind['run'](path + '.part', job.params, progress)
+        os.replace(path + '.part', path)
+    except Exception as exc:
+        if os.path.exists(path + '.part'):
+            os.remove(path + '.part')
+        ExportJob.objects.filter(id=job.id).update(
+            status=ExportJob.STATUS_FAILED, error=repr(exc), finished_at=datetime.now()
+        )
+        return False
+
+    ExportJob.objects.filter(id=job.id).update(
+        status=ExportJob.STATUS_DONE, file_path=relative, finished_at=datetime.now()
+    )
+    return True
+
+
+def prune():
+    """Удалить задания и файлы старше срока кэширования."""
+    expired = ExportJob.objects.filter(
+        status__in=[ExportJob.STATUS_DONE, ExportJob.STATUS_FAILED],
+        finished_at__lt=datetime.now() - _ttl(),
+    )
+    removed = 0
+    for job in expired.iterator():
+        path = artifact_path(job)
+        if path and os.path.exists(path):
+            os.remove(path)
+        removed += 1
+    expired.delete()
+    return removed
+
+
+def can_create(kind, principal=None, is_staff=False):
+    if kind not in KINDS:
+        return False
+    if is_staff:
+        return True
+    return principal is not None and principal.role_id in KINDS[kind]['roles']
+
+
+def can_access(job, principal=None, is_staff=False):
+    if is_staff or (principal and principal.is_admin):
+        return True
+    if not can_create(job.kind, principal):
+        return False
+    if job.kind == 'schedule':
+        return principal.doctor_id is not None and set(job.params.get('doctors', [])) <= {principal.doctor_id}
+    return False
+
+
+def job_state(job):
+    return {
+        'id': job.id,
+        'kind': job.kind,
+        'status': job.status,
+        'progress': job.progress,
+        'total': job.total,
+        'error': job.error,
+        'created_at': job.created_at,
+        'finished_at': job.finished_at,
+    }
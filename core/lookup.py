@@ -0,0 +1,140 @@
+import re
+from bisect import bisect_left
+from collections import defaultdict
+
+from . import refcache
+
+# Поиск по справочникам для автодополнения в формах. Индекс строится в памяти
+# процесса по закэшированной таблице (core.refcache) и перестраивается при
+# смене ее версии: сначала ищем по префиксам слов (код МКБ, слова названия),
+# если ничего не нашлось — нечетко, по триграммам (опечатки, пропуски букв).
+
+PAGE_SIZE = 20
+TRIGRAM_THRESHOLD = 0.4
+
+_WORD_RE = re.compile(r'\w+')
+
+
+def normalize(text):
+    return (text or '').lower().replace('ё', 'е')
+
+
+def words(text):
+    return _WORD_RE.findall(normalize(text))
+
+
+def terms(query):
+    # Запрос делим по пробелам, а не по \w+: код МКБ ("J01.1") должен остаться целым
+    return [term for term in (part.strip(',;:()') for part in normalize(query).split()) if term]
+
+
+def trigrams(text):
+    grams = set()
+    for word in words(text):
+        padded = f'  {word} '
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+class Entry:
+    __slots__ = ('row', 'code', 'words', 'trigrams')
+
+    def __init__(self, row, code, text):
+        self.row = row
+        self.code = normalize(code)
+        self.words = words(text)
+        self.trigrams = trigrams(f'{code} {text}')
+
+
+class SearchIndex:
+    def __init__(self, rows, code_attr=None, text_attr='name'):
+        self.entries = [
+            Entry(row, getattr(row, code_attr) if code_attr else '', getattr(row, text_attr))
+            for row in rows
+        ]
+        tokens = set()
+        self.by_trigram = defaultdict(set)
+        for position, entry in enumerate(self.entries):
+            if entry.code:
+                tokens.add((entry.code, position))
+            tokens.update((word, position) for word in entry.words)
+            for gram in entry.trigrams:
+                self.by_trigram[gram].add(position)
+        self.tokens = sorted(tokens)
+
+    def _with_prefix(self, prefix):
+        positions = set()
+        start = bisect_left(self.tokens, (prefix, -1))
+        for token, position in self.tokens[start:]:
+            if not token.startswith(prefix):
+                break
+            positions.add(position)
+        return positions
+
+    def _prefix_score(self, entry, terms):
+        score = 0
+        if entry.code:
+            if entry.code == terms[0]:
+                score += 100
+            elif entry.code.startswith(terms[0]):
+                score += 50
+        if entry.words and entry.words[0].startswith(terms[0]):
+            score += 10
+        score += sum(5 for term in terms if term in entry.words)
+        return score
+
+    def _fuzzy(self, query):
+        grams = trigrams(query)
+        if not grams:
+            return []
+        shared = defaultdict(int)
+        for gram in grams:
+            for position in self.by_trigram.get(gram, ()):
+                shared[position] += 1
+        ranked = []
+        for position, count in shared.items():
+            # Доля триграмм запроса, найденных в строке: длинное название не штрафуется
+            similarity = count / len(grams)
+            if similarity >= TRIGRAM_THRESHOLD:
+                ranked.append((-similarity, position))
+        ranked.sort()
+        return [position for _, position in ranked]
+
+    def search(self, query):
+        """Позиции подходящих строк в порядке релевантности."""
+        query_terms = terms(query)
+        if not query_terms:
+            return list(range(len(self.entries)))
+
+        found = None
+        for term in query_terms:
+            positions = self._with_prefix(term)
+            found = positions if found is None else found & positions
+            if not found:
+                break
+        if found:
+            return sorted(found, key=lambda p: (-self._prefix_score(self.entries[p], query_terms), p))
+        return self._fuzzy(query)
+
+    def page(self, query, page=1, size=PAGE_SIZE):
+        positions = self.search(query)
+        start = (page - 1) * size
+        rows = [self.entries[p].row for p in positions[start:start + size]]
+        return rows, start + size < len(positions)
+
+
+INDEXES = {
+    'diagnoses': {'code_attr': 'code_icd', 'text_attr': 'name'},
+    'services': {'text_attr': 'name'},
+}
+
+_built = {}
+
+
+def get_index(name):
+    table = refcache.get(name)
+    cached = _built.get(name)
+    if cached is None or cached[0] != table.version:
+        cached = (table.version, SearchIndex(table.rows, **INDEXES[name]))
+        _built[name] = cached
+    return cached[1]
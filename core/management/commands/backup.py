@@ -1,72 +1,91 @@
 import os
-import time
+import shutil
 import subprocess
-from datetime import datetime
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
 from django.conf import settings
 
+from core import backups
+
 
 class Command(BaseCommand):
-    help = 'Создает резервную копию базы данных и сохраняет её'
+    help = 'Создает резервную копию базы данных (полную или инкрементальную) и загружает ее в хранилище'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--mode', choices=['full', 'incremental'], default='full',
+            help='incremental выгружает новые, измененные и удаленные строки по журналу row_changes '
+                 '(миграция 0010, PostgreSQL). Без журнала изменения и удаления отслеживаются только '
+                 'частично: таблицы без отметки изменения выгружаются целиком, удаления не переносятся '
+                 '(список таких таблиц — full_tables в manifest.json)',
+        )
+        parser.add_argument('--jobs', type=int, default=4, help='Параллельные потоки pg_dump')
+        parser.add_argument('--keep', type=int, default=getattr(settings, 'BACKUP_RETENTION', 7),
+                            help='Сколько полных снимков хранить')
+        parser.add_argument('--no-upload', action='store_true', help='Не загружать снимок в хранилище')
 
     def handle(self, *args, **options):
-        db_settings = settings.DATABASES['default']
-        db_name = db_settings['NAME']
-        db_user = db_settings['USER']
-        db_password = db_settings['PASSWORD']
-        db_host = db_settings['HOST']
-        db_port = db_settings['PORT']
-
-        backup_dir = 'backups'
-        if not os.path.exists(backup_dir):
-            os.makedirs(backup_dir)
-
-        timestamp = datetime.now().strftime('%Y-%m-%d_%H-%M-%S')
-        filename = f"backup_{db_name}_{timestamp}.sql"
-        filepath = os.path.join(backup_dir, filename)
-
-        self.stdout.write(f"Начинаю создание резервной копии БД '{db_name}'...")
-
-        env = os.environ.copy()
-        env['PGPASSWORD'] = str(db_password)
-
-        cmd = [
-            'pg_dump',
-            '-h', db_host,
-            '-p', str(db_port),
-            '-U', db_user,
-            '-F', 'c',
-            '-b',
-            '-v',
-            '-f', filepath,
-            db_name
-        ]
-
-        try:
-            subprocess.run(cmd, env=env, check=True)
-            self.stdout.write(self.style.SUCCESS(f"Бэкап успешно создан: {filepath}"))
-
-            self.upload_to_cloud_simulation(filepath)
-
-        except (FileNotFoundError, subprocess.CalledProcessError):
-            self.stdout.write(self.style.WARNING("Утилита pg_dump не найдена или вернула ошибку."))
-            self.stdout.write("Использую запасной вариант (Django dumpdata)...")
-
-            # JSON дамп
-            json_filename = f"backup_{db_name}_{timestamp}.json"
-            json_filepath = os.path.join(backup_dir, json_filename)
-
-            with open(json_filepath, 'w', encoding='utf-8') as f:
-                from django.core.management import call_command
-                call_command('dumpdata', 'core', stdout=f)
-
-            self.stdout.write(self.style.SUCCESS(f"Бэкап (JSON) успешно создан: {json_filepath}"))
-            self.upload_to_cloud_simulation(json_filepath)
-
-    def upload_to_cloud_simulation(self, filepath):
-
-        self.stdout.write("Подключение к удаленному хранилищу (Cloud Storage)...")
-        time.sleep(1)
-        self.stdout.write(f"Загрузка файла {os.path.basename(filepath)}...")
-        time.sleep(2)
-        self.stdout.write(self.style.SUCCESS("Файл успешно загружен в облако!"))
\ No newline at end of file
+        mode = options['mode']
+        previous = None
+        if mode == 'incremental':
+            previous = backups.latest_manifest()
+            if previous is None:
+                raise CommandError('Нет предыдущего снимка: сначала выполните полный бэкап.')
+
+        store = None
+        uploader = None
+        if not options['no_upload']:
+            store = backups.LocalObjectStore(getattr(settings, 'BACKUP_STORE_ROOT', 'backup_store'))
+            uploader = backups.Uploader(store)
+
+        snapshot = backups.Snapshot(mode, on_file=uploader.submit if uploader else None)
+        # Водяные знаки снимаются до дампа: строки, добавленные во время дампа, попадут в следующий инкремент
+        marks = backups.watermarks()
+        change_log = backups.change_log_enabled()
+
+        self.stdout.write(f"Начинаю создание резервной копии ({mode}): {snapshot.path}")
+
+        if mode == 'incremental':
+            full_tables = backups.full_tables(previous)
+            if full_tables:
+                self.stdout.write(self.style.WARNING(
+                    "Журнал изменений не велся с предыдущего снимка: таблицы без отметки изменения "
+                    f"выгружаются целиком ({', '.join(full_tables)}), удаления не переносятся."
+                ))
+            deleted = backups.deleted_rows(previous)
+            counts = backups.dump_rows(snapshot, previous)
+            self.stdout.write(
+                f"Изменено строк: {sum(counts.values())}, удалено: {sum(map(len, deleted.values()))} "
+                f"(с {previous['created_at']})"
+            )
+            snapshot.finish(
+                watermarks=marks, base=previous['id'], format='ndjson', counts=counts,
+                change_log=change_log, full_tables=full_tables, deleted=deleted,
+            )
+        else:
+            try:
+                backups.dump_pg(snapshot, options['jobs'])
+                snapshot.finish(watermarks=marks, format='pg_dump_directory', change_log=change_log)
+            except (FileNotFoundError, subprocess.CalledProcessError):
+                self.stdout.write(self.style.WARNING("Утилита pg_dump не найдена или вернула ошибку."))
+                self.stdout.write("Использую запасной вариант (построчная выгрузка в NDJSON)...")
+                shutil.rmtree(os.path.join(snapshot.path, 'pgdump'), ignore_errors=True)
+
+                counts = backups.dump_rows(snapshot)
+                snapshot.finish(watermarks=marks, format='ndjson', counts=counts, change_log=change_log)
+
+        self.stdout.write(self.style.SUCCESS(f"Бэкап успешно создан: {snapshot.path} ({len(snapshot.manifest['files'])} файлов)"))
+        if change_log:
+            self.stdout.write(f"Очищено записей журнала изменений: {backups.trim_change_log(snapshot.manifest)}")
+
+        if uploader:
+            self.stdout.write("Ожидаю завершения загрузки в хранилище...")
+            uploaded = uploader.wait()
+            self.stdout.write(self.style.SUCCESS(f"Загружено файлов: {len(uploaded)} -> {store.root}"))
+
+        local = backups.LocalObjectStore(backups.backup_root())
+        for label, target in (('локально', local), ('в хранилище', store)):
+            if target is None:
+                continue
+            removed = backups.prune(target.snapshots(), target.delete, options['keep'])
+            if removed:
+                self.stdout.write(f"Удалены старые снимки {label}: {', '.join(removed)}")
@@ -0,0 +1,101 @@
+import json
+import statistics
+from datetime import date, datetime, time as dt_time, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from core import benchmarks, exports, queries, slots, stats
+from core.models import AppointmentBooking, Doctor
+
+
+def _walk(plan, found):
+    relation = plan.get('Relation Name')
+    if relation:
+        found.append((plan['Node Type'], relation, plan.get('Index Name')))
+    for child in plan.get('Plans', ()):
+        _walk(child, found)
+    return found
+
+
+class Command(BaseCommand):
+    help = ('EXPLAIN ANALYZE запросов к appointment_bookings с горячих путей: время, узлы плана '
+            'и прочитанные секции; результат в JSON для сравнения до и после миграций индексов')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--doctor', type=int, help='Врач (по умолчанию — с последней записью)')
+        parser.add_argument('--patient', type=int, help='Пациент (по умолчанию — с последней записью)')
+        parser.add_argument('--date', help='День для слотов и статистики, YYYY-MM-DD (по умолчанию сегодня)')
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--output', help='Сохранить результат в JSON')
+        parser.add_argument('--compare', help='JSON прошлого прогона (например, до миграции)')
+
+    def _queries(self, doctor_id, patient_id, day):
+        doctor = Doctor(id=doctor_id)
+        month_ago = day - timedelta(days=30)
+        return {
+            'slots_day': slots._busy_rows(doctor_id, [day]),
+            'slot_taken': AppointmentBooking.objects.filter(
+                doctor_id=doctor_id, date_time=datetime.combine(day, dt_time(10))
+            ).exclude(status='Canceled'),
+            'doctor_history': queries.doctor_history(doctor_id, today=day)[:queries.PAGE_SIZE + 1],
+            'doctor_history_past': queries.doctor_history(doctor_id, past=True, today=day)[:queries.PAGE_SIZE + 1],
+            'patient_history': queries.patient_history(patient_id)[:queries.PAGE_SIZE + 1],
+            'schedule_month': exports.schedule_queryset(doctor, month_ago, day),
+            'stats_day': stats.daily_rows(day, day),
+        }
+
+    def _explain(self, queryset, repeat):
+        runs = []
+        for _ in range(repeat):
+            plan = json.loads(queryset.explain(format='json', analyze=True, buffers=True))[0]
+            runs.append(plan)
+        plan = runs[-1]
+        nodes = _walk(plan['Plan'], [])
+        return {
+            'execution_ms': round(statistics.median(run['Execution Time'] for run in runs), 3),
+            'planning_ms': round(statistics.median(run['Planning Time'] for run in runs), 3),
+            'relations': len({relation for _, relation, _ in nodes}),
+            'nodes': [f'{node} {relation}' + (f' ({index})' if index else '') for node, relation, index in nodes],
+        }
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError('EXPLAIN (FORMAT JSON, ANALYZE) поддерживается только в PostgreSQL.')
+
+        latest = AppointmentBooking.objects.order_by('-date_time')
+        doctor_id = options['doctor'] or latest.values_list('doctor_id', flat=True).first()
+        patient_id = options['patient'] or latest.values_list('patient_id', flat=True).first()
+        if doctor_id is None or patient_id is None:
+            raise CommandError('Нет записей на прием.')
+        try:
+            day = datetime.strptime(options['date'], '%Y-%m-%d').date() if options['date'] else date.today()
+        except ValueError:
+            raise CommandError('Дата указывается в формате YYYY-MM-DD.')
+        baseline = benchmarks.load(options['compare']) if options['compare'] else None
+
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE appointment_bookings')
+
+        report = {
+            'created_at': datetime.now().isoformat(timespec='seconds'),
+            'revision': benchmarks.git_revision(),
+            'context': {'doctor_id': doctor_id, 'patient_id': patient_id, 'date': day.isoformat()},
+            'queries': {},
+        }
+        for name, queryset in self._queries(doctor_id, patient_id, day).items():
+            result = report['queries'][name] = self._explain(queryset, options['repeat'])
+            line = (
+                f"{name:16} {result['execution_ms']:9.2f} мс (план {result['planning_ms']:.2f} мс), "
+                f"таблиц/секций: {result['relations']}"
+            )
+            before = baseline['queries'].get(name) if baseline else None
+            if before:
+                line += f" | было {before['execution_ms']:.2f} мс, {before['relations']}"
+            self.stdout.write(line)
+            for node in result['nodes']:
+                self.stdout.write(f'    {node}')
+
+        if options['output']:
+            benchmarks.save(report, options['output'])
+            self.stdout.write(self.style.SUCCESS(f"Результат сохранен: {options['output']}"))
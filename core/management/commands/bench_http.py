@@ -0,0 +1,88 @@
+import http.client
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+from urllib.parse import urlsplit
+
+from django.core.management.base import BaseCommand, CommandError
+
+
+def _percentile(values, share):
+    return values[min(len(values) - 1, int(len(values) * share))]
+
+
+class Command(BaseCommand):
+    help = ('Нагрузочный тест AJAX-запросов страницы записи против запущенных серверов, '
+            'например WSGI и ASGI профилей из deploy/: запросов/с и задержки p50/p99')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--target', action='append', required=True,
+                            help='Сервер в виде имя=URL, например wsgi=http://127.0.0.1:8000; можно несколько')
+        parser.add_argument('--path', action='append',
+                            help='Запрашиваемые пути (по умолчанию врачи и слоты на завтра для --doctor)')
+        parser.add_argument('--doctor', type=int, default=1)
+        parser.add_argument('--concurrency', type=int, default=64)
+        parser.add_argument('--requests', type=int, default=5000)
+
+    def _paths(self, options):
+        if options['path']:
+            return options['path']
+        tomorrow = date.today() + timedelta(days=1)
+        return ['/ajax/doctors/', f"/ajax/slots/?doctor_id={options['doctor']}&date={tomorrow.isoformat()}"]
+
+    def _run(self, base_url, paths, concurrency, total):
+        parts = urlsplit(base_url)
+        if parts.scheme != 'http' or not parts.hostname:
+            raise CommandError(f'Ожидается http://хост:порт, получено {base_url}')
+
+        # Каждый поток держит свое keep-alive соединение, как браузер
+        local = threading.local()
+        errors = []
+
+        def request(n):
+            conn = getattr(local, 'conn', None)
+            if conn is None:
+                conn = local.conn = http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=30)
+            started = time.perf_counter()
+            try:
+                conn.request('GET', parts.path.rstrip('/') + paths[n % len(paths)])
+                response = conn.getresponse()
+                response.read()
+                if response.status >= 400:
+                    errors.append(response.status)
+            except (OSError, http.client.HTTPException) as exc:
+                errors.append(type(exc).__name__)
+                conn.close()
+                local.conn = None
+            return (time.perf_counter() - started) * 1000
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            latencies = sorted(pool.map(request, range(total)))
+        elapsed = time.perf_counter() - started
+        return total / elapsed, latencies, errors
+
+    def handle(self, *args, **options):
+        paths = self._paths(options)
+        self.stdout.write(
+            f"{options['requests']} запросов, {options['concurrency']} параллельно: {', '.join(paths)}"
+        )
+
+        for target in options['target']:
+            label, _, url = target.partition('=')
+            if not url:
+                raise CommandError('--target задается как имя=URL')
+
+            # Прогрев: кэши справочников и графика, соединения с БД в воркерах
+            self._run(url, paths, options['concurrency'], options['concurrency'] * 2)
+            rate, latencies, errors = self._run(url, paths, options['concurrency'], options['requests'])
+
+            line = (
+                f"{label:8} {rate:8.1f} запросов/с | p50 {statistics.median(latencies):7.1f} мс, "
+                f"p99 {_percentile(latencies, 0.99):7.1f} мс"
+            )
+            if errors:
+                line += f" | ошибок: {len(errors)} ({', '.join(map(str, sorted(set(errors), key=str)[:5]))})"
+            self.stdout.write(line)
@@ -0,0 +1,79 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from django.contrib.auth.hashers import get_hasher
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from core import credentials
+
+
+def _verify_loop(iterations, seconds):
+    hasher = get_hasher()
+    if iterations:
+        hasher.iterations = iterations
+    encoded = hasher.encode('bench-password', hasher.salt())
+    done = 0
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        hasher.verify('bench-password', encoded)
+        done += 1
+    return done
+
+
+def _login_loop(login, password, seconds):
+    # Дочерний процесс наследует соединения родителя после fork — открываем свои
+    connections.close_all()
+    done = 0
+    deadline = time.perf_counter() + seconds
+    try:
+        while time.perf_counter() < deadline:
+            if credentials.authenticate(login, password) is None:
+                raise RuntimeError('Неверный логин или пароль')
+            done += 1
+    finally:
+        connections.close_all()
+    return done
+
+
+class Command(BaseCommand):
+    help = 'Измеряет пропускную способность входа (проверок пароля в секунду) при разном числе процессов'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', default=f'1,2,4,{os.cpu_count() or 4}',
+                            help='Число процессов через запятую, например 1,2,4,8')
+        parser.add_argument('--seconds', type=float, default=3.0, help='Длительность каждого прогона')
+        parser.add_argument('--iterations', type=int, help='Проверить другую стоимость PBKDF2 вместо настроенной')
+        parser.add_argument('--login', help='Проверять вход реального пользователя (с запросом к БД)')
+        parser.add_argument('--password')
+
+    def handle(self, *args, **options):
+        try:
+            counts = sorted({int(x) for x in options['workers'].split(',') if x})
+        except ValueError:
+            raise CommandError('--workers: список чисел через запятую')
+        if options['login'] and not options['password']:
+            raise CommandError('Для --login нужен --password')
+
+        hasher = get_hasher()
+        iterations = options['iterations'] or getattr(hasher, 'iterations', None)
+        self.stdout.write(f"Алгоритм: {hasher.algorithm}, итераций: {iterations}, CPU: {os.cpu_count()}")
+        connections.close_all()
+
+        for workers in counts:
+            if options['login']:
+                task, args = _login_loop, (options['login'], options['password'], options['seconds'])
+            else:
+                task, args = _verify_loop, (options['iterations'], options['seconds'])
+
+            started = time.perf_counter()
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                total = sum(pool.map(task, *[[arg] * workers for arg in args]))
+            elapsed = time.perf_counter() - started
+
+            rate = total / options['seconds']
+            self.stdout.write(
+                f"{workers:3} процессов: {rate:8.1f} входов/с, "
+                f"{options['seconds'] * 1000 * workers / max(total, 1):7.1f} мс на вход ({elapsed:.1f} с)"
+            )
@@ -0,0 +1,62 @@
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Q
+
+from core import patient_search
+from core.models import Patient
+
+
+def _legacy(query):
+    # Прежний поиск админки: search_fields = ('full_name', 'med_card_number')
+    condition = Q()
+    for word in query.split():
+        condition &= Q(full_name__icontains=word) | Q(med_card_number__icontains=word)
+    return Patient.objects.filter(condition).order_by('-pk')
+
+
+class Command(BaseCommand):
+    help = 'Сравнивает время поиска пациентов: прежний поиск админки и core.patient_search'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--queries', type=int, default=200, help='Сколько запросов каждого вида')
+        parser.add_argument('--seed', type=int, default=1)
+
+    def _sample(self, count, rng):
+        ids = list(Patient.objects.order_by('?').values_list('full_name', 'med_card_number', 'phone')[:count])
+        if not ids:
+            raise CommandError('Нет пациентов для теста.')
+        queries = {'фамилия': [], 'фамилия и имя': [], 'мед. карта': [], 'телефон (хвост)': []}
+        for full_name, card, phone in ids:
+            words = full_name.split()
+            queries['фамилия'].append(words[0][:max(3, len(words[0]) - 2)])
+            queries['фамилия и имя'].append(' '.join(words[:2]))
+            queries['мед. карта'].append(card)
+            queries['телефон (хвост)'].append(patient_search.normalize_phone(phone)[-4:] or phone)
+        for values in queries.values():
+            rng.shuffle(values)
+        return queries
+
+    def _measure(self, search, queries):
+        timings = []
+        for query in queries:
+            started = time.perf_counter()
+            list(search(query)[:patient_search.LIMIT])
+            timings.append((time.perf_counter() - started) * 1000)
+        timings.sort()
+        return statistics.median(timings), timings[int(len(timings) * 0.95) - 1 if len(timings) > 1 else 0]
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        total = Patient.objects.count()
+        self.stdout.write(f"Пациентов в базе: {total}")
+
+        for kind, queries in self._sample(options['queries'], rng).items():
+            legacy = self._measure(_legacy, queries)
+            indexed = self._measure(patient_search.search, queries)
+            self.stdout.write(
+                f"{kind:16} прежний: p50 {legacy[0]:.1f} мс, p95 {legacy[1]:.1f} мс | "
+                f"новый: p50 {indexed[0]:.1f} мс, p95 {indexed[1]:.1f} мс"
+            )
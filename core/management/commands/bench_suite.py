@@ -0,0 +1,69 @@
+import os
+from datetime import datetime
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from core import benchmarks
+
+
+class Command(BaseCommand):
+    help = ('Замеряет горячие пути (слоты, кабинеты, выгрузки, завершение приема, бэкап): время, '
+            'число SQL-запросов и память; сохраняет результат в JSON и сравнивает с прошлым прогоном')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--only', help=f"Замеры через запятую: {', '.join(benchmarks.CASES)}")
+        parser.add_argument('--repeat', type=int, default=10)
+        parser.add_argument('--doctor', type=int, help='Врач для замеров (по умолчанию — с последним приемом)')
+        parser.add_argument('--export-rows', type=int, default=100000, help='Сколько пациентов в выгрузке')
+        parser.add_argument('--report-days', type=int, default=30, help='Период отчета и графика, дней')
+        parser.add_argument('--output', help='Файл результата (по умолчанию BENCHMARK_ROOT/<дата>.json)')
+        parser.add_argument('--compare', help='JSON прошлого прогона для сравнения')
+        parser.add_argument('--threshold', type=float, default=10.0,
+                            help='Рост p50 в процентах, который считается регрессией')
+        parser.add_argument('--fail-on-regression', action='store_true')
+
+    def handle(self, *args, **options):
+        names = list(benchmarks.CASES)
+        if options['only']:
+            names = [name.strip() for name in options['only'].split(',') if name.strip()]
+            unknown = [name for name in names if name not in benchmarks.CASES]
+            if unknown:
+                raise CommandError(f"Неизвестные замеры: {', '.join(unknown)}")
+        baseline = benchmarks.load(options['compare']) if options['compare'] else None
+
+        try:
+            ctx = benchmarks.Context(options['doctor'], options['export_rows'], options['report_days'])
+        except ValueError as exc:
+            raise CommandError(str(exc))
+
+        def show(name, result):
+            memory = f"{result['peak_kb']:9.0f} КБ" if result['peak_kb'] is not None else ' ' * 12
+            self.stdout.write(
+                f"{name:22} p50 {result['p50_ms']:9.1f} мс  p95 {result['p95_ms']:9.1f} мс  "
+                f"SQL {result['queries']:4} ({result['sql_ms']:.1f} мс)  {memory}"
+            )
+
+        report = benchmarks.run(names, ctx, options['repeat'], on_result=show)
+
+        path = options['output'] or os.path.join(
+            getattr(settings, 'BENCHMARK_ROOT', 'benchmarks'), f'{datetime.now():%Y-%m-%d_%H-%M-%S}.json'
+        )
+        benchmarks.save(report, path)
+        self.stdout.write(self.style.SUCCESS(f'Результат сохранен: {path}'))
+
+        if baseline is None:
+            return
+        self.stdout.write(f"Сравнение с {options['compare']} ({baseline.get('revision') or 'без ревизии'}):")
+        regressions = []
+        for name, before, after, change, q_before, q_after, regression in benchmarks.compare(
+            baseline, report, options['threshold'] / 100
+        ):
+            line = f"{name:22} {before:9.1f} -> {after:9.1f} мс ({change:+.0%}), SQL {q_before} -> {q_after}"
+            if regression:
+                regressions.append(name)
+                line = self.style.ERROR(line)
+            self.stdout.write(line)
+
+        if regressions and options['fail_on_regression']:
+            raise CommandError(f"Регрессия: {', '.join(regressions)}")
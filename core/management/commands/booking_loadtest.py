@@ -0,0 +1,83 @@
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, time as dt_time, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from core.booking import book_slot, SlotTaken, SlotUnavailable
+from core.models import AppointmentBooking, Patient
+from core.schedule import bookable, get_calendar, horizon_days
+
+
+class Command(BaseCommand):
+    help = 'Нагрузочный тест записи: параллельные попытки занять слоты одного дня и проверка отсутствия дублей'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--doctor', type=int, required=True)
+        parser.add_argument('--date', required=True, help='YYYY-MM-DD')
+        parser.add_argument('--workers', type=int, default=32)
+        parser.add_argument('--attempts', type=int, default=1000)
+        parser.add_argument('--keep', action='store_true', help='Не удалять созданные записи')
+
+    def handle(self, *args, **options):
+        doctor_id = options['doctor']
+        day = datetime.strptime(options['date'], '%Y-%m-%d').date()
+        if not bookable(day):
+            raise CommandError(f'Дата вне окна записи (сегодня + {horizon_days()} дн.).')
+        starts = [minute for minute, step in get_calendar().slot_starts(doctor_id, day)]
+        if not starts:
+            raise CommandError('В этот день у врача нет приема.')
+
+        patients = list(Patient.objects.values_list('id', flat=True)[:options['workers']])
+        if not patients:
+            raise CommandError('Нет пациентов для теста.')
+
+        slots = [datetime.combine(day, dt_time(m // 60, m % 60)) for m in starts]
+        day_start = datetime.combine(day, dt_time.min)
+        counters = {'ok': 0, 'taken': 0, 'unavailable': 0}
+        created = []
+
+        def attempt(n):
+            try:
+                booking = book_slot(Patient(id=random.choice(patients)), doctor_id, random.choice(slots))
+            except SlotTaken:
+                return 'taken', None
+            except SlotUnavailable:
+                return 'unavailable', None
+            return 'ok', booking.id
+
+        self.stdout.write(f"{options['attempts']} попыток, {options['workers']} потоков, {len(slots)} слотов...")
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['workers']) as pool:
+            for outcome, booking_id in pool.map(attempt, range(options['attempts'])):
+                counters[outcome] += 1
+                if booking_id:
+                    created.append(booking_id)
+        elapsed = time.perf_counter() - started
+
+        with connection.cursor() as cursor:
+            cursor.execute("""
+                SELECT COUNT(*) FROM (
+                    SELECT doctor_id, date_time
+                    FROM appointment_bookings
+                    WHERE doctor_id = %s AND date_time >= %s AND date_time < %s
+                      AND (status IS NULL OR status <> 'Canceled')
+                    GROUP BY doctor_id, date_time
+                    HAVING COUNT(*) > 1
+                ) dup
+            """, [doctor_id, day_start, day_start + timedelta(days=1)])
+            duplicates = cursor.fetchone()[0]
+
+        self.stdout.write(
+            f"Успешно: {counters['ok']}, занято: {counters['taken']}, вне графика: {counters['unavailable']}; "
+            f"{options['attempts'] / elapsed:.0f} попыток/с"
+        )
+
+        if not options['keep']:
+            AppointmentBooking.objects.filter(id__in=created).delete()
+
+        if duplicates:
+            raise CommandError(f'Обнаружены двойные записи: {duplicates}')
+        self.stdout.write(self.style.SUCCESS('Двойных записей нет.'))
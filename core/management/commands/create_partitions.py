@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from core import partitions
+
+
+class Command(BaseCommand):
+    help = ('Создает помесячные секции appointment_bookings на будущие месяцы '
+            '(запускать по расписанию, например раз в сутки)')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--months', type=int, default=3, help='На сколько месяцев вперед')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError('Секционирование поддерживается только в PostgreSQL.')
+
+        created = partitions.ensure_partitions(options['months'])
+        if created is None:
+            raise CommandError('Таблица не секционирована: примените миграцию 0008_booking_partitions.')
+
+        for name, moved in created:
+            line = f'Создана секция {name}'
+            if moved:
+                line += f' (перенесено из DEFAULT: {moved})'
+            self.stdout.write(line)
+        if not created:
+            self.stdout.write('Все секции уже созданы.')
+
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT count(*) FROM {partitions.DEFAULT_PARTITION}')
+            stray = cursor.fetchone()[0]
+        if stray:
+            # Даты вне созданных секций (слишком старые или далекие); по ним нет отсечения секций
+            self.stdout.write(self.style.WARNING(f'В секции DEFAULT записей: {stray}'))
@@ -0,0 +1,61 @@
+import time
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from core import jobs
+
+
+def _run_job(job_id):
+    # Дочерний процесс наследует соединения родителя после fork — открываем свои
+    connections.close_all()
+    try:
+        return job_id, jobs.run(job_id)
+    finally:
+        connections.close_all()
+
+
+class Command(BaseCommand):
+    help = 'Выполняет фоновые задания выгрузки из очереди export_jobs'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=2)
+        parser.add_argument('--poll', type=float, default=2.0, help='Пауза между опросами очереди, сек')
+        parser.add_argument('--once', action='store_true', help='Обработать очередь и завершиться')
+
+    def handle(self, *args, **options):
+        workers = options['workers']
+        running = set()
+
+        self.stdout.write(f"Воркер выгрузок запущен ({workers} процессов).")
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            while True:
+                requeued = jobs.requeue_stale()
+                if requeued:
+                    self.stdout.write(self.style.WARNING(f"Возвращено в очередь зависших заданий: {requeued}"))
+                removed = jobs.prune()
+                if removed:
+                    self.stdout.write(f"Удалено устаревших выгрузок: {removed}")
+
+                free = workers - len(running)
+                claimed = jobs.claim(free) if free else []
+                connections.close_all()
+                for job_id in claimed:
+                    self.stdout.write(f"Задание #{job_id} взято в работу")
+                    running.add(pool.submit(_run_job, job_id))
+
+                if not running:
+                    if options['once']:
+                        break
+                    time.sleep(options['poll'])
+                    continue
+
+                done, running = wait(running, timeout=options['poll'], return_when=FIRST_COMPLETED)
+                running = set(running)
+                for future in done:
+                    job_id, ok = future.result()
+                    if ok:
+                        self.stdout.write(self.style.SUCCESS(f"Задание #{job_id} готово"))
+                    else:
+                        self.stdout.write(self.style.ERROR(f"Задание #{job_id} завершилось ошибкой"))
@@ -0,0 +1,297 @@
+import random
+import time
+from datetime import date, datetime, time as dt_time, timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Q
+
+from core import refcache, schedule
+from core.models import (
+    User, Specialization, Office, Doctor, Patient, Diagnosis, Service,
+    AppointmentBooking, Appointment, Prescription, PerformedService, WorkTemplate,
+)
+from core.patient_search import normalize_phone
+from core.principal import ROLE_DOCTOR, ROLE_PATIENT
+
+SURNAMES = [
+    'Иванов', 'Смирнов', 'Кузнецов', 'Попов', 'Васильев', 'Петров', 'Соколов', 'Михайлов',
+    'Новиков', 'Федоров', 'Морозов', 'Волков', 'Алексеев', 'Лебедев', 'Семенов', 'Егоров',
+    'Павлов', 'Козлов', 'Степанов', 'Николаев', 'Орлов', 'Андреев', 'Макаров', 'Никитин',
+    'Захаров', 'Зайцев', 'Соловьев', 'Борисов', 'Яковлев', 'Григорьев', 'Романов', 'Воробьев',
+]
+MALE_NAMES = ['Александр', 'Сергей', 'Дмитрий', 'Андрей', 'Алексей', 'Иван', 'Михаил', 'Николай', 'Павел', 'Олег']
+FEMALE_NAMES = ['Елена', 'Ольга', 'Наталья', 'Анна', 'Мария', 'Ирина', 'Татьяна', 'Светлана', 'Юлия', 'Екатерина']
+PATRONYMICS = ['Александров', 'Сергеев', 'Дмитриев', 'Андреев', 'Иванов', 'Михайлов', 'Николаев', 'Петров']
+STREETS = ['Ленина', 'Гагарина', 'Мира', 'Советская', 'Садовая', 'Лесная', 'Центральная', 'Школьная']
+COMPLAINTS = [
+    'Головная боль', 'Боль в горле', 'Кашель', 'Повышенная температура', 'Боль в спине',
+    'Слабость', 'Ухудшение зрения', 'Боль в суставах', 'Повышенное давление', 'Плановый осмотр',
+]
+MEDICATIONS = ['Парацетамол', 'Ибупрофен', 'Амоксициллин', 'Лоратадин', 'Омепразол', 'Витамин D', 'Магния B6']
+SHIFTS = [(dt_time(8), dt_time(14)), (dt_time(14), dt_time(20)), (dt_time(9), dt_time(17))]
+
+
+def _full_name(rng):
+    surname = rng.choice(SURNAMES)
+    patronymic = rng.choice(PATRONYMICS)
+    if rng.random() < 0.5:
+        return f"{surname} {rng.choice(MALE_NAMES)} {patronymic}ич"
+    return f"{surname}а {rng.choice(FEMALE_NAMES)} {patronymic}на"
+
+
+def _phone(rng):
+    return f"+7 (9{rng.randint(0, 99):02d}) {rng.randint(0, 999):03d}-{rng.randint(0, 99):02d}-{rng.randint(0, 99):02d}"
+
+
+def _batched(items, size):
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+class Command(BaseCommand):
+    help = ('Заполняет базу синтетической клиникой для нагрузочных тестов: врачи с графиком, пациенты, '
+            'записи за период, приемы, услуги и назначения (bulk_create пачками)')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--doctors', type=int, default=2000)
+        parser.add_argument('--patients', type=int, default=1000000)
+        parser.add_argument('--days-back', type=int, default=365, help='Сколько дней истории приемов')
+        parser.add_argument('--days-ahead', type=int, default=30, help='На сколько дней вперед есть записи')
+        parser.add_argument('--occupancy', type=float, default=0.6, help='Доля занятых слотов, 0..1')
+        parser.add_argument('--patient-users', type=int, default=1000,
+                            help='Скольким пациентам создать учетные записи (врачам — всем)')
+        parser.add_argument('--password', default='synthetic', help='Пароль созданных пользователей')
+        parser.add_argument('--prefix', default='SYN', help='Префикс номеров лицензий, мед. карт и логинов')
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--clear', action='store_true', help='Сначала удалить данные, созданные с этим префиксом')
+        parser.add_argument('--no-stats', action='store_true', help='Не пересчитывать doctor_daily_stats')
+
+    def handle(self, *args, **options):
+        if not connection.features.can_return_rows_from_bulk_insert:
+            raise CommandError('База данных не возвращает id из bulk_create — генерация невозможна.')
+        if not 0 < options['occupancy'] <= 1:
+            raise CommandError('--occupancy задается в интервале (0, 1].')
+
+        self.rng = random.Random(options['seed'])
+        self.prefix = options['prefix']
+        self.batch_size = options['batch_size']
+        self.password = make_password(options['password'])
+
+        if options['clear']:
+            self._clear()
+        elif Doctor.objects.filter(license_number__startswith=f'{self.prefix}-').exists():
+            raise CommandError(f'Данные с префиксом {self.prefix} уже есть: укажите --clear или другой --prefix.')
+
+        started = time.perf_counter()
+        self._references(options['doctors'])
+        doctors = self._doctors(options['doctors'])
+        patient_ids = self._patients(options['patients'], options['patient_users'])
+        first_day = date.today() - timedelta(days=options['days_back'])
+        last_day = date.today() + timedelta(days=options['days_ahead'])
+        self._bookings(doctors, patient_ids, first_day, last_day, options['occupancy'])
+
+        # bulk_create не посылает сигналы: сбрасываем кэши справочников и графика сами
+        refcache.invalidate('specializations', 'doctors', 'diagnoses', 'services')
+        schedule.invalidate()
+
+        if not options['no_stats']:
+            self.stdout.write('Пересчет статистики врачей...')
+            call_command('refresh_stats', date_from=first_day.isoformat(), date_to=last_day.isoformat(),
+                         stdout=self.stdout)
+
+        self.stdout.write(self.style.SUCCESS(f'Готово за {time.perf_counter() - started:.0f} с.'))
+
+    def _clear(self):
+        prefix = f'{self.prefix}-'
+        bookings = AppointmentBooking.objects.filter(
+            Q(doctor__license_number__startswith=prefix) | Q(patient__med_card_number__startswith=prefix)
+        )
+        appointments = Appointment.objects.filter(booking__in=bookings)
+        with transaction.atomic():
+            PerformedService.objects.filter(appointment__in=appointments).delete()
+            Prescription.objects.filter(appointment__in=appointments).delete()
+            appointments.delete()
+            bookings.delete()
+            Patient.objects.filter(med_card_number__startswith=prefix).delete()
+            Doctor.objects.filter(license_number__startswith=prefix).delete()
+            User.objects.filter(login__startswith=f'{self.prefix.lower()}_').delete()
+        self.stdout.write(f'Удалены данные с префиксом {self.prefix}.')
+
+    def _references(self, doctors):
+        # Справочники дополняются до размера, соответствующего числу врачей
+        specializations = max(10, doctors // 100)
+        existing = Specialization.objects.count()
+        Specialization.objects.bulk_create([
+            Specialization(name=f'{self.prefix} Специализация {n}', accreditation_level='Первая категория')
+            for n in range(existing, specializations)
+        ], ignore_conflicts=True)
+
+        existing = Office.objects.count()
+        Office.objects.bulk_create([
+            Office(number=f'{self.prefix}-{n}') for n in range(existing, doctors // 2 + 1)
+        ], ignore_conflicts=True)
+
+        existing = Diagnosis.objects.count()
+        Diagnosis.objects.bulk_create([
+            Diagnosis(name=f'Диагноз {n}', code_icd=f'{self.prefix}{n:05d}') for n in range(existing, 2000)
+        ], ignore_conflicts=True, batch_size=self.batch_size)
+
+        existing = Service.objects.count()
+        Service.objects.bulk_create([
+            Service(name=f'{self.prefix} Услуга {n}', cost=self.rng.randrange(500, 10000, 50))
+            for n in range(existing, 300)
+        ], ignore_conflicts=True)
+
+        self.specialization_ids = list(Specialization.objects.values_list('id', flat=True))
+        self.office_ids = list(Office.objects.values_list('id', flat=True))
+        self.diagnosis_ids = list(Diagnosis.objects.values_list('id', flat=True))
+        self.service_ids = list(Service.objects.values_list('id', flat=True))
+
+    def _users(self, kind, count, role_id):
+        users = [
+            User(login=f'{self.prefix.lower()}_{kind}{n}', password=self.password, role_id=role_id)
+            for n in range(1, count + 1)
+        ]
+        created = []
+        for batch in _batched(users, self.batch_size):
+            created.extend(User.objects.bulk_create(batch))
+        return created
+
+    def _doctors(self, count):
+        """Врачи с учетными записями и графиком; возвращает [(id, [(weekday, start, end, step)])]."""
+        users = self._users('doc', count, ROLE_DOCTOR)
+        doctors = []
+        for n, user in enumerate(users, 1):
+            doctors.append(Doctor(
+                full_name=_full_name(self.rng),
+                license_number=f'{self.prefix}-D{n:07d}',
+                user=user,
+                specialization_id=self.rng.choice(self.specialization_ids),
+                office_id=self.rng.choice(self.office_ids),
+            ))
+        with transaction.atomic():
+            for batch in _batched(doctors, self.batch_size):
+                Doctor.objects.bulk_create(batch)
+
+        result = []
+        templates = []
+        for doctor in doctors:
+            start, end = self.rng.choice(SHIFTS)
+            step = self.rng.choice((20, 30, 30))
+            weekdays = range(6) if self.rng.random() < 0.2 else range(5)
+            hours = [(weekday, start, end, step) for weekday in weekdays]
+            templates.extend(
+                WorkTemplate(doctor_id=doctor.id, weekday=weekday, start_time=start, end_time=end, slot_minutes=step)
+                for weekday, start, end, step in hours
+            )
+            result.append((doctor.id, hours))
+        WorkTemplate.objects.bulk_create(templates, batch_size=self.batch_size)
+
+        self.stdout.write(f'Врачей: {len(doctors)}')
+        return result
+
+    def _patients(self, count, with_users):
+        users = self._users('pat', min(count, with_users), ROLE_PATIENT)
+        ids = []
+        today = date.today()
+
+        def rows():
+            for n in range(1, count + 1):
+                phone = _phone(self.rng)
+                yield Patient(
+                    full_name=_full_name(self.rng),
+                    address=f'г. Москва, ул. {self.rng.choice(STREETS)}, д. {self.rng.randint(1, 150)}',
+                    birth_date=today - timedelta(days=self.rng.randint(365, 90 * 365)),
+                    med_card_number=f'{self.prefix}-P{n:08d}',
+                    phone=phone,
+                    # bulk_create обходит Patient.save()
+                    phone_digits=normalize_phone(phone),
+                    user=users[n - 1] if n <= len(users) else None,
+                )
+
+        for batch in _batched(rows(), self.batch_size):
+            with transaction.atomic():
+                ids.extend(patient.id for patient in Patient.objects.bulk_create(batch))
+            if len(ids) % (self.batch_size * 20) == 0:
+                self.stdout.write(f'  пациентов: {len(ids)}')
+
+        self.stdout.write(f'Пациентов: {len(ids)}')
+        return ids
+
+    def _booking_rows(self, doctors, patient_ids, first_day, last_day, occupancy):
+        now = datetime.now()
+        for doctor_id, hours in doctors:
+            by_weekday = {weekday: (start, end, step) for weekday, start, end, step in hours}
+            day = first_day
+            while day <= last_day:
+                shift = by_weekday.get(day.weekday())
+                day, current = day + timedelta(days=1), day
+                if shift is None:
+                    continue
+                start, end, step = shift
+                slot = datetime.combine(current, start)
+                shift_end = datetime.combine(current, end)
+                while slot + timedelta(minutes=step) <= shift_end:
+                    if self.rng.random() < occupancy:
+                        roll = self.rng.random()
+                        if slot < now:
+                            status = 'Completed' if roll < 0.85 else 'Canceled' if roll < 0.95 else 'Scheduled'
+                        else:
+                            status = 'Scheduled' if roll < 0.95 else 'Canceled'
+                        yield AppointmentBooking(
+                            date_time=slot, status=status,
+                            patient_id=self.rng.choice(patient_ids), doctor_id=doctor_id,
+                        )
+                    slot += timedelta(minutes=step)
+
+    def _bookings(self, doctors, patient_ids, first_day, last_day, occupancy):
+        if not patient_ids:
+            return
+        totals = {'bookings': 0, 'appointments': 0, 'services': 0, 'prescriptions': 0}
+        rows = self._booking_rows(doctors, patient_ids, first_day, last_day, occupancy)
+        for number, batch in enumerate(_batched(rows, self.batch_size), 1):
+            with transaction.atomic():
+                AppointmentBooking.objects.bulk_create(batch)
+                appointments = Appointment.objects.bulk_create([
+                    Appointment(
+                        booking_id=booking.id,
+                        complaints=self.rng.choice(COMPLAINTS),
+                        diagnosis_id=self.rng.choice(self.diagnosis_ids),
+                    )
+                    for booking in batch if booking.status == 'Completed'
+                ])
+                services = [
+                    PerformedService(appointment_id=appointment.id, service_id=service_id,
+                                     count=self.rng.randint(1, 2))
+                    for appointment in appointments
+                    for service_id in self.rng.sample(self.service_ids, self.rng.randint(1, 3))
+                ]
+                PerformedService.objects.bulk_create(services)
+                prescriptions = [
+                    Prescription(appointment_id=appointment.id, medication_name=medication)
+                    for appointment in appointments
+                    for medication in self.rng.sample(MEDICATIONS, self.rng.randint(0, 2))
+                ]
+                Prescription.objects.bulk_create(prescriptions)
+
+            totals['bookings'] += len(batch)
+            totals['appointments'] += len(appointments)
+            totals['services'] += len(services)
+            totals['prescriptions'] += len(prescriptions)
+            if number % 20 == 0:
+                self.stdout.write(f"  записей: {totals['bookings']}")
+
+        self.stdout.write(
+            f"Записей: {totals['bookings']}, приемов: {totals['appointments']}, "
+            f"услуг: {totals['services']}, назначений: {totals['prescriptions']}"
+        )
@@ -0,0 +1,56 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Max, Min
+
+from core import stats
+from core.models import AppointmentBooking
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает статистику врачей по дням (doctor_daily_stats) за период'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--from', dest='date_from', help='YYYY-MM-DD, по умолчанию — первая запись')
+        parser.add_argument('--to', dest='date_to', help='YYYY-MM-DD, по умолчанию — последняя запись')
+        parser.add_argument('--chunk-days', type=int, default=31)
+        parser.add_argument('--workers', type=int, default=4)
+
+    def handle(self, *args, **options):
+        bounds = AppointmentBooking.objects.aggregate(first=Min('date_time'), last=Max('date_time'))
+        if bounds['first'] is None:
+            self.stdout.write('Записей нет, пересчитывать нечего.')
+            return
+
+        try:
+            date_from = self._date(options['date_from']) or bounds['first'].date()
+            date_to = self._date(options['date_to']) or bounds['last'].date()
+        except ValueError:
+            raise CommandError('Даты указываются в формате YYYY-MM-DD.')
+
+        chunks = []
+        start = date_from
+        while start <= date_to:
+            end = min(start + timedelta(days=options['chunk_days'] - 1), date_to)
+            chunks.append((start, end))
+            start = end + timedelta(days=1)
+
+        def refresh_chunk(chunk):
+            try:
+                stats.refresh(*chunk)
+            finally:
+                connection.close()
+            return chunk
+
+        self.stdout.write(f"Пересчет {date_from} — {date_to}: {len(chunks)} частей, {options['workers']} потоков...")
+        # Каждая часть пересчитывается в своей транзакции, читатели видят прежние данные до коммита
+        with ThreadPoolExecutor(max_workers=options['workers']) as pool:
+            for start, end in pool.map(refresh_chunk, chunks):
+                self.stdout.write(f"  {start} — {end} готово")
+
+        self.stdout.write(self.style.SUCCESS('Статистика обновлена.'))
+
+    def _date(self, value):
+        return datetime.strptime(value, '%Y-%m-%d').date() if value else None
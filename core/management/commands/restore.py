@@ -0,0 +1,65 @@
+import os
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+
+from core import backups
+
+
+class Command(BaseCommand):
+    help = 'Восстанавливает базу из снимка (каталог с manifest.json или старый JSON-бэкап)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('snapshot', help='Путь к снимку или его имя в каталоге BACKUP_ROOT')
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--jobs', type=int, default=4, help='Параллельные потоки pg_restore')
+        parser.add_argument('--no-chain', action='store_true',
+                            help='Для инкремента не накатывать предшествующие снимки')
+
+    def handle(self, *args, **options):
+        path = options['snapshot']
+        if not os.path.exists(path):
+            path = os.path.join(backups.backup_root(), path)
+
+        # Старые бэкапы — один файл dumpdata
+        if os.path.isfile(path):
+            self.stdout.write(f"Загрузка {path} через loaddata...")
+            call_command('loaddata', path)
+            self._done()
+            return
+
+        chain = self._chain(path, follow=not options['no_chain'])
+        for snapshot_path, manifest in chain:
+            broken = backups.verify(snapshot_path, manifest)
+            if broken:
+                raise CommandError(f"Снимок {manifest['id']} поврежден: {', '.join(broken)}")
+
+        for snapshot_path, manifest in chain:
+            self.stdout.write(f"Восстановление {manifest['id']} ({manifest.get('format')})...")
+            if manifest.get('format') == 'pg_dump_directory':
+                backups.restore_pg(snapshot_path, manifest, options['jobs'])
+            else:
+                counts = backups.restore_rows(
+                    snapshot_path, manifest, options['batch_size'], log=lambda line: self.stdout.write(f"  {line}")
+                )
+                self.stdout.write(f"  Загружено строк: {sum(counts.values())}")
+
+        self._done()
+
+    def _chain(self, path, follow):
+        """Снимок и, для инкремента, все предшествующие вплоть до полного — от старого к новому."""
+        manifest = backups.load_manifest(path)
+        chain = [(path, manifest)]
+        while follow and manifest.get('base'):
+            path = os.path.join(os.path.dirname(path), manifest['base'])
+            if not os.path.isdir(path):
+                raise CommandError(f"Не найден базовый снимок {manifest['base']}")
+            manifest = backups.load_manifest(path)
+            chain.append((path, manifest))
+        return list(reversed(chain))
+
+    def _done(self):
+        # Индексы слотов и справочники в кэше построены по старым данным
+        cache.clear()
+        self.stdout.write(self.style.SUCCESS("Восстановление завершено. Для отчетов выполните refresh_stats."))
@@ -0,0 +1,253 @@
+import logging
+import threading
+import time
+from collections import Counter
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.http import HttpResponse
+from django.template.backends.django import DjangoTemplates, Template
+
+# Метрики запросов в памяти процесса: время ответа, число и время SQL-запросов,
+# время рендеринга шаблонов — гистограммами по имени представления.
+# Отдаются в текстовом формате Prometheus на /metrics (каждый воркер — свои).
+# Повторяющиеся в одном запросе SQL (N+1) пишутся в лог core.metrics.
+
+logger = logging.getLogger(__name__)
+
+TIME_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+
+
+class Histogram:
+    def __init__(self, name, help_text, buckets, label='view'):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = buckets
+        self.label = label
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, label_value, value):
+        with self._lock:
+            series = self._series.get(label_value)
+            if series is None:
+                series = self._series[label_value] = [[0] * len(self.buckets), 0, 0.0]
+            counts = series[0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            series[1] += 1
+            series[2] += value
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            items = sorted((key, [list(v[0]), v[1], v[2]]) for key, v in self._series.items())
+        for label_value, (counts, count, total) in items:
+            label = f'{self.label}="{_escape(label_value)}"'
+            cumulative = 0
+            for bound, n in zip(self.buckets, counts):
+                cumulative += n
+                lines.append(f'{self.name}_bucket{{{label},le="{bound}"}} {cumulative}')
+            lines.append(f'{self.name}_bucket{{{label},le="+Inf"}} {count}')
+            lines.append(f'{self.name}_sum{{{label}}} {total}')
+            lines.append(f'{self.name}_count{{{label}}} {count}')
+        return lines
+
+
+class LabeledCounter:
+    def __init__(self, name, help_text, labels):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self._values = Counter()
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] += amount
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} counter']
+        with self._lock:
+            items = sorted(self._values.items())
+        for label_values, value in items:
+            label = ','.join(f'{k}="{_escape(v)}"' for k, v in zip(self.labels, label_values))
+            lines.append(f'{self.name}{{{label}}} {value}')
+        return lines
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+REQUEST_SECONDS = Histogram('clinic_request_duration_seconds', 'Время обработки запроса', TIME_BUCKETS)
+REQUEST_QUERIES = Histogram('clinic_request_queries', 'SQL-запросов за запрос', QUERY_BUCKETS)
+REQUEST_SQL_SECONDS = Histogram('clinic_request_sql_seconds', 'Время SQL за запрос', TIME_BUCKETS)
+TEMPLATE_SECONDS = Histogram('clinic_template_render_seconds', 'Время рендеринга шаблона', TIME_BUCKETS, 'template')
+REQUEST_TEMPLATE_SECONDS = Histogram(
+    'clinic_request_template_seconds', 'Время рендеринга шаблонов за запрос', TIME_BUCKETS,
+)
+REQUESTS = LabeledCounter('clinic_requests_total', 'Запросов по представлению и статусу', ('view', 'status'))
+DUPLICATES = LabeledCounter('clinic_duplicate_queries_total', 'Запросов с повторяющимся SQL (N+1)', ('view',))
+
+ALL = (
+    REQUEST_SECONDS, REQUEST_QUERIES, REQUEST_SQL_SECONDS, REQUEST_TEMPLATE_SECONDS, TEMPLATE_SECONDS,
+    REQUESTS, DUPLICATES,
+)
+
+
+class RequestStats:
+    __slots__ = ('queries', 'sql_seconds', 'template_seconds', 'patterns')
+
+    def __init__(self):
+        self.queries = 0
+        self.sql_seconds = 0.0
+        self.template_seconds = 0.0
+        self.patterns = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        # connection.execute_wrapper: параметры не сохраняем, одинаковый SQL — один шаблон
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.sql_seconds += time.perf_counter() - started
+            self.queries += 1
+            self.patterns[sql] += 1
+
+
+_current = ContextVar('request_stats', default=None)
+
+
+def _track_queries(execute, sql, params, many, context):
+    # Стоит на всех соединениях постоянно; пишет в статистику текущего запроса.
+    # ContextVar переходит в потоки sync_to_async, поэтому под ASGI учитываются
+    # и синхронные представления, и асинхронный ORM — у них свои соединения.
+    stats = _current.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    return stats(execute, sql, params, many, context)
+
+
+def _install(connection):
+    if _track_queries not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_track_queries)
+
+
+@receiver(connection_created)
+def install_query_tracking(sender, connection, **kwargs):
+    _install(connection)
+
+
+def _view_name(request):
+    match = getattr(request, 'resolver_match', None)
+    return match.view_name if match else '<unresolved>'
+
+
+def _record(request, response, stats, elapsed):
+    view = _view_name(request)
+    REQUEST_SECONDS.observe(view, elapsed)
+    REQUESTS.inc(view, response.status_code)
+    if stats is None:
+        return
+    REQUEST_QUERIES.observe(view, stats.queries)
+    REQUEST_SQL_SECONDS.observe(view, stats.sql_seconds)
+    REQUEST_TEMPLATE_SECONDS.observe(view, stats.template_seconds)
+
+    threshold = getattr(settings, 'METRICS_DUPLICATE_THRESHOLD', 5)
+    repeated = [(sql, n) for sql, n in stats.patterns.items() if n >= threshold]
+    if repeated:
+        DUPLICATES.inc(view)
+        for sql, n in repeated:
+            logger.warning('%s: %d одинаковых запросов: %s', view, n, sql[:300])
+        if settings.DEBUG:
+            response['X-Duplicate-Queries'] = str(sum(n for _, n in repeated))
+
+
+class MetricsMiddleware:
+    """Собирает метрики запроса; ставится первым в MIDDLEWARE."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        # Соединения, открытые до подключения сигнала (постоянные под WSGI)
+        for alias in connections:
+            _install(connections[alias])
+
+        stats = RequestStats()
+        token = _current.set(stats)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        # Для потоковых ответов учитывается время до начала отправки
+        _record(request, response, stats, time.perf_counter() - started)
+        return response
+
+    async def __acall__(self, request):
+        # SQL выполняется в потоках sync_to_async на их соединениях; там статистику
+        # запроса находит _track_queries (соединения под ASGI открываются заново)
+        stats = RequestStats()
+        token = _current.set(stats)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        _record(request, response, stats, time.perf_counter() - started)
+        return response
+
+
+class InstrumentedTemplate(Template):
+    def render(self, context=None, request=None):
+        started = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            elapsed = time.perf_counter() - started
+            TEMPLATE_SECONDS.observe(self.origin.template_name or '<string>', elapsed)
+            stats = _current.get()
+            if stats is not None:
+                stats.template_seconds += elapsed
+
+
+class InstrumentedDjangoTemplates(DjangoTemplates):
+    """Шаблонизатор Django с замером времени рендеринга каждого шаблона."""
+
+    def from_string(self, template_code):
+        return InstrumentedTemplate(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        template = super().get_template(template_name)
+        return InstrumentedTemplate(template.template, self)
+
+
+def render_text():
+    lines = []
+    for metric in ALL:
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
+
+
+def metrics_view(request):
+    allowed = getattr(settings, 'METRICS_ALLOWED_IPS', ('127.0.0.1', '::1'))
+    if request.META.get('REMOTE_ADDR') not in allowed and not request.user.is_staff:
+        return HttpResponse(status=403)
+    return HttpResponse(render_text(), content_type='text/plain; version=0.0.4; charset=utf-8')
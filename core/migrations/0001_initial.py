@@ -0,0 +1,183 @@
+# Generated by Django 6.0 on 2026-10-18 19:32
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Appointment',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('complaints', models.TextField(blank=True, null=True)),
+            ],
+            options={
+                'verbose_name': 'Прием (Результат)',
+                'verbose_name_plural': 'Приемы (Результаты)',
+                'db_table': 'appointments',
+                'managed': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='AppointmentBooking',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date_time', models.DateTimeField()),
+                ('status', models.CharField(blank=True, max_length=50, null=True)),
+            ],
+            options={
+                'verbose_name': 'Запись на прием',
+                'verbose_name_plural': 'Записи на прием',
+                'db_table': 'appointment_bookings',
+                'managed': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='Diagnosis',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255)),
+                ('code_icd', models.CharField(max_length=20, unique=True)),
+                ('description', models.TextField(blank=True, null=True)),
+            ],
+            options={
+                'verbose_name': 'Диагноз',
+                'verbose_name_plural': 'Диагнозы',
+                'db_table': 'diagnoses',
+                'managed': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='Doctor',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('full_name', models.CharField(max_length=150)),
+                ('license_number', models.CharField(max_length=50, unique=True)),
+            ],
+            options={
+                'verbose_name': 'Врач',
+                'verbose_name_plural': 'Врачи',
+                'db_table': 'doctors',
+                'managed': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='Office',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('number', models.CharField(max_length=20, unique=True)),
+            ],
+            options={
+                'verbose_name': 'Кабинет',
+                'verbose_name_plural': 'Кабинеты',
+                'db_table': 'offices',
+                'managed': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='PerformedService',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('count', models.IntegerField(blank=True, null=True)),
+            ],
+            options={
+                'verbose_name': 'Оказанная услуга',
+                'verbose_name_plural': 'Оказанные услуги',
+                'db_table': 'performed_services',
+                'managed': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='Prescription',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('medication_name', models.CharField(max_length=200)),
+            ],
+            options={
+                'verbose_name': 'Назначение',
+                'verbose_name_plural': 'Назначения',
+                'db_table': 'prescriptions',
+                'managed': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='Role',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True)),
+            ],
+            options={
+                'verbose_name': 'Роль',
+                'verbose_name_plural': 'Роли',
+                'db_table': 'roles',
+                'managed': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='Service',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, unique=True)),
+                ('cost', models.DecimalField(decimal_places=2, max_digits=10)),
+            ],
+            options={
+                'verbose_name': 'Услуга',
+                'verbose_name_plural': 'Услуги',
+                'db_table': 'services',
+                'managed': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='Specialization',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, unique=True)),
+                ('accreditation_level', models.CharField(max_length=50)),
+            ],
+            options={
+                'verbose_name': 'Специализация',
+                'verbose_name_plural': 'Специализации',
+                'db_table': 'specializations',
+                'managed': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='User',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('login', models.CharField(max_length=100, unique=True)),
+                ('password', models.CharField(max_length=255)),
+            ],
+            options={
+                'verbose_name': 'Пользователь',
+                'verbose_name_plural': 'Пользователи',
+                'db_table': 'users',
+                'managed': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='Patient',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('full_name', models.CharField(max_length=150)),
+                ('address', models.TextField(blank=True, null=True)),
+                ('birth_date', models.DateField()),
+                ('med_card_number', models.CharField(max_length=50, unique=True)),
+                ('phone', models.CharField(max_length=20)),
+                ('user', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.DO_NOTHING, to='core.user')),
+            ],
+            options={
+                'verbose_name': 'Пациент',
+                'verbose_name_plural': 'Пациенты',
+                'db_table': 'patients',
+                'managed': True,
+            },
+        ),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 6.0 on 2026-10-18 19:32
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ScheduleException',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('start_time', models.TimeField(blank=True, null=True)),
+                ('end_time', models.TimeField(blank=True, null=True)),
+                ('slot_minutes', models.PositiveSmallIntegerField(blank=True, null=True)),
+                ('reason', models.CharField(blank=True, max_length=200)),
+                ('doctor', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='core.doctor')),
+                ('office', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='core.office')),
+            ],
+            options={
+                'verbose_name': 'Исключение в графике',
+                'verbose_name_plural': 'Исключения в графике',
+                'db_table': 'schedule_exceptions',
+                'managed': True,
+                'constraints': [models.CheckConstraint(condition=models.Q(('doctor__isnull', False), ('office__isnull', False), _connector='OR'), name='schedule_exception_owner')],
+            },
+        ),
+        migrations.CreateModel(
+            name='WorkTemplate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('weekday', models.PositiveSmallIntegerField(choices=[(0, 'Понедельник'), (1, 'Вторник'), (2, 'Среда'), (3, 'Четверг'), (4, 'Пятница'), (5, 'Суббота'), (6, 'Воскресенье')])),
+                ('start_time', models.TimeField()),
+                ('end_time', models.TimeField()),
+                ('slot_minutes', models.PositiveSmallIntegerField(default=30)),
+                ('doctor', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='core.doctor')),
+                ('office', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='core.office')),
+            ],
+            options={
+                'verbose_name': 'Шаблон графика',
+                'verbose_name_plural': 'Шаблоны графика',
+                'db_table': 'work_templates',
+                'managed': True,
+                'constraints': [models.CheckConstraint(condition=models.Q(('doctor__isnull', False), ('office__isnull', False), _connector='OR'), name='work_template_owner')],
+            },
+        ),
+    ]
@@ -0,0 +1,21 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0002_schedule'),
+    ]
+
+    # Перед применением дубли (одинаковые врач и время среди неотмененных записей)
+    # нужно разобрать вручную, иначе индекс не создастся.
+    operations = [
+        migrations.RunSQL(
+            sql="""
+                CREATE UNIQUE INDEX IF NOT EXISTS appointment_bookings_active_slot_uniq
+                ON appointment_bookings (doctor_id, date_time)
+                WHERE status IS DISTINCT FROM 'Canceled'
+            """,
+            reverse_sql='DROP INDEX IF EXISTS appointment_bookings_active_slot_uniq',
+        ),
+    ]
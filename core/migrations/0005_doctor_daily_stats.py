@@ -0,0 +1,33 @@
+# Generated by Django 6.0 on 2026-10-18 19:36
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0004_patient_updated_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DoctorDailyStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('status', models.CharField(blank=True, max_length=50)),
+                ('visit_count', models.IntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('doctor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='core.doctor')),
+            ],
+            options={
+                'verbose_name': 'Статистика врача за день',
+                'verbose_name_plural': 'Статистика врачей по дням',
+                'db_table': 'doctor_daily_stats',
+                'managed': True,
+                'indexes': [models.Index(fields=['day', 'status'], name='doctor_dail_day_1de088_idx')],
+                'constraints': [models.UniqueConstraint(fields=('doctor', 'day', 'status'), name='doctor_daily_stats_uniq')],
+            },
+        ),
+    ]
@@ -0,0 +1,45 @@
+from django.db import migrations, models
+
+
+def fill_phone_digits(apps, schema_editor):
+    from core.patient_search import normalize_phone
+
+    Patient = apps.get_model('core', 'Patient')
+    batch = []
+    for patient in Patient.objects.only('id', 'phone').iterator(chunk_size=2000):
+        patient.phone_digits = normalize_phone(patient.phone)
+        batch.append(patient)
+        if len(batch) >= 2000:
+            Patient.objects.bulk_update(batch, ['phone_digits'])
+            batch = []
+    Patient.objects.bulk_update(batch, ['phone_digits'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_export_jobs'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='patient',
+            name='phone_digits',
+            field=models.CharField(blank=True, default='', editable=False, max_length=20),
+        ),
+        migrations.RunPython(fill_phone_digits, migrations.RunPython.noop),
+        # Триграммные GIN-индексы ускоряют ILIKE '%...%' и поиск похожих строк
+        migrations.RunSQL(
+            sql=[
+                'CREATE EXTENSION IF NOT EXISTS pg_trgm',
+                'CREATE INDEX IF NOT EXISTS patients_full_name_trgm ON patients USING gin (full_name gin_trgm_ops)',
+                'CREATE INDEX IF NOT EXISTS patients_med_card_trgm ON patients USING gin (med_card_number gin_trgm_ops)',
+                'CREATE INDEX IF NOT EXISTS patients_phone_digits_trgm ON patients USING gin (phone_digits gin_trgm_ops)',
+            ],
+            reverse_sql=[
+                'DROP INDEX IF EXISTS patients_phone_digits_trgm',
+                'DROP INDEX IF EXISTS patients_med_card_trgm',
+                'DROP INDEX IF EXISTS patients_full_name_trgm',
+            ],
+        ),
+    ]
@@ -0,0 +1,173 @@
+from datetime import date
+
+from django.db import migrations
+
+# Таблица записей (unmanaged, схема clinic) пересоздается секционированной по
+# месяцам date_time и обратно. Данные копируются целиком, таблица на это время
+# заблокирована — применять в окно обслуживания. Только PostgreSQL.
+#
+# Первичный и уникальные ключи секционированной таблицы обязаны включать
+# date_time, поэтому внешние ключи на appointment_bookings(id) (appointments.booking_id)
+# снимаются: завершение приема (core.visits) само блокирует и проверяет запись,
+# а удалить запись с проведенным приемом не дает триггер KEEP_VISITS.
+#
+# CHECK-ограничения, индексы и триггеры переносятся на новую таблицу.
+
+ACTIVE_SLOT_INDEX = """
+    CREATE UNIQUE INDEX IF NOT EXISTS appointment_bookings_active_slot_uniq
+    ON appointment_bookings (doctor_id, date_time)
+    WHERE status IS DISTINCT FROM 'Canceled'
+"""
+
+# Вместо снятого внешнего ключа: после удаления записей не должно остаться
+# приемов без записи. Триггер уровня оператора на родительской таблице, поэтому
+# перенос строк между секциями (core.partitions) его не задевает.
+KEEP_VISITS = [
+    """
+    CREATE OR REPLACE FUNCTION appointment_bookings_keep_visits() RETURNS trigger AS $$
+    BEGIN
+        IF EXISTS (
+            SELECT 1 FROM removed JOIN appointments a ON a.booking_id = removed.id
+            WHERE NOT EXISTS (SELECT 1 FROM appointment_bookings b WHERE b.id = removed.id)
+        ) THEN
+            RAISE EXCEPTION 'Запись на прием связана с проведенным приемом (appointments)'
+                USING ERRCODE = 'foreign_key_violation';
+        END IF;
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    CREATE TRIGGER appointment_bookings_keep_visits
+    AFTER DELETE ON appointment_bookings REFERENCING OLD TABLE AS removed
+    FOR EACH STATEMENT EXECUTE FUNCTION appointment_bookings_keep_visits()
+    """,
+]
+DROP_KEEP_VISITS = [
+    'DROP TRIGGER IF EXISTS appointment_bookings_keep_visits ON appointment_bookings',
+    'DROP FUNCTION IF EXISTS appointment_bookings_keep_visits()',
+]
+
+
+def _constraints(cursor, column, table):
+    cursor.execute(f"""
+        SELECT conrelid::regclass::text, conname, pg_get_constraintdef(oid) FROM pg_constraint
+        WHERE contype = 'f' AND {column} = to_regclass(%s)
+    """, [table])
+    return cursor.fetchall()
+
+
+def _indexes(cursor, table):
+    # Кроме первичного ключа: он пересоздается с date_time или без
+    cursor.execute("""
+        SELECT pg_get_indexdef(indexrelid) FROM pg_index
+        WHERE indrelid = to_regclass(%s) AND NOT indisprimary
+    """, [table])
+    return [row[0] for row in cursor.fetchall()]
+
+
+def _triggers(cursor, table):
+    cursor.execute("""
+        SELECT pg_get_triggerdef(oid) FROM pg_trigger
+        WHERE tgrelid = to_regclass(%s) AND NOT tgisinternal
+    """, [table])
+    return [row[0] for row in cursor.fetchall()]
+
+
+def _rebuild(schema_editor, partitioned):
+    from core import partitions
+
+    table = partitions.TABLE
+    old = f'{table}_old'
+    execute = schema_editor.execute
+
+    with schema_editor.connection.cursor() as cursor:
+        if partitions.is_partitioned(cursor) == partitioned:
+            return
+        incoming = _constraints(cursor, 'confrelid', table)
+        outgoing = _constraints(cursor, 'conrelid', table)
+        # Определения берутся до переименования, поэтому ссылаются на новую таблицу
+        indexes = _indexes(cursor, table)
+        triggers = _triggers(cursor, table)
+        cursor.execute("SELECT pg_get_serial_sequence(%s, 'id')", [table])
+        sequence = cursor.fetchone()[0]
+        cursor.execute(f'SELECT min(date_time), max(date_time) FROM {table}')
+        first, last = cursor.fetchone()
+
+        for relation, name, definition in incoming:
+            execute(f'ALTER TABLE {relation} DROP CONSTRAINT "{name}"')
+        execute(f'ALTER TABLE {table} RENAME TO {old}')
+        execute(
+            f'CREATE TABLE {table} (LIKE {old} INCLUDING DEFAULTS INCLUDING IDENTITY '
+            f'INCLUDING STORAGE INCLUDING CONSTRAINTS)'
+            + (' PARTITION BY RANGE (date_time)' if partitioned else '')
+        )
+
+        if partitioned:
+            execute(f'CREATE TABLE {partitions.DEFAULT_PARTITION} PARTITION OF {table} DEFAULT')
+            # Секции на весь период данных и на три месяца вперед
+            today = date.today()
+            end = partitions.month_start(max(last.date(), today) if last else today)
+            for _ in range(3):
+                end = partitions.next_month(end)
+            for month in partitions.months(first.date() if first else today, end):
+                partitions.create_partition(cursor, month)
+
+        execute(f'INSERT INTO {table} SELECT * FROM {old}')
+
+        # serial: последовательность переходит к новой таблице;
+        # identity: у новой таблицы своя последовательность, догоняем ее
+        cursor.execute("SELECT pg_get_serial_sequence(%s, 'id')", [table])
+        new_sequence = cursor.fetchone()[0]
+        if new_sequence and new_sequence != sequence:
+            execute(f"SELECT setval('{new_sequence}', (SELECT coalesce(max(id), 0) + 1 FROM {table}), false)")
+        elif sequence:
+            execute(f'ALTER SEQUENCE {sequence} OWNED BY {table}.id')
+
+        execute(f'DROP TABLE {old}')
+        execute(f"ALTER TABLE {table} ADD PRIMARY KEY {'(id, date_time)' if partitioned else '(id)'}")
+        for relation, name, definition in outgoing:
+            execute(f'ALTER TABLE {table} ADD CONSTRAINT "{name}" {definition}')
+        for definition in indexes:
+            execute(definition)
+        execute(ACTIVE_SLOT_INDEX)
+        for definition in triggers:
+            execute(definition)
+        if not partitioned:
+            for relation, name, definition in incoming:
+                execute(f'ALTER TABLE {relation} ADD CONSTRAINT "{name}" {definition}')
+        execute(f'ANALYZE {table}')
+
+
+def partition_bookings(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        _rebuild(schema_editor, partitioned=True)
+        for sql in DROP_KEEP_VISITS + KEEP_VISITS:
+            schema_editor.execute(sql)
+
+
+def unpartition_bookings(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for sql in DROP_KEEP_VISITS:
+        schema_editor.execute(sql)
+    _rebuild(schema_editor, partitioned=False)
+    # Внешний ключ, снятый при секционировании
+    execute = schema_editor.execute
+    with schema_editor.connection.cursor() as cursor:
+        if not _constraints(cursor, 'confrelid', 'appointment_bookings'):
+            execute(
+                'ALTER TABLE appointments ADD CONSTRAINT appointments_booking_id_fkey '
+                'FOREIGN KEY (booking_id) REFERENCES appointment_bookings (id)'
+            )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_patient_search'),
+    ]
+
+    operations = [
+        migrations.RunPython(partition_bookings, unpartition_bookings),
+    ]
@@ -0,0 +1,44 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_booking_partitions'),
+    ]
+
+    # Все выборки записей по дате — полуоткрытые диапазоны date_time
+    # (core.slots, core.stats, core.exports), поэтому хватает обычных индексов
+    # с date_time вторым полем; индекс по выражению date_time::date не нужен.
+    # На секционированной таблице индексы создаются в каждой секции.
+    operations = [
+        migrations.RunSQL(
+            sql=[
+                # История врача (keyset по date_time, id), отчеты и статистика по врачу
+                'CREATE INDEX IF NOT EXISTS appointment_bookings_doctor_dt_idx '
+                'ON appointment_bookings (doctor_id, date_time, id)',
+                # История пациента, новые записи сверху
+                'CREATE INDEX IF NOT EXISTS appointment_bookings_patient_dt_idx '
+                'ON appointment_bookings (patient_id, date_time DESC, id DESC)',
+                # Предстоящие приемы: график врача и его выгрузка; таких записей немного
+                'CREATE INDEX IF NOT EXISTS appointment_bookings_scheduled_idx '
+                "ON appointment_bookings (doctor_id, date_time) WHERE status = 'Scheduled'",
+                # Пересчет статистики за день по всем врачам
+                'CREATE INDEX IF NOT EXISTS appointment_bookings_date_time_idx '
+                'ON appointment_bookings (date_time)',
+                # Услуги и назначения приема (детали визита, отчет по выручке)
+                'CREATE INDEX IF NOT EXISTS performed_services_appointment_idx '
+                'ON performed_services (appointment_id)',
+                'CREATE INDEX IF NOT EXISTS prescriptions_appointment_idx '
+                'ON prescriptions (appointment_id)',
+            ],
+            reverse_sql=[
+                'DROP INDEX IF EXISTS prescriptions_appointment_idx',
+                'DROP INDEX IF EXISTS performed_services_appointment_idx',
+                'DROP INDEX IF EXISTS appointment_bookings_date_time_idx',
+                'DROP INDEX IF EXISTS appointment_bookings_scheduled_idx',
+                'DROP INDEX IF EXISTS appointment_bookings_patient_dt_idx',
+                'DROP INDEX IF EXISTS appointment_bookings_doctor_dt_idx',
+            ],
+        ),
+    ]
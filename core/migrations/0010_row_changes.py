@@ -0,0 +1,82 @@
+from django.db import migrations, models
+
+# Журнал изменений для инкрементальных бэкапов (core.backups): триггеры после
+# UPDATE и DELETE пишут (таблица, id) в row_changes. Вставки не журналируются —
+# их находит водяной знак id снимка. Перенос записи между секциями выполняется
+# как DELETE + INSERT и тоже попадает в журнал: бэкап отличает удаление от переноса
+# по наличию строки. Журнал очищается командой backup после каждого снимка.
+# Только PostgreSQL.
+
+TABLES = [
+    'roles', 'users', 'specializations', 'offices', 'doctors', 'patients',
+    'diagnoses', 'services', 'appointment_bookings', 'appointments', 'prescriptions',
+    'performed_services', 'work_templates', 'schedule_exceptions', 'doctor_daily_stats',
+    'export_jobs',
+]
+
+CREATE_LOG = [
+    """
+    CREATE TABLE IF NOT EXISTS row_changes (
+        id bigserial PRIMARY KEY,
+        table_name varchar(63) NOT NULL,
+        row_id bigint NOT NULL,
+        changed_at timestamp NOT NULL DEFAULT localtimestamp
+    )
+    """,
+    'CREATE INDEX IF NOT EXISTS row_changes_table_changed_idx ON row_changes (table_name, changed_at)',
+    # Имя таблицы передается аргументом: у строковых триггеров секций TG_TABLE_NAME — имя секции
+    """
+    CREATE OR REPLACE FUNCTION row_changes_log() RETURNS trigger AS $$
+    BEGIN
+        INSERT INTO row_changes (table_name, row_id) VALUES (TG_ARGV[0], OLD.id);
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+]
+
+
+def install(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for sql in CREATE_LOG:
+        schema_editor.execute(sql)
+    for table in TABLES:
+        schema_editor.execute(f'DROP TRIGGER IF EXISTS {table}_row_changes ON {table}')
+        schema_editor.execute(
+            f"CREATE TRIGGER {table}_row_changes AFTER UPDATE OR DELETE ON {table} "
+            f"FOR EACH ROW EXECUTE FUNCTION row_changes_log('{table}')"
+        )
+
+
+def uninstall(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for table in TABLES:
+        schema_editor.execute(f'DROP TRIGGER IF EXISTS {table}_row_changes ON {table}')
+    schema_editor.execute('DROP FUNCTION IF EXISTS row_changes_log()')
+    schema_editor.execute('DROP TABLE IF EXISTS row_changes')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_booking_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RowChange',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('table_name', models.CharField(max_length=63)),
+                ('row_id', models.BigIntegerField()),
+                ('changed_at', models.DateTimeField()),
+            ],
+            options={
+                'db_table': 'row_changes',
+                'managed': False,
+            },
+        ),
+        migrations.RunPython(install, uninstall),
+    ]
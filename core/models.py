@@ -79,6 +79,9 @@ class Patient(models.Model):
     phone = models.CharField(max_length=20)
 
     user = models.OneToOneField(User, models.DO_NOTHING, blank=True, null=True)
+    updated_at = models.DateTimeField(auto_now=True, blank=True, null=True, db_index=True)
+    # Телефон только цифрами (см. core.patient_search.normalize_phone), для поиска
+    phone_digits = models.CharField(max_length=20, blank=True, default='', editable=False)
 
     class Meta:
         managed = True
@@ -89,6 +92,17 @@ class Patient(models.Model):
     def __str__(self):
         return self.full_name
 
+    def save(self, *args, **kwargs):
+        from .patient_search import normalize_phone
+        self.phone_digits = normalize_phone(self.phone)
+        update_fields = kwargs.get('update_fields')
+        if update_fields:
+            # auto_now заполняет updated_at, но с update_fields пишутся только
+            # перечисленные поля — без него инкрементальный бэкап пропустит изменение
+            extra = {'updated_at', 'phone_digits'} if 'phone' in update_fields else {'updated_at'}
+            kwargs['update_fields'] = {*update_fields, *extra}
+        super().save(*args, **kwargs)
+
 class Diagnosis(models.Model):
     name = models.CharField(max_length=255)
     code_icd = models.CharField(unique=True, max_length=20)
@@ -175,4 +189,152 @@ class PerformedService(models.Model):
         verbose_name_plural = 'Оказанные услуги'
 
     def __str__(self):
-        return f"{self.service} x{self.count}"
\ No newline at end of file
+        return f"{self.service} x{self.count}"
+
+class WorkTemplate(models.Model):
+    WEEKDAYS = [
+        (0, 'Понедельник'),
+        (1, 'Вторник'),
+        (2, 'Среда'),
+        (3, 'Четверг'),
+        (4, 'Пятница'),
+        (5, 'Суббота'),
+        (6, 'Воскресенье'),
+    ]
+
+    doctor = models.ForeignKey(Doctor, models.CASCADE, blank=True, null=True)
+    office = models.ForeignKey(Office, models.CASCADE, blank=True, null=True)
+    weekday = models.PositiveSmallIntegerField(choices=WEEKDAYS)
+    start_time = models.TimeField()
+    end_time = models.TimeField()
+    slot_minutes = models.PositiveSmallIntegerField(default=30)
+
+    class Meta:
+        managed = True
+        db_table = 'work_templates'
+        verbose_name = 'Шаблон графика'
+        verbose_name_plural = 'Шаблоны графика'
+        constraints = [
+            models.CheckConstraint(
+                condition=models.Q(doctor__isnull=False) | models.Q(office__isnull=False),
+                name='work_template_owner',
+            ),
+        ]
+
+    def __str__(self):
+        owner = self.doctor or self.office
+        return f"{owner}: {self.get_weekday_display()} {self.start_time:%H:%M}–{self.end_time:%H:%M}"
+
+
+class ScheduleException(models.Model):
+    doctor = models.ForeignKey(Doctor, models.CASCADE, blank=True, null=True)
+    office = models.ForeignKey(Office, models.CASCADE, blank=True, null=True)
+    date = models.DateField()
+    # Пустое время начала/окончания означает выходной день
+    start_time = models.TimeField(blank=True, null=True)
+    end_time = models.TimeField(blank=True, null=True)
+    slot_minutes = models.PositiveSmallIntegerField(blank=True, null=True)
+    reason = models.CharField(max_length=200, blank=True)
+
+    class Meta:
+        managed = True
+        db_table = 'schedule_exceptions'
+        verbose_name = 'Исключение в графике'
+        verbose_name_plural = 'Исключения в графике'
+        constraints = [
+            models.CheckConstraint(
+                condition=models.Q(doctor__isnull=False) | models.Q(office__isnull=False),
+                name='schedule_exception_owner',
+            ),
+        ]
+
+    @property
+    def is_day_off(self):
+        return self.start_time is None or self.end_time is None
+
+    def __str__(self):
+        owner = self.doctor or self.office
+        if self.is_day_off:
+            return f"{owner}: {self.date:%d.%m.%Y} выходной"
+        return f"{owner}: {self.date:%d.%m.%Y} {self.start_time:%H:%M}–{self.end_time:%H:%M}"
+
+
+class DoctorDailyStats(models.Model):
+    doctor = models.ForeignKey(Doctor, models.CASCADE)
+    day = models.DateField()
+    # Пустая строка — записи без статуса
+    status = models.CharField(max_length=50, blank=True)
+    visit_count = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+
+    class Meta:
+        managed = True
+        db_table = 'doctor_daily_stats'
+        verbose_name = 'Статистика врача за день'
+        verbose_name_plural = 'Статистика врачей по дням'
+        constraints = [
+            models.UniqueConstraint(fields=['doctor', 'day', 'status'], name='doctor_daily_stats_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['day', 'status']),
+        ]
+
+    def __str__(self):
+        return f"{self.doctor} {self.day:%d.%m.%Y} {self.status}: {self.visit_count}"
+
+
+class ExportJob(models.Model):
+    STATUS_PENDING = 'pending'
+    STATUS_RUNNING = 'running'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+    STATUSES = [
+        (STATUS_PENDING, 'В очереди'),
+        (STATUS_RUNNING, 'Выполняется'),
+        (STATUS_DONE, 'Готово'),
+        (STATUS_FAILED, 'Ошибка'),
+    ]
+
+    kind = models.CharField(max_length=50)
+    params = models.JSONField(default=dict)
+    params_hash = models.CharField(max_length=64, db_index=True)
+    status = models.CharField(max_length=20, choices=STATUSES, default=STATUS_PENDING)
+    progress = models.IntegerField(default=0)
+    total = models.IntegerField(blank=True, null=True)
+    file_path = models.CharField(max_length=255, blank=True)
+    error = models.TextField(blank=True)
+    requested_by = models.ForeignKey(User, models.SET_NULL, blank=True, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(blank=True, null=True)
+    finished_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        managed = True
+        db_table = 'export_jobs'
+        verbose_name = 'Задание выгрузки'
+        verbose_name_plural = 'Задания выгрузки'
+        indexes = [
+            models.Index(fields=['status', 'created_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} #{self.id} ({self.get_status_display()})"
+
+
+class RowChange(models.Model):
+    """Журнал изменений и удалений строк для инкрементальных бэкапов (core.backups).
+
+    Заполняется триггерами миграции 0010_row_changes (только PostgreSQL); новые
+    строки в журнал не пишутся — их находит водяной знак id снимка.
+    """
+
+    table_name = models.CharField(max_length=63)
+    row_id = models.BigIntegerField()
+    changed_at = models.DateTimeField()
+
+    class Meta:
+        managed = False
+        db_table = 'row_changes'
+
+    def __str__(self):
+        return f"{self.table_name} #{self.row_id} {self.changed_at:%d.%m.%Y %H:%M}"
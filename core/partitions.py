@@ -0,0 +1,91 @@
+from datetime import date, timedelta
+
+from django.db import connection, transaction
+
+# Таблица записей на прием разбита на помесячные секции по date_time
+# (миграция 0008_booking_partitions, только PostgreSQL): запросы с диапазоном
+# дат читают одну-две секции. Секции на будущие месяцы заранее создает
+# команда create_partitions; строки вне созданных секций попадают в DEFAULT.
+
+TABLE = 'appointment_bookings'
+DEFAULT_PARTITION = f'{TABLE}_default'
+
+
+def month_start(day):
+    return day.replace(day=1)
+
+
+def next_month(month):
+    return (month.replace(day=28) + timedelta(days=4)).replace(day=1)
+
+
+def months(first, last):
+    """Первые числа месяцев от first до last включительно."""
+    month = month_start(first)
+    while month <= last:
+        yield month
+        month = next_month(month)
+
+
+def partition_name(month):
+    return f'{TABLE}_p{month:%Y%m}'
+
+
+def is_partitioned(cursor):
+    cursor.execute('SELECT EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(%s))', [TABLE])
+    return cursor.fetchone()[0]
+
+
+def existing_partitions(cursor):
+    cursor.execute("""
+        SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = to_regclass(%s)
+    """, [TABLE])
+    return {name for (name,) in cursor.fetchall()}
+
+
+def create_partition(cursor, month):
+    """Секция месяца; строки этого месяца из DEFAULT-секции переносятся в нее.
+
+    Вызывается в транзакции: PostgreSQL не даст создать секцию,
+    пока подходящие ей строки лежат в DEFAULT.
+    """
+    start, end = month, next_month(month)
+    cursor.execute(f'CREATE TEMP TABLE moved_bookings (LIKE {TABLE})')
+    cursor.execute(f"""
+        WITH moved AS (
+            DELETE FROM {DEFAULT_PARTITION} WHERE date_time >= %s AND date_time < %s RETURNING *
+        )
+        INSERT INTO moved_bookings SELECT * FROM moved
+    """, [start, end])
+    cursor.execute(
+        f"CREATE TABLE {partition_name(month)} PARTITION OF {TABLE} "
+        f"FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')"
+    )
+    cursor.execute(f'INSERT INTO {TABLE} SELECT * FROM moved_bookings')
+    moved = cursor.rowcount
+    cursor.execute('DROP TABLE moved_bookings')
+    return moved
+
+
+def ensure_partitions(months_ahead=3, today=None):
+    """Создать недостающие секции с текущего месяца на months_ahead вперед.
+
+    Возвращает [(имя секции, перенесено строк из DEFAULT)].
+    """
+    today = today or date.today()
+    last = month_start(today)
+    for _ in range(months_ahead):
+        last = next_month(last)
+
+    created = []
+    with connection.cursor() as cursor:
+        if not is_partitioned(cursor):
+            return None
+        present = existing_partitions(cursor)
+        for month in months(today, last):
+            if partition_name(month) in present:
+                continue
+            with transaction.atomic():
+                created.append((partition_name(month), create_partition(cursor, month)))
+    return created
@@ -0,0 +1,83 @@
+import re
+
+from django.db import connection
+from django.db.models import Case, IntegerField, Q, Value, When
+
+from .models import Patient
+
+# Поиск пациентов для регистратуры и админки. В PostgreSQL запросы
+# ILIKE '%...%' и похожесть по триграммам обслуживаются GIN-индексами
+# pg_trgm (миграция 0007), поэтому таблица целиком не сканируется.
+# Телефон хранится дополнительно цифрами (phone_digits): номер ищется
+# в любом формате записи, в том числе по последним цифрам.
+
+LIMIT = 20
+MIN_PHONE_DIGITS = 4
+
+_PHONE_RE = re.compile(r'[\d\s()+\-]+')
+
+
+def normalize_phone(value):
+    """Номер только цифрами, российские номера приводятся к виду 7XXXXXXXXXX."""
+    digits = re.sub(r'\D', '', value or '')
+    if len(digits) == 11 and digits[0] == '8':
+        digits = '7' + digits[1:]
+    elif len(digits) == 10 and digits[0] == '9':
+        digits = '7' + digits
+    return digits
+
+
+def _is_phone(query):
+    return bool(_PHONE_RE.fullmatch(query)) and len(re.sub(r'\D', '', query)) >= MIN_PHONE_DIGITS
+
+
+def search(query, queryset=None):
+    """Подходящие пациенты, лучшие совпадения первыми."""
+    if queryset is None:
+        queryset = Patient.objects.all()
+    query = ' '.join(query.split())
+    if not query:
+        return queryset.none()
+
+    card = Q(med_card_number__istartswith=query)
+
+    if _is_phone(query):
+        digits = normalize_phone(query)
+        return (
+            queryset
+            .filter(Q(phone_digits__endswith=digits) | Q(phone_digits=digits) | card)
+            .annotate(rank=Case(
+                When(phone_digits=digits, then=Value(0)),
+                When(med_card_number__iexact=query, then=Value(0)),
+                default=Value(1),
+                output_field=IntegerField(),
+            ))
+            .order_by('rank', 'full_name', 'id')
+        )
+
+    # Все слова запроса должны встречаться в ФИО — в любом порядке
+    words = Q()
+    for word in query.split():
+        words &= Q(full_name__icontains=word)
+    condition = words | card
+
+    exact = Case(
+        When(med_card_number__iexact=query, then=Value(0)),
+        When(full_name__istartswith=query, then=Value(1)),
+        default=Value(2),
+        output_field=IntegerField(),
+    )
+
+    if connection.vendor == 'postgresql':
+        from django.contrib.postgres.search import TrigramWordSimilarity
+
+        # Оператор %> (порог pg_trgm.word_similarity_threshold) использует тот же
+        # GIN-индекс и находит ФИО с опечатками в запросе
+        return (
+            queryset
+            .filter(condition | Q(full_name__trigram_word_similar=query))
+            .annotate(similarity=TrigramWordSimilarity(query, 'full_name'), rank=exact)
+            .order_by('rank', '-similarity', 'full_name', 'id')
+        )
+
+    return queryset.filter(condition).annotate(rank=exact).order_by('rank', 'full_name', 'id')
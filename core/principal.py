@@ -0,0 +1,182 @@
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.http import JsonResponse
+from django.shortcuts import redirect
+
+from .models import User
+from .versioning import get_version, aget_version, bump_version
+
+# Кто выполняет запрос: пользователь, его роль и профиль пациента/врача.
+# Определяется один раз при входе и хранится в сессии; PrincipalMiddleware
+# кладет его в request.principal. Изменение пользователя или профиля
+# (core.signals) увеличивает версию, и данные перечитываются при следующем запросе.
+
+ROLE_ADMIN = 1
+ROLE_DOCTOR = 2
+ROLE_PATIENT = 3
+
+SESSION_KEY = 'principal'
+
+
+def _version_key(user_id):
+    return f'principal:{user_id}:version'
+
+
+class Principal:
+    __slots__ = ('user_id', 'login', 'role_id', 'patient_id', 'doctor_id')
+
+    def __init__(self, user_id, login, role_id, patient_id=None, doctor_id=None):
+        self.user_id = user_id
+        self.login = login
+        self.role_id = role_id
+        self.patient_id = patient_id
+        self.doctor_id = doctor_id
+
+    @property
+    def is_admin(self):
+        return self.role_id == ROLE_ADMIN
+
+    @property
+    def is_doctor(self):
+        return self.role_id == ROLE_DOCTOR
+
+    @property
+    def is_patient(self):
+        return self.role_id == ROLE_PATIENT
+
+    def as_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+def resolve(user):
+    """Principal по пользователю; профили подтягиваются тем же запросом."""
+    patient = getattr(user, 'patient', None)
+    doctor = getattr(user, 'doctor', None)
+    return Principal(
+        user.id, user.login, user.role_id,
+        patient_id=patient.id if patient else None,
+        doctor_id=doctor.id if doctor else None,
+    )
+
+
+def _load(user_id):
+    user = User.objects.select_related('patient', 'doctor').filter(id=user_id).first()
+    return resolve(user) if user else None
+
+
+def login(request, user):
+    principal = resolve(user)
+    request.session.cycle_key()
+    request.session['user_id'] = user.id
+    request.session['role_id'] = user.role_id
+    _remember(request, principal)
+    return principal
+
+
+def _remember(request, principal):
+    request.session[SESSION_KEY] = {'version': get_version(_version_key(principal.user_id)), **principal.as_dict()}
+
+
+def _from_session(cached, user_id, version):
+    if cached and cached['user_id'] == user_id and cached['version'] == version:
+        return Principal(**{name: cached[name] for name in Principal.__slots__})
+    return None
+
+
+def get_principal(request):
+    user_id = request.session.get('user_id')
+    if not user_id:
+        return None
+
+    principal = _from_session(request.session.get(SESSION_KEY), user_id, get_version(_version_key(user_id)))
+    if principal is not None:
+        return principal
+
+    principal = _load(user_id)
+    if principal is None:
+        request.session.flush()
+        return None
+    request.session['role_id'] = principal.role_id
+    _remember(request, principal)
+    return principal
+
+
+async def aget_principal(request):
+    """То же, что get_principal(), без блокирующих обращений к сессии и БД (ASGI)."""
+    user_id = await request.session.aget('user_id')
+    if not user_id:
+        return None
+
+    version = await aget_version(_version_key(user_id))
+    principal = _from_session(await request.session.aget(SESSION_KEY), user_id, version)
+    if principal is not None:
+        return principal
+
+    user = await User.objects.select_related('patient', 'doctor').filter(id=user_id).afirst()
+    if user is None:
+        await request.session.aflush()
+        return None
+    principal = resolve(user)
+    await request.session.aset('role_id', principal.role_id)
+    await request.session.aset(SESSION_KEY, {'version': version, **principal.as_dict()})
+    return principal
+
+
+def invalidate(user_id):
+    if user_id:
+        bump_version(_version_key(user_id))
+
+
+class PrincipalMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        request.principal = get_principal(request)
+        return self.get_response(request)
+
+    async def __acall__(self, request):
+        request.principal = await aget_principal(request)
+        return await self.get_response(request)
+
+
+def role_required(*roles, api=False):
+    """Пускает только вошедших пользователей с одной из ролей (без ролей — любого вошедшего).
+
+    Для страниц — редирект на вход или на главную, для api=True — JSON 401/403.
+    Асинхронное представление остается асинхронным.
+    """
+    def denied(request):
+        principal = request.principal
+        if principal is None:
+            return JsonResponse({'error': 'unauthorized'}, status=401) if api else redirect('login')
+        if roles and principal.role_id not in roles:
+            return JsonResponse({'error': 'forbidden'}, status=403) if api else redirect('dashboard')
+        return None
+
+    def decorator(view):
+        if iscoroutinefunction(view):
+            @wraps(view)
+            async def async_wrapper(request, *args, **kwargs):
+                response = denied(request)
+                if response is None:
+                    response = await view(request, *args, **kwargs)
+                return response
+            return async_wrapper
+
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            response = denied(request)
+            if response is None:
+                response = view(request, *args, **kwargs)
+            return response
+        return wrapper
+    return decorator
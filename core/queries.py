@@ -0,0 +1,70 @@
+from datetime import date, datetime, time
+
+from django.db.models import Prefetch, Q
+
+from .models import AppointmentBooking, Appointment, Doctor, PerformedService
+
+# Планы выборки для страниц: все связи, к которым обращаются шаблоны,
+# подтягиваются заранее, число запросов не зависит от количества записей.
+
+PAGE_SIZE = 20
+
+
+def performed_services_prefetch(lookup='performedservice_set'):
+    return Prefetch(lookup, queryset=PerformedService.objects.select_related('service'))
+
+
+def dashboard_doctor(doctor_id):
+    return Doctor.objects.select_related('specialization', 'office').get(id=doctor_id)
+
+
+def patient_history(patient):
+    return (
+        AppointmentBooking.objects
+        .filter(patient=patient)
+        .select_related('doctor__specialization')
+        .order_by('-date_time', '-id')
+    )
+
+
+def doctor_history(doctor, past=False, today=None):
+    """Записи врача с начала сегодняшнего дня по возрастанию, при past — прошедшие, новые сверху."""
+    start = datetime.combine(today or date.today(), time.min)
+    queryset = AppointmentBooking.objects.filter(doctor=doctor).select_related('patient')
+    if past:
+        return queryset.filter(date_time__lt=start).order_by('-date_time', '-id')
+    return queryset.filter(date_time__gte=start).order_by('date_time', 'id')
+
+
+def visit_details(booking_id):
+    return (
+        Appointment.objects
+        .select_related('diagnosis', 'booking')
+        .prefetch_related(performed_services_prefetch())
+        .filter(booking_id=booking_id)
+        .first()
+    )
+
+
+def encode_cursor(booking):
+    return f'{booking.date_time.isoformat()}_{booking.id}'
+
+
+def decode_cursor(cursor):
+    """Курсор вида '<date_time>_<id>'; ValueError при неверном формате."""
+    dt_str, _, id_str = cursor.partition('_')
+    return datetime.fromisoformat(dt_str), int(id_str)
+
+
+def keyset_page(queryset, cursor=None, size=PAGE_SIZE):
+    """Страница после курсора по (date_time, id) в порядке сортировки queryset."""
+    if cursor:
+        dt, pk = decode_cursor(cursor)
+        if queryset.query.order_by[0].startswith('-'):
+            queryset = queryset.filter(Q(date_time__lt=dt) | Q(date_time=dt, id__lt=pk))
+        else:
+            queryset = queryset.filter(Q(date_time__gt=dt) | Q(date_time=dt, id__gt=pk))
+
+    rows = list(queryset[:size + 1])
+    next_cursor = encode_cursor(rows[size - 1]) if len(rows) > size else None
+    return rows[:size], next_cursor
@@ -0,0 +1,98 @@
+from collections import defaultdict
+
+from django.core.cache import cache
+
+from .models import Specialization, Doctor, Diagnosis, Service
+from .versioning import get_version, aget_version, bump_version
+
+# Справочники, которые меняются только из админки: хранятся в памяти процесса
+# и в общем кэше под номером версии. Сигналы (core.signals) увеличивают версию,
+# после чего каждый процесс один раз перечитывает таблицу.
+
+QUERYSETS = {
+    'specializations': lambda: Specialization.objects.order_by('name'),
+    'doctors': lambda: Doctor.objects.select_related('specialization').order_by('full_name'),
+    'diagnoses': lambda: Diagnosis.objects.order_by('code_icd'),
+    'services': lambda: Service.objects.order_by('name'),
+}
+
+CACHE_TIMEOUT = 60 * 60 * 24
+
+
+class RefTable:
+    def __init__(self, version, rows):
+        self.version = version
+        self.rows = rows
+        self.by_id = {row.pk: row for row in rows}
+
+    def get(self, pk):
+        """Строка по первичному ключу или None (ключ может прийти строкой из формы)."""
+        try:
+            return self.by_id.get(int(pk))
+        except (TypeError, ValueError):
+            return None
+
+
+class DoctorTable(RefTable):
+    def __init__(self, version, rows):
+        super().__init__(version, rows)
+        self.by_specialization = defaultdict(list)
+        for row in rows:
+            self.by_specialization[row.specialization_id].append(row)
+
+
+TABLE_CLASSES = {'doctors': DoctorTable}
+
+_local = {}
+
+
+def _version_key(name):
+    return f'refdata:{name}:version'
+
+
+def version(name):
+    return get_version(_version_key(name))
+
+
+async def aversion(name):
+    return await aget_version(_version_key(name))
+
+
+def _store(name, current, rows):
+    table = TABLE_CLASSES.get(name, RefTable)(current, rows)
+    _local[name] = table
+    return table
+
+
+def get(name):
+    current = version(name)
+    table = _local.get(name)
+    if table is not None and table.version == current:
+        return table
+
+    data_key = f'refdata:{name}:{current}'
+    rows = cache.get(data_key)
+    if rows is None:
+        rows = list(QUERYSETS[name]())
+        cache.set(data_key, rows, CACHE_TIMEOUT)
+    return _store(name, current, rows)
+
+
+async def aget(name):
+    """То же, что get(), для асинхронных представлений."""
+    current = await aversion(name)
+    table = _local.get(name)
+    if table is not None and table.version == current:
+        return table
+
+    data_key = f'refdata:{name}:{current}'
+    rows = await cache.aget(data_key)
+    if rows is None:
+        rows = [row async for row in QUERYSETS[name]()]
+        await cache.aset(data_key, rows, CACHE_TIMEOUT)
+    return _store(name, current, rows)
+
+
+def invalidate(*names):
+    for name in names:
+        bump_version(_version_key(name))
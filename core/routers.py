@@ -0,0 +1,57 @@
+from contextlib import ContextDecorator
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import connections
+
+# Чтение с реплики включается явно — декоратором/контекстом use_replica для
+# представлений и выгрузок, которым не страшно небольшое отставание.
+# Без настроенной реплики (DB_REPLICA_HOST) все идет в default.
+
+REPLICA = 'replica'
+
+_use_replica = ContextVar('use_replica', default=False)
+
+
+class use_replica(ContextDecorator):
+    def _recreate_cm(self):
+        # Один экземпляр-декоратор обслуживает параллельные запросы — токен у каждого свой
+        return type(self)()
+
+    def __enter__(self):
+        self._token = _use_replica.set(True)
+        return self
+
+    def __exit__(self, *exc):
+        _use_replica.reset(self._token)
+        return False
+
+
+def read_db():
+    """Алиас БД для чтения в текущем контексте."""
+    if (
+        _use_replica.get()
+        and REPLICA in settings.DATABASES
+        # Внутри транзакции читаем свои же изменения с основной БД
+        and not connections['default'].in_atomic_block
+    ):
+        return REPLICA
+    return 'default'
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        # Сессии, пользователи Django и прочие служебные таблицы — всегда с основной БД
+        if model._meta.app_label != 'core':
+            return None
+        alias = read_db()
+        return alias if alias != 'default' else None
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == 'default'
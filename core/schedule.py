@@ -0,0 +1,119 @@
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+from .models import Doctor, WorkTemplate, ScheduleException
+from .versioning import get_version, aget_version, bump_version
+
+VERSION_KEY = 'schedule:version'
+
+DEFAULT_SCHEDULE = {
+    'start': '09:00',
+    'end': '18:00',
+    'slot_minutes': 30,
+    'weekdays': [0, 1, 2, 3, 4, 5, 6],
+}
+
+
+def _minutes(value):
+    if isinstance(value, str):
+        value = datetime.strptime(value, '%H:%M').time()
+    return value.hour * 60 + value.minute
+
+
+class Calendar:
+    """Скомпилированный график: интервалы приема (начало, конец, шаг в минутах) по врачам и дням."""
+
+    def __init__(self, doctor_offices, templates, exceptions, default):
+        self.doctor_offices = doctor_offices
+        self.templates = templates
+        self.exceptions = exceptions
+        self.default = default
+
+    def intervals(self, doctor_id, day):
+        office_id = self.doctor_offices.get(doctor_id)
+        for owner in (('doctor', doctor_id), ('office', office_id)):
+            if (owner, day) in self.exceptions:
+                return self.exceptions[(owner, day)]
+        for owner in (('doctor', doctor_id), ('office', office_id)):
+            if owner in self.templates:
+                return self.templates[owner].get(day.weekday(), ())
+        return self.default.get(day.weekday(), ())
+
+    def slot_starts(self, doctor_id, day):
+        """Начала слотов дня в минутах от полуночи."""
+        starts = []
+        for start, end, step in self.intervals(doctor_id, day):
+            starts.extend((minute, step) for minute in range(start, end - step + 1, step))
+        return starts
+
+    def working_days(self, doctor_id, start, days):
+        dates = (start + timedelta(days=i) for i in range(days))
+        return [day for day in dates if self.intervals(doctor_id, day)]
+
+
+def horizon_days():
+    return getattr(settings, 'BOOKING_HORIZON_DAYS', 90)
+
+
+def bookable(day, today=None):
+    """День в окне записи: с сегодняшнего на BOOKING_HORIZON_DAYS дней вперед."""
+    today = today or date.today()
+    return today <= day < today + timedelta(days=horizon_days())
+
+
+def compile_calendar():
+    config = getattr(settings, 'CLINIC_DEFAULT_SCHEDULE', DEFAULT_SCHEDULE)
+    default_interval = (_minutes(config['start']), _minutes(config['end']), config['slot_minutes'])
+    default = {weekday: (default_interval,) for weekday in config['weekdays']}
+
+    templates = defaultdict(lambda: defaultdict(list))
+    for t in WorkTemplate.objects.all():
+        owner = ('doctor', t.doctor_id) if t.doctor_id else ('office', t.office_id)
+        templates[owner][t.weekday].append((_minutes(t.start_time), _minutes(t.end_time), t.slot_minutes))
+
+    exceptions = defaultdict(list)
+    # Прошедшие исключения не нужны: запись возможна только начиная с сегодняшнего дня
+    for e in ScheduleException.objects.filter(date__gte=date.today()):
+        owner = ('doctor', e.doctor_id) if e.doctor_id else ('office', e.office_id)
+        intervals = exceptions[(owner, e.date)]
+        if not e.is_day_off:
+            step = e.slot_minutes or config['slot_minutes']
+            intervals.append((_minutes(e.start_time), _minutes(e.end_time), step))
+
+    doctor_offices = dict(Doctor.objects.values_list('id', 'office_id'))
+
+    return Calendar(
+        doctor_offices,
+        {owner: {wd: tuple(sorted(iv)) for wd, iv in days.items()} for owner, days in templates.items()},
+        {key: tuple(sorted(iv)) for key, iv in exceptions.items()},
+        default,
+    )
+
+
+_compiled = {'version': None, 'calendar': None}
+
+
+def get_calendar():
+    """График процесса; перекомпилируется, когда изменилась версия в общем кэше."""
+    version = get_version(VERSION_KEY)
+    if _compiled['version'] != version:
+        _compiled['calendar'] = compile_calendar()
+        _compiled['version'] = version
+    return _compiled['calendar']
+
+
+async def aget_calendar():
+    version = await aget_version(VERSION_KEY)
+    if _compiled['version'] != version:
+        # Перекомпиляция редкая (после правки графика) — выполняем в потоке синхронно
+        calendar = await sync_to_async(compile_calendar)()
+        _compiled['calendar'] = calendar
+        _compiled['version'] = version
+    return _compiled['calendar']
+
+
+def invalidate():
+    bump_version(VERSION_KEY)
@@ -0,0 +1,117 @@
+from functools import partial
+
+from django.db import transaction
+from django.db.models.signals import post_init, post_save, post_delete
+from django.dispatch import receiver
+
+from . import events, principal, refcache, schedule, slots, stats
+from .models import (
+    AppointmentBooking, Doctor, WorkTemplate, ScheduleException,
+    Specialization, Diagnosis, Service, User, Patient
+)
+
+
+def _slot_state(instance):
+    # __dict__, чтобы не провоцировать запрос для отложенных (.only/.defer) полей
+    return instance.__dict__.get('doctor_id'), instance.__dict__.get('date_time'), instance.__dict__.get('status')
+
+
+@receiver(post_init, sender=AppointmentBooking)
+def remember_booking_slot(sender, instance, **kwargs):
+    instance._slot_origin = _slot_state(instance)
+
+
+@receiver(post_save, sender=AppointmentBooking)
+def booking_saved(sender, instance, created, **kwargs):
+    old_doctor_id, old_dt, old_status = instance._slot_origin
+    doctor_id, dt, status = _slot_state(instance)
+
+    # Версия дня в кэше слотов увеличивается после коммита: иначе параллельный
+    # запрос успеет закэшировать маску без этой записи (или с откаченной)
+    if not created and old_dt and (old_doctor_id, old_dt) != (doctor_id, dt):
+        transaction.on_commit(partial(slots.invalidate, old_doctor_id, old_dt.date()))
+        stats.refresh_after_commit(old_doctor_id, old_dt.date())
+
+    transaction.on_commit(partial(slots.invalidate, doctor_id, dt.date()))
+
+    stats.refresh_after_commit(doctor_id, dt.date())
+    _publish_slot_events(created, (old_doctor_id, old_dt, old_status), (doctor_id, dt, status))
+    instance._slot_origin = (doctor_id, dt, status)
+
+
+def _publish_slot_events(created, old, new):
+    # Страница записи узнает о слотах, которые заняли или освободили другие
+    old_doctor_id, old_dt, old_status = old
+    doctor_id, dt, status = new
+    was_active = not created and old_dt is not None and old_status != 'Canceled'
+    active = status != 'Canceled'
+    moved = was_active and (old_doctor_id, old_dt) != (doctor_id, dt)
+
+    if was_active and (moved or not active):
+        transaction.on_commit(partial(events.publish, old_doctor_id, old_dt, events.RELEASED))
+    if active and (not was_active or moved):
+        transaction.on_commit(partial(events.publish, doctor_id, dt, events.TAKEN))
+
+
+@receiver(post_delete, sender=AppointmentBooking)
+def booking_deleted(sender, instance, **kwargs):
+    if instance.date_time:
+        transaction.on_commit(partial(slots.invalidate, instance.doctor_id, instance.date_time.date()))
+        stats.refresh_after_commit(instance.doctor_id, instance.date_time.date())
+        if instance.__dict__.get('status') != 'Canceled':
+            transaction.on_commit(partial(events.publish, instance.doctor_id, instance.date_time, events.RELEASED))
+
+
+@receiver([post_save, post_delete], sender=WorkTemplate)
+@receiver([post_save, post_delete], sender=ScheduleException)
+@receiver([post_save, post_delete], sender=Doctor)
+def invalidate_schedule(sender, **kwargs):
+    # После коммита: иначе другой процесс перекомпилирует график до коммита
+    # и будет держать старую копию под уже новой версией
+    transaction.on_commit(schedule.invalidate)
+
+
+
+# Версии справочников и пользователей повышаются после коммита: иначе другой
+# запрос успеет перечитать еще старые строки и закэширует их под новой версией
+
+@receiver([post_save, post_delete], sender=Specialization)
+def invalidate_specializations(sender, **kwargs):
+    # Подпись врача в списках включает специализацию
+    transaction.on_commit(partial(refcache.invalidate, 'specializations', 'doctors'))
+
+
+@receiver([post_save, post_delete], sender=Doctor)
+def invalidate_doctors(sender, **kwargs):
+    transaction.on_commit(partial(refcache.invalidate, 'doctors'))
+
+
+@receiver([post_save, post_delete], sender=Diagnosis)
+def invalidate_diagnoses(sender, **kwargs):
+    transaction.on_commit(partial(refcache.invalidate, 'diagnoses'))
+
+
+@receiver([post_save, post_delete], sender=Service)
+def invalidate_services(sender, **kwargs):
+    transaction.on_commit(partial(refcache.invalidate, 'services'))
+
+
+
+@receiver(post_init, sender=Patient)
+@receiver(post_init, sender=Doctor)
+def remember_profile_owner(sender, instance, **kwargs):
+    instance._owner_origin = instance.__dict__.get('user_id')
+
+
+@receiver([post_save, post_delete], sender=Patient)
+@receiver([post_save, post_delete], sender=Doctor)
+def invalidate_profile_owner(sender, instance, **kwargs):
+    # Профиль мог перейти к другому пользователю — сбрасываем обоих
+    for user_id in {getattr(instance, '_owner_origin', None), instance.user_id}:
+        transaction.on_commit(partial(principal.invalidate, user_id))
+    instance._owner_origin = instance.user_id
+
+
+@receiver([post_save, post_delete], sender=User)
+def invalidate_user(sender, instance, **kwargs):
+    transaction.on_commit(partial(principal.invalidate, instance.id))
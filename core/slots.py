@@ -0,0 +1,142 @@
+import time as clock
+from datetime import datetime, time, timedelta
+
+from django.core.cache import cache
+
+from .models import AppointmentBooking
+from .schedule import get_calendar, aget_calendar
+
+# Индекс занятости: на каждую пару (врач, день) хранится битовая маска,
+# один бит на каждые GRID_MINUTES минут суток (бит выставлен, если в это время начинается запись).
+# Маска лежит под ключом с версией дня: изменение записи увеличивает версию после коммита,
+# и маска, прочитанная из БД до этого коммита, сохраняется под устаревшим ключом,
+# который больше никто не читает. Побитовой правки общего ключа (чтение-изменение-запись) нет.
+GRID_MINUTES = 5
+CACHE_TIMEOUT = 60 * 60 * 24
+
+
+def _version_key(doctor_id, day):
+    return f'slots:{doctor_id}:{day.isoformat()}:version'
+
+
+def _key(doctor_id, day, version):
+    return f'slots:{doctor_id}:{day.isoformat()}:{version}'
+
+
+def _bit(dt):
+    return 1 << ((dt.hour * 60 + dt.minute) // GRID_MINUTES)
+
+
+def _window(start_minute, length):
+    cells = max(1, length // GRID_MINUTES)
+    return ((1 << cells) - 1) << (start_minute // GRID_MINUTES)
+
+
+def _busy_rows(doctor_id, missing):
+    return AppointmentBooking.objects.filter(
+        doctor_id=doctor_id,
+        date_time__gte=datetime.combine(min(missing), time.min),
+        date_time__lt=datetime.combine(max(missing) + timedelta(days=1), time.min),
+    ).exclude(status='Canceled').values_list('date_time', flat=True)
+
+
+def _masks(missing, rows):
+    loaded = dict.fromkeys(missing, 0)
+    for dt in rows:
+        if dt.date() in loaded:
+            loaded[dt.date()] |= _bit(dt)
+    return loaded
+
+
+def _versions(doctor_id, days):
+    keys = {_version_key(doctor_id, day): day for day in days}
+    versions = {keys[k]: version for k, version in cache.get_many(list(keys)).items()}
+    for key, day in keys.items():
+        if day not in versions:
+            # add внутри get_or_set не перезапишет версию, выставленную параллельно
+            versions[day] = cache.get_or_set(key, clock.time_ns, CACHE_TIMEOUT)
+    return versions
+
+
+async def _aversions(doctor_id, days):
+    keys = {_version_key(doctor_id, day): day for day in days}
+    versions = {keys[k]: version for k, version in (await cache.aget_many(list(keys))).items()}
+    for key, day in keys.items():
+        if day not in versions:
+            versions[day] = await cache.aget_or_set(key, clock.time_ns, CACHE_TIMEOUT)
+    return versions
+
+
+def busy_masks(doctor_id, days):
+    """Маски занятости по дням. Отсутствующие в кэше дни подгружаются одним запросом."""
+    if not days:
+        return {}
+    # Версии читаются до запроса к БД: если запись изменится во время чтения,
+    # ее коммит увеличит версию и загруженная маска не будет использована
+    keys = {_key(doctor_id, day, version): day for day, version in _versions(doctor_id, days).items()}
+    result = {keys[k]: mask for k, mask in cache.get_many(list(keys)).items()}
+
+    missing = [day for day in days if day not in result]
+    if missing:
+        loaded = _masks(missing, _busy_rows(doctor_id, missing))
+        cache.set_many({k: loaded[day] for k, day in keys.items() if day in loaded}, CACHE_TIMEOUT)
+        result.update(loaded)
+
+    return result
+
+
+async def abusy_masks(doctor_id, days):
+    if not days:
+        return {}
+    keys = {_key(doctor_id, day, version): day for day, version in (await _aversions(doctor_id, days)).items()}
+    result = {keys[k]: mask for k, mask in (await cache.aget_many(list(keys))).items()}
+
+    missing = [day for day in days if day not in result]
+    if missing:
+        loaded = _masks(missing, [dt async for dt in _busy_rows(doctor_id, missing)])
+        await cache.aset_many({k: loaded[day] for k, day in keys.items() if day in loaded}, CACHE_TIMEOUT)
+        result.update(loaded)
+
+    return result
+
+
+def _free_in_mask(mask, starts):
+    return [
+        f'{minute // 60:02d}:{minute % 60:02d}'
+        for minute, step in starts
+        if not mask & _window(minute, step)
+    ]
+
+
+def free_slots(doctor_id, day):
+    starts = get_calendar().slot_starts(doctor_id, day)
+    # Неприемный день: отвечаем без обращения к кэшу и БД
+    if not starts:
+        return []
+    return _free_in_mask(busy_masks(doctor_id, [day])[day], starts)
+
+
+async def afree_slots(doctor_id, day):
+    starts = (await aget_calendar()).slot_starts(doctor_id, day)
+    if not starts:
+        return []
+    return _free_in_mask((await abusy_masks(doctor_id, [day]))[day], starts)
+
+
+def free_slots_range(doctor_id, start, days):
+    calendar = get_calendar()
+    dates = [start + timedelta(days=i) for i in range(days)]
+    starts = {day: calendar.slot_starts(doctor_id, day) for day in dates}
+
+    masks = busy_masks(doctor_id, [day for day, day_starts in starts.items() if day_starts])
+    return {day: _free_in_mask(masks[day], day_starts) if day_starts else [] for day, day_starts in starts.items()}
+
+
+def invalidate(doctor_id, day):
+    """Вызывается после коммита изменения записи на этот день (создание, перенос, отмена)."""
+    key = _version_key(doctor_id, day)
+    try:
+        cache.incr(key)
+    except ValueError:
+        # Версия вытеснена — новое уникальное значение не совпадет ни с одной прежней
+        cache.set(key, clock.time_ns(), CACHE_TIMEOUT)
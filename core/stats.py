@@ -0,0 +1,84 @@
+import logging
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Count, DecimalField, ExpressionWrapper, F, Sum, Value
+from django.db.models.functions import Coalesce, TruncDate
+
+from .models import AppointmentBooking, DoctorDailyStats
+
+logger = logging.getLogger(__name__)
+
+# Сводная статистика по (врач, день, статус) пересчитывается целиком для
+# затронутого диапазона: при изменении записи — один день одного врача,
+# командой refresh_stats — произвольный период.
+
+_REVENUE = ExpressionWrapper(
+    F('appointment__performedservice__service__cost')
+    * Coalesce(F('appointment__performedservice__count'), Value(1)),
+    output_field=DecimalField(max_digits=12, decimal_places=2),
+)
+
+
+def daily_rows(date_from, date_to, doctor_id=None):
+    """Агрегаты (врач, день, статус) по записям за дни [date_from, date_to]."""
+    bookings = AppointmentBooking.objects.filter(
+        date_time__gte=datetime.combine(date_from, time.min),
+        date_time__lt=datetime.combine(date_to + timedelta(days=1), time.min),
+    )
+    if doctor_id is not None:
+        bookings = bookings.filter(doctor_id=doctor_id)
+    return (
+        bookings
+        .values('doctor_id', day=TruncDate('date_time'), status_key=Coalesce('status', Value('')))
+        .annotate(
+            visits=Count('id', distinct=True),
+            total=Coalesce(Sum(_REVENUE), Value(Decimal('0')), output_field=DecimalField()),
+        )
+        .order_by()
+    )
+
+
+def refresh(date_from, date_to, doctor_id=None):
+    """Пересчитать статистику за дни [date_from, date_to]."""
+    rows = daily_rows(date_from, date_to, doctor_id)
+    existing = DoctorDailyStats.objects.filter(day__gte=date_from, day__lte=date_to)
+    if doctor_id is not None:
+        existing = existing.filter(doctor_id=doctor_id)
+
+    with transaction.atomic():
+        existing.delete()
+        DoctorDailyStats.objects.bulk_create(
+            [
+                DoctorDailyStats(
+                    doctor_id=row['doctor_id'],
+                    day=row['day'],
+                    status=row['status_key'],
+                    visit_count=row['visits'],
+                    revenue=row['total'],
+                )
+                for row in rows
+            ],
+            batch_size=1000,
+            # Параллельный пересчет того же дня не должен падать на уникальности
+            update_conflicts=True,
+            unique_fields=['doctor', 'day', 'status'],
+            update_fields=['visit_count', 'revenue'],
+        )
+
+
+def refresh_doctor_day(doctor_id, day):
+    refresh(day, day, doctor_id)
+
+
+def refresh_after_commit(doctor_id, day):
+    """Пересчет дня врача после коммита. Сбой только пишется в лог: запись уже
+    сохранена, а статистику догонит следующий пересчет (refresh_stats)."""
+    def callback():
+        try:
+            refresh_doctor_day(doctor_id, day)
+        except Exception:
+            logger.exception('Статистика врача %s за %s не пересчитана', doctor_id, day)
+
+    transaction.on_commit(callback)
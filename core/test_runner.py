@@ -0,0 +1,26 @@
+from django.apps import apps
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+
+class ManagedModelsTestRunner(DiscoverRunner):
+    """Тестовая база создается по моделям.
+
+    Таблицы схемы clinic (managed = False) ведутся вне Django, поэтому на время
+    тестов модели становятся управляемыми, а миграции core (RunSQL только для
+    PostgreSQL: индексы, секционирование) не применяются.
+    """
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self._unmanaged = [model for model in apps.get_app_config('core').get_models() if not model._meta.managed]
+        for model in self._unmanaged:
+            model._meta.managed = True
+        self._no_migrations = override_settings(MIGRATION_MODULES={'core': None})
+        self._no_migrations.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self._no_migrations.disable()
+        for model in self._unmanaged:
+            model._meta.managed = False
+        super().teardown_test_environment(**kwargs)
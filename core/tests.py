@@ -1,3 +1,1083 @@
-from django.test import TestCase
+import asyncio
+import shutil
+import tempfile
+from datetime import datetime, time, timedelta
+from importlib import import_module
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+
+from django.conf import settings
+from django.contrib.auth.hashers import check_password, make_password
+from django.contrib.auth.models import User as AdminUser
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.http import HttpRequest
+from django.test import AsyncRequestFactory, RequestFactory, TestCase, override_settings
+from django.urls import reverse
+
+from . import (
+    backups, credentials, events, jobs, lookup, metrics, patient_search, principal, queries, refcache, schedule, slots, views,
+)
+from .booking import book_slot, SlotTaken, SlotUnavailable
+from .hashers import ClinicPBKDF2PasswordHasher
+from .visits import Visit, VisitError, complete_visits, parse_visit
+from .models import (
+    Role, User, Specialization, Office, Doctor, Patient,
+    Diagnosis, Service, AppointmentBooking, Appointment, Prescription, PerformedService,
+    WorkTemplate, ScheduleException, DoctorDailyStats, ExportJob, RowChange,
+)
+from .principal import ROLE_ADMIN, ROLE_DOCTOR, ROLE_PATIENT
+
+# Тестовая база создается по моделям (core.test_runner.ManagedModelsTestRunner).
+
+
+class ClinicTestCase(TestCase):
+    """Небольшая клиника: администратор, врач и пациент с учетными записями и история записей."""
+
+    HISTORY = 30
+
+    @classmethod
+    def setUpTestData(cls):
+        for role_id, name in ((ROLE_ADMIN, 'admin'), (ROLE_DOCTOR, 'doctor'), (ROLE_PATIENT, 'patient')):
+            Role.objects.create(id=role_id, name=name)
+        cls.admin_user = User.objects.create(login='admin', password='-', role_id=ROLE_ADMIN)
+        cls.doctor_user = User.objects.create(login='doctor', password='-', role_id=ROLE_DOCTOR)
+        cls.patient_user = User.objects.create(login='patient', password='-', role_id=ROLE_PATIENT)
+
+        specialization = Specialization.objects.create(name='Терапевт', accreditation_level='Высшая')
+        cls.office = Office.objects.create(number='101')
+        cls.doctor = Doctor.objects.create(
+            full_name='Иванов Иван', license_number='L-1', user=cls.doctor_user,
+            specialization=specialization, office=cls.office,
+        )
+        cls.patient = Patient.objects.create(
+            full_name='Петров Петр', birth_date='1980-01-01', med_card_number='MC-1',
+            phone='+7 900 000-00-00', user=cls.patient_user,
+        )
+        cls.diagnosis = Diagnosis.objects.create(name='ОРВИ', code_icd='J06')
+        cls.services = [Service.objects.create(name=f'Услуга {i}', cost=100 * i) for i in (1, 2)]
+
+        cls.add_history(cls.patient, time(9))
+
+    @classmethod
+    def add_history(cls, patient, at):
+        """HISTORY ежедневных записей пациента к врачу в одно время: половина в прошлом
+        с проведенным приемом, услугами и назначением, половина предстоит."""
+        start = datetime.combine(datetime.now().date(), at) - timedelta(days=cls.HISTORY // 2)
+        for i in range(cls.HISTORY):
+            dt = start + timedelta(days=i)
+            past = dt < datetime.now()
+            booking = AppointmentBooking.objects.create(
+                patient=patient, doctor=cls.doctor, date_time=dt,
+                status='Completed' if past else 'Scheduled',
+            )
+            if past:
+                visit = Appointment.objects.create(booking=booking, complaints='-', diagnosis=cls.diagnosis)
+                for service in cls.services:
+                    PerformedService.objects.create(appointment=visit, service=service, count=1)
+                Prescription.objects.create(appointment=visit, medication_name='Парацетамол')
+
+    def setUp(self):
+        cache.clear()
+
+    def login(self, user):
+        """Сессия пользователя, как после входа через login_view."""
+        request = HttpRequest()
+        request.session = self.client.session
+        principal.login(request, user)
+        request.session.save()
+        self.client.cookies[settings.SESSION_COOKIE_NAME] = request.session.session_key
+        self.async_client.cookies[settings.SESSION_COOKIE_NAME] = request.session.session_key
+
+
+class PageQueriesTests(ClinicTestCase):
+    """Число запросов страниц не зависит от количества записей (core.queries)."""
+
+    def double_history(self):
+        # Вдвое больше записей у пациента и врача и второй пациент у того же врача
+        self.add_history(self.patient, time(11))
+        other = Patient.objects.create(full_name='Сидоров Сидор', birth_date='1990-01-01', med_card_number='MC-2')
+        self.add_history(other, time(12))
+
+    def assertQueriesIndependent(self, expected, request, grow=None):
+        """Одинаковое число запросов (expected) на исходных данных и после их роста."""
+        # Первый запрос наполняет кэши (принципал, справочники) и не считается
+        request()
+        for step in (None, grow or self.double_history):
+            if step:
+                step()
+            with self.subTest(grown=bool(step)), self.assertNumQueries(expected):
+                response = request()
+            self.assertEqual(response.status_code, 200)
+
+    def test_patient_dashboard(self):
+        self.login(self.patient_user)
+        self.assertQueriesIndependent(3, lambda: self.client.get(reverse('dashboard')))
+
+    def test_doctor_dashboard(self):
+        self.login(self.doctor_user)
+        # Предстоящие и прошедшие записи — по запросу на каждую
+        self.assertQueriesIndependent(4, lambda: self.client.get(reverse('dashboard')))
+
+    def test_patient_history_page(self):
+        self.login(self.patient_user)
+        first = self.client.get(reverse('ajax_history')).json()
+        self.assertQueriesIndependent(2, lambda: self.client.get(reverse('ajax_history'), {'after': first['next']}))
+
+    def test_doctor_history_page(self):
+        self.login(self.doctor_user)
+        self.assertQueriesIndependent(2, lambda: self.client.get(reverse('ajax_history')))
+
+    def test_doctor_past_page(self):
+        self.login(self.doctor_user)
+        self.assertQueriesIndependent(2, lambda: self.client.get(reverse('ajax_history'), {'part': 'past'}))
+
+    def test_visit_details(self):
+        self.login(self.patient_user)
+        visit = Appointment.objects.select_related('booking').first()
+
+        def more_services():
+            # Втрое больше услуг и назначений у приема
+            for i in range(2):
+                for service in self.services:
+                    PerformedService.objects.create(appointment=visit, service=service, count=i + 2)
+                Prescription.objects.create(appointment=visit, medication_name=f'Препарат {i}')
+
+        self.assertQueriesIndependent(
+            4, lambda: self.client.get(reverse('ajax_visit', args=[visit.booking_id])), grow=more_services,
+        )
+
+
+class DoctorHistoryTests(ClinicTestCase):
+
+    def test_upcoming_starts_today(self):
+        today = datetime.combine(datetime.now().date(), time.min)
+        rows, _ = queries.keyset_page(queries.doctor_history(self.doctor), size=5)
+        self.assertEqual(rows[0].date_time.date(), today.date())
+        self.assertEqual([row.date_time for row in rows], sorted(row.date_time for row in rows))
+
+    def test_past_newest_first(self):
+        today = datetime.combine(datetime.now().date(), time.min)
+        rows, cursor = queries.keyset_page(queries.doctor_history(self.doctor, past=True), size=5)
+        self.assertTrue(all(row.date_time < today for row in rows))
+        self.assertEqual(rows[0].date_time.date(), (today - timedelta(days=1)).date())
+        self.assertEqual([row.date_time for row in rows], sorted((row.date_time for row in rows), reverse=True))
+
+        more, _ = queries.keyset_page(queries.doctor_history(self.doctor, past=True), cursor, size=5)
+        self.assertLess(more[0].date_time, rows[-1].date_time)
+
+
+class AdminChangelistQueriesTests(ClinicTestCase):
+    """Списки админки: связи подтягиваются list_select_related, без COUNT(*) всей таблицы."""
+
+    # Сессия, пользователь админки, выборка страницы, подсчет выборки и фильтры боковой панели
+    QUERIES = {
+        Role: 5,
+        User: 6,
+        Specialization: 5,
+        Office: 5,
+        Doctor: 5,
+        Patient: 4,
+        Diagnosis: 5,
+        Service: 5,
+        AppointmentBooking: 8,
+        Appointment: 6,
+        Prescription: 4,
+        PerformedService: 4,
+        WorkTemplate: 5,
+        ScheduleException: 7,
+        DoctorDailyStats: 9,
+        ExportJob: 6,
+    }
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(AdminUser.objects.create_superuser('root', 'root@example.com', '-'))
+
+    def test_changelists(self):
+        for model, queries in self.QUERIES.items():
+            with self.subTest(model=model.__name__):
+                with self.assertNumQueries(queries):
+                    response = self.client.get(reverse(f'admin:core_{model._meta.model_name}_changelist'))
+                self.assertEqual(response.status_code, 200)
+
+    def test_every_changelist_is_covered(self):
+        from django.contrib import admin
+        registered = {model for model in admin.site._registry if model._meta.app_label == 'core'}
+        self.assertEqual(registered, set(self.QUERIES))
+
+
+class MetricsTests(ClinicTestCase):
+
+    def _series(self, histogram, view):
+        counts, count, total = histogram._series.get(view, ([], 0, 0.0))
+        return count, total
+
+    async def test_asgi_sync_view_records_sql(self):
+        # Синхронное представление под ASGI выполняется в потоке sync_to_async со своими соединениями
+        await sync_to_async(self.login)(self.patient_user)
+        before = self._series(metrics.REQUEST_QUERIES, 'dashboard')
+        response = await self.async_client.get(reverse('dashboard'))
+        self.assertEqual(response.status_code, 200)
+
+        count, queries = self._series(metrics.REQUEST_QUERIES, 'dashboard')
+        self.assertEqual(count, before[0] + 1)
+        self.assertEqual(queries - before[1], 3)
+        self.assertGreater(self._series(metrics.REQUEST_TEMPLATE_SECONDS, 'dashboard')[1], 0)
+
+
+class BookSlotTests(ClinicTestCase):
+    """Запись на прием по графику по умолчанию (CLINIC_DEFAULT_SCHEDULE, шаг 30 минут)."""
+
+    def setUp(self):
+        super().setUp()
+        self.tomorrow = datetime.now().date() + timedelta(days=1)
+
+    def at(self, hour, minute=0):
+        return datetime.combine(self.tomorrow, time(hour, minute))
+
+    def test_double_booking(self):
+        booking = book_slot(self.patient, self.doctor.id, self.at(10))
+        self.assertEqual(booking.status, 'Scheduled')
+        with self.assertRaises(SlotTaken):
+            book_slot(self.patient, self.doctor.id, self.at(10))
+        self.assertEqual(AppointmentBooking.objects.filter(doctor=self.doctor, date_time=self.at(10)).count(), 1)
+
+    def test_slot_taken_by_existing_booking(self):
+        # В фикстуре на каждый день записи в 9:00
+        with self.assertRaises(SlotTaken):
+            book_slot(self.patient, self.doctor.id, self.at(9))
+
+    def test_canceled_slot_is_free(self):
+        AppointmentBooking.objects.filter(date_time=self.at(9)).update(status='Canceled')
+        self.assertEqual(book_slot(self.patient, self.doctor.id, self.at(9)).date_time, self.at(9))
+
+    def test_unavailable(self):
+        for dt in (self.at(10, 15), self.at(20), self.at(10) - timedelta(days=2), self.at(10) + timedelta(days=365)):
+            with self.subTest(dt=dt), self.assertRaises(SlotUnavailable):
+                book_slot(self.patient, self.doctor.id, dt)
+        with self.assertRaises(SlotUnavailable):
+            book_slot(self.patient, self.doctor.id + 100, self.at(10))
+
+
+# Хеширование с рабочей стоимостью занимает сотни миллисекунд на пароль
+@mock.patch.object(ClinicPBKDF2PasswordHasher, 'iterations', 1000)
+class CredentialsTests(ClinicTestCase):
+    """Проверка пароля, перехеширование и ограничение попыток входа (core.credentials)."""
+
+    def setUp(self):
+        super().setUp()
+        self.limiters = mock.patch.multiple(
+            credentials,
+            login_limiter=credentials.TokenBucket(10, 10 / 60),
+            ip_limiter=credentials.TokenBucket(100, 100 / 60),
+        )
+        self.limiters.start()
+        self.addCleanup(self.limiters.stop)
+
+    def test_plaintext_upgraded_on_login(self):
+        User.objects.filter(id=self.patient_user.id).update(password='secret')
+        self.assertIsNone(credentials.authenticate('patient', 'wrong'))
+        self.assertEqual(User.objects.get(id=self.patient_user.id).password, 'secret')
+
+        self.assertEqual(credentials.authenticate('patient', 'secret'), self.patient_user)
+        stored = User.objects.get(id=self.patient_user.id).password
+        self.assertTrue(stored.startswith(f'{ClinicPBKDF2PasswordHasher.algorithm}$1000$'))
+        self.assertTrue(check_password('secret', stored))
+        # Открытый пароль больше не принимается как есть
+        self.assertIsNone(credentials.authenticate('patient', stored))
+        self.assertEqual(credentials.authenticate('patient', 'secret'), self.patient_user)
+
+    def test_rehash_on_iterations_change(self):
+        User.objects.filter(id=self.patient_user.id).update(password=make_password('secret'))
+        with mock.patch.object(ClinicPBKDF2PasswordHasher, 'iterations', 1200):
+            self.assertEqual(credentials.authenticate('patient', 'secret'), self.patient_user)
+        self.assertIn('$1200$', User.objects.get(id=self.patient_user.id).password)
+        self.assertIsNone(credentials.authenticate('nobody', 'secret'))
+
+    def request(self, address='198.51.100.7', forwarded=None):
+        extra = {'HTTP_X_FORWARDED_FOR': forwarded} if forwarded else {}
+        return RequestFactory().post('/login/', REMOTE_ADDR=address, **extra)
+
+    def test_limit_per_login(self):
+        # Разные пользователи за одним адресом не мешают друг другу
+        self.assertTrue(all(credentials.login_allowed(self.request(), f'user{i}') for i in range(12)))
+        # Перебор одного логина с разных адресов упирается в лимит логина
+        allowed = [credentials.login_allowed(self.request(f'203.0.113.{i}'), 'Patient') for i in range(11)]
+        self.assertEqual(allowed, [True] * 10 + [False])
+
+    def test_limit_per_address(self):
+        with mock.patch.object(credentials, 'ip_limiter', credentials.TokenBucket(3, 3 / 60)):
+            allowed = [credentials.login_allowed(self.request(), f'user{i}') for i in range(4)]
+            self.assertEqual(allowed, [True] * 3 + [False])
+            self.assertTrue(credentials.login_allowed(self.request('203.0.113.1'), 'user0'))
+
+    def test_client_address(self):
+        spoofed = '192.0.2.1, 198.51.100.7, 10.0.0.2'
+        # Без доверенных прокси заголовок игнорируется
+        self.assertEqual(credentials.client_address(self.request('10.0.0.1', spoofed)), '10.0.0.1')
+        with override_settings(TRUSTED_PROXIES=['10.0.0.0/24']):
+            self.assertEqual(credentials.client_address(self.request('10.0.0.1', spoofed)), '198.51.100.7')
+            self.assertEqual(credentials.client_address(self.request('10.0.0.1')), '10.0.0.1')
+            self.assertEqual(credentials.client_address(self.request('198.51.100.9', spoofed)), '198.51.100.9')
+
+    def test_login_view_429(self):
+        url = reverse('login')
+        for i in range(12):
+            response = self.client.post(url, {'login': f'user{i}', 'password': 'x'})
+            self.assertEqual(response.status_code, 200)
+        statuses = [self.client.post(url, {'login': 'patient', 'password': 'x'}).status_code for _ in range(11)]
+        self.assertEqual(statuses, [200] * 10 + [429])
+
+
+class RefCacheTests(ClinicTestCase):
+    """Справочники в памяти процесса под версией из общего кэша (core.refcache)."""
+
+    def setUp(self):
+        super().setUp()
+        refcache._local.clear()
+
+    def rename_doctor(self, name):
+        self.doctor.full_name = name
+        self.doctor.save()
+
+    def test_cached(self):
+        with self.assertNumQueries(1):
+            self.assertEqual([row.code_icd for row in refcache.get('diagnoses').rows], ['J06'])
+        with self.assertNumQueries(0):
+            refcache.get('diagnoses')
+            # Другой процесс берет строки из общего кэша
+            refcache._local.clear()
+            self.assertEqual(refcache.get('diagnoses').get(str(self.diagnosis.id)), self.diagnosis)
+
+    def test_invalidated_after_commit(self):
+        version = refcache.version('doctors')
+        refcache.get('doctors')
+        with self.captureOnCommitCallbacks(execute=False) as callbacks:
+            self.rename_doctor('Сергеев Сергей')
+        # До коммита версия прежняя и процесс отдает свою копию
+        self.assertEqual(refcache.version('doctors'), version)
+        with self.assertNumQueries(0):
+            self.assertEqual(refcache.get('doctors').get(self.doctor.id).full_name, 'Иванов Иван')
+
+        for callback in callbacks:
+            callback()
+        self.assertNotEqual(refcache.version('doctors'), version)
+        self.assertEqual(refcache.get('doctors').get(self.doctor.id).full_name, 'Сергеев Сергей')
+
+    def test_rollback_keeps_version(self):
+        version = refcache.version('specializations')
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            with self.assertRaises(RuntimeError), transaction.atomic():
+                Specialization.objects.create(name='Хирург', accreditation_level='Первая')
+                raise RuntimeError
+        self.assertEqual(callbacks, [])
+        self.assertEqual(refcache.version('specializations'), version)
+        self.assertEqual([row.name for row in refcache.get('specializations').rows], ['Терапевт'])
+
+    def test_doctors_etag(self):
+        url = reverse('ajax_doctors')
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        # ETag учитывает фильтр по специализации
+        self.assertEqual(self.client.get(url, {'spec_id': 1}, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.rename_doctor('Сергеев Сергей')
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(response.json(), [{'id': self.doctor.id, 'full_name': 'Сергеев Сергей'}])
+
+    async def test_doctors_etag_async(self):
+        request = AsyncRequestFactory().get('/ajax/doctors/')
+        response = await views.aload_doctors(request)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['ETag'], f'"doctors-{await refcache.aversion("doctors")}-"')
+
+        request = AsyncRequestFactory().get('/ajax/doctors/', headers={'If-None-Match': response['ETag']})
+        self.assertEqual((await views.aload_doctors(request)).status_code, 304)
+
+
+class LookupTests(ClinicTestCase):
+    """Автодополнение по справочникам (core.lookup)."""
+
+    def setUp(self):
+        super().setUp()
+        refcache._local.clear()
+        lookup._built.clear()
+        for code, name in (
+            ('J06.9', 'Острая инфекция верхних дыхательных путей неуточненная'),
+            ('J01', 'Острый синусит'),
+            ('J20', 'Острый бронхит'),
+            ('K29', 'Гастрит и дуоденит'),
+        ):
+            Diagnosis.objects.create(code_icd=code, name=name)
+
+    def codes(self, query):
+        rows, more = lookup.get_index('diagnoses').page(query)
+        return [row.code_icd for row in rows]
+
+    def test_prefix_ranking(self):
+        # Точное совпадение кода выше совпадения по префиксу кода
+        self.assertEqual(self.codes('j06'), ['J06', 'J06.9'])
+        self.assertEqual(self.codes('J0'), ['J01', 'J06', 'J06.9'])
+        self.assertEqual(self.codes('остр'), ['J01', 'J06.9', 'J20'])
+        # Все слова запроса — префиксы слов названия; целые слова поднимают строку выше
+        self.assertEqual(self.codes('острый бронх'), ['J20'])
+        self.assertEqual(self.codes('ост синусит'), ['J01'])
+
+    def test_trigram_fallback(self):
+        # Ни одно слово не начинается с запроса — поиск по триграммам
+        self.assertEqual(self.codes('гасрит'), ['K29'])
+        self.assertEqual(self.codes('бронхид'), ['J20'])
+        self.assertEqual(self.codes('xyz'), [])
+
+    def test_pages(self):
+        for i in range(23):
+            Service.objects.create(name=f'Анализ {i:02d}', cost=10)
+        self.login(self.patient_user)
+        url = reverse('ajax_services')
+
+        first = self.client.get(url, {'q': 'анализ'}).json()
+        self.assertEqual((len(first['results']), first['more']), (lookup.PAGE_SIZE, True))
+        second = self.client.get(url, {'q': 'анализ', 'page': 2}).json()
+        self.assertEqual((len(second['results']), second['more']), (23 - lookup.PAGE_SIZE, False))
+        ids = [row['id'] for row in first['results'] + second['results']]
+        self.assertEqual(len(set(ids)), 23)
+
+        # Пустой запрос — весь справочник; неверный номер страницы — первая
+        self.assertTrue(self.client.get(url, {'page': 'x'}).json()['more'])
+        self.client.logout()
+        self.assertEqual(self.client.get(url).status_code, 401)
+
+    def test_rebuilt_after_change(self):
+        index = lookup.get_index('diagnoses')
+        with self.assertNumQueries(0):
+            self.assertIs(lookup.get_index('diagnoses'), index)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Diagnosis.objects.create(code_icd='I10', name='Эссенциальная гипертензия')
+        self.assertIsNot(lookup.get_index('diagnoses'), index)
+        self.assertEqual(self.codes('гипер'), ['I10'])
+
+
+class PatientSearchTests(ClinicTestCase):
+    """Поиск пациентов по ФИО, номеру карты и телефону (core.patient_search)."""
+
+    def setUp(self):
+        super().setUp()
+        for name, card, phone in (
+            ('Петрова Анна', 'MC-2', '8 (912) 345-67-89'),
+            ('Иванов Петр', 'MC-3', '+7 912 000 11 22'),
+            ('Сидоров Петр', 'MC-PETR', '+7 913 000 00 01'),
+        ):
+            Patient.objects.create(full_name=name, birth_date='1990-01-01', med_card_number=card, phone=phone)
+
+    def names(self, query):
+        return [patient.full_name for patient in patient_search.search(query)]
+
+    def test_normalize_phone(self):
+        for value in ('8 (912) 345-67-89', '+7 912 345 67 89', '9123456789', '79123456789'):
+            self.assertEqual(patient_search.normalize_phone(value), '79123456789')
+        self.assertEqual(patient_search.normalize_phone('45-67'), '4567')
+
+    def test_name(self):
+        # Сначала ФИО, начинающиеся с запроса (в SQLite LIKE без учета регистра только для латиницы)
+        self.assertEqual(self.names('Петр'), ['Петров Петр', 'Петрова Анна', 'Иванов Петр', 'Сидоров Петр'])
+        # Слова запроса — в любом порядке
+        self.assertEqual(self.names('Петр  Иванов'), ['Иванов Петр'])
+        self.assertEqual(self.names('   '), [])
+
+    def test_med_card(self):
+        self.assertEqual(self.names('mc-petr'), ['Сидоров Петр'])
+        self.assertEqual(self.names('MC-'), ['Иванов Петр', 'Петров Петр', 'Петрова Анна', 'Сидоров Петр'])
+
+    def test_phone(self):
+        for query in ('8 912 345-67-89', '+7 (912) 3456789', '912 345 67 89'):
+            with self.subTest(query=query):
+                self.assertEqual(self.names(query), ['Петрова Анна'])
+        # Последние цифры номера
+        self.assertEqual(self.names('67-89'), ['Петрова Анна'])
+        self.assertEqual(self.names('0001'), ['Сидоров Петр'])
+        self.assertEqual(self.names('00'), [])
+
+    def test_save_update_fields(self):
+        Patient.objects.filter(id=self.patient.id).update(updated_at=datetime(2020, 1, 1))
+        patient = Patient.objects.get(id=self.patient.id)
+        patient.phone = '8 999 111-22-33'
+        patient.save(update_fields=['phone'])
+        stored = Patient.objects.get(id=self.patient.id)
+        self.assertEqual(stored.phone_digits, '79991112233')
+        self.assertGreater(stored.updated_at, datetime(2020, 1, 1))
+        self.assertEqual(self.names('1122-33'), ['Петров Петр'])
+
+        Patient.objects.filter(id=self.patient.id).update(updated_at=datetime(2020, 1, 1))
+        patient.full_name = 'Петров Павел'
+        patient.save(update_fields=['full_name'])
+        self.assertGreater(Patient.objects.get(id=self.patient.id).updated_at, datetime(2020, 1, 1))
+        with self.assertNumQueries(0):
+            patient.save(update_fields=[])
+
+    def test_view(self):
+        url = reverse('ajax_patients')
+        self.login(self.admin_user)
+        found = self.client.get(url, {'q': '345-67-89'}).json()
+        self.assertEqual([row['med_card_number'] for row in found], ['MC-2'])
+        self.login(self.doctor_user)
+        self.assertEqual(self.client.get(url, {'q': 'Петр'}).status_code, 403)
+
+
+class PrincipalTests(ClinicTestCase):
+    """Доступ по ролям (role_required) и принципал в сессии (core.principal)."""
+
+    def test_api_views(self):
+        url = reverse('ajax_history')
+        response = self.client.get(url)
+        self.assertEqual((response.status_code, response.json()), (401, {'error': 'unauthorized'}))
+        self.login(self.admin_user)
+        response = self.client.get(url)
+        self.assertEqual((response.status_code, response.json()), (403, {'error': 'forbidden'}))
+        self.login(self.patient_user)
+        self.assertEqual(self.client.get(url).status_code, 200)
+
+    async def test_api_view_async(self):
+        response = await self.async_client.get(reverse('ajax_history'))
+        self.assertEqual(response.status_code, 401)
+
+    def test_pages_redirect(self):
+        booking = AppointmentBooking.objects.filter(status='Scheduled').first()
+        complete = reverse('doctor_complete', args=[booking.id])
+        self.assertRedirects(self.client.get(reverse('dashboard')), reverse('login'), fetch_redirect_response=False)
+        self.assertRedirects(self.client.get(complete), reverse('login'), fetch_redirect_response=False)
+
+        self.login(self.patient_user)
+        for url in (complete, reverse('export_doctor_xlsx')):
+            with self.subTest(url=url):
+                self.assertRedirects(self.client.get(url), reverse('dashboard'), fetch_redirect_response=False)
+        self.login(self.doctor_user)
+        self.assertEqual(self.client.get(complete).status_code, 200)
+
+    def test_cached_in_session(self):
+        self.login(self.doctor_user)
+        request = HttpRequest()
+        request.session = self.client.session
+        # Сессия загружается middleware до представления; принципал в БД не ходит
+        self.assertEqual(request.session['user_id'], self.doctor_user.id)
+        with self.assertNumQueries(0):
+            me = principal.get_principal(request)
+        self.assertEqual((me.user_id, me.role_id, me.doctor_id, me.patient_id), (self.doctor_user.id, ROLE_DOCTOR, self.doctor.id, None))
+
+    def test_role_change(self):
+        self.login(self.patient_user)
+        url = reverse('ajax_history')
+        self.assertEqual(self.client.get(url).status_code, 200)
+
+        user = User.objects.get(id=self.patient_user.id)
+        user.role_id = ROLE_ADMIN
+        with self.captureOnCommitCallbacks(execute=False) as callbacks:
+            user.save()
+        # До коммита в сессии прежний принципал
+        self.assertEqual(self.client.get(url).status_code, 200)
+        for callback in callbacks:
+            callback()
+        self.assertEqual(self.client.get(url).status_code, 403)
+        self.assertEqual(self.client.session['role_id'], ROLE_ADMIN)
+
+    def test_profile_moved(self):
+        self.login(self.patient_user)
+        other = User.objects.create(login='other', password='-', role_id=ROLE_PATIENT)
+        with self.captureOnCommitCallbacks(execute=True):
+            patient = Patient.objects.get(id=self.patient.id)
+            patient.user = other
+            patient.save()
+        request = HttpRequest()
+        request.session = self.client.session
+        self.assertIsNone(principal.get_principal(request).patient_id)
+
+    def test_deleted_user(self):
+        self.login(self.admin_user)
+        with self.captureOnCommitCallbacks(execute=True):
+            User.objects.filter(id=self.admin_user.id).delete()
+        self.assertEqual(self.client.get(reverse('ajax_patients')).status_code, 401)
+
+
+class SlotEventsTests(ClinicTestCase):
+    """Поток событий слотов (views.slot_events, core.events) без NOTIFY.
+
+    В PostgreSQL событие уходит через NOTIFY только при коммите, которого в
+    TestCase нет, поэтому рассылка проверяется внутри процесса.
+    """
+
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch.object(events, '_uses_notify', return_value=False)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.day = datetime.now().date() + timedelta(days=1)
+        # Middleware под ASGI кладет принципал в запрос; здесь он готовится заранее
+        self.patient_principal = principal.resolve(self.patient_user)
+
+    def request(self, me=None):
+        request = AsyncRequestFactory().get('/ajax/slots/events/', {'doctor_id': self.doctor.id, 'date': self.day.isoformat()})
+        request.principal = me
+        return request
+
+    def test_sse_format(self):
+        self.assertEqual(views._sse('taken', {'time': '10:00'}), 'event: taken\ndata: {"time": "10:00"}\n\n')
+
+    async def test_requires_login(self):
+        response = await views.slot_events(self.request())
+        self.assertEqual(response.status_code, 401)
+
+    async def test_events(self):
+        response = await views.slot_events(self.request(self.patient_principal))
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        content = aiter(response.streaming_content)
+
+        async def receive():
+            return (await asyncio.wait_for(anext(content), 1)).decode()
+
+        self.assertEqual(await receive(), 'retry: 3000\n\n')
+        # Событие другого дня подписчику не приходит
+        other_day = datetime.combine(self.day + timedelta(days=1), time(10))
+        await sync_to_async(events.publish)(self.doctor.id, other_day, events.TAKEN)
+
+        def book():
+            with self.captureOnCommitCallbacks(execute=True):
+                return AppointmentBooking.objects.create(
+                    patient=self.patient, doctor=self.doctor,
+                    date_time=datetime.combine(self.day, time(10)), status='Scheduled',
+                )
+
+        booking = await sync_to_async(book)()
+        self.assertEqual(await receive(), 'event: taken\ndata: {"time": "10:00"}\n\n')
+
+        def cancel():
+            with self.captureOnCommitCallbacks(execute=True):
+                booking.status = 'Canceled'
+                booking.save()
+
+        await sync_to_async(cancel)()
+        self.assertEqual(await receive(), 'event: released\ndata: {"time": "10:00"}\n\n')
+
+        # Отключение клиента: ASGI-обработчик отменяет ожидание следующего события
+        pending = asyncio.ensure_future(anext(content))
+        await asyncio.sleep(0)
+        pending.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await pending
+        self.assertEqual(events.broker._subscribers, {})
+
+
+class ScheduleTests(ClinicTestCase):
+    """Скомпилированный график (core.schedule): шаблоны, исключения, окно записи."""
+
+    def setUp(self):
+        super().setUp()
+        self.day = datetime.now().date() + timedelta(days=1)
+
+    def starts(self, day=None):
+        return schedule.compile_calendar().slot_starts(self.doctor.id, day or self.day)
+
+    def test_default_schedule(self):
+        starts = self.starts()
+        self.assertEqual(len(starts), 18)
+        self.assertEqual((starts[0], starts[-1]), ((9 * 60, 30), (17 * 60 + 30, 30)))
+
+    def test_templates(self):
+        WorkTemplate.objects.create(office=self.office, weekday=self.day.weekday(), start_time=time(8), end_time=time(10), slot_minutes=60)
+        self.assertEqual(self.starts(), [(8 * 60, 60), (9 * 60, 60)])
+
+        # Шаблон врача важнее шаблона кабинета; в дни без шаблона врач не принимает
+        WorkTemplate.objects.create(doctor=self.doctor, weekday=self.day.weekday(), start_time=time(14), end_time=time(15), slot_minutes=20)
+        self.assertEqual(self.starts(), [(14 * 60, 20), (14 * 60 + 20, 20), (14 * 60 + 40, 20)])
+        self.assertEqual(self.starts(self.day + timedelta(days=1)), [])
+
+    def test_exceptions(self):
+        WorkTemplate.objects.create(doctor=self.doctor, weekday=self.day.weekday(), start_time=time(14), end_time=time(15), slot_minutes=30)
+        ScheduleException.objects.create(office=self.office, date=self.day, reason='Ремонт')
+        self.assertEqual(self.starts(), [])
+
+        ScheduleException.objects.create(doctor=self.doctor, date=self.day, start_time=time(10), end_time=time(11))
+        self.assertEqual(self.starts(), [(10 * 60, 30), (10 * 60 + 30, 30)])
+
+        # Прошедшие исключения в график не попадают
+        past = self.day - timedelta(days=7)
+        ScheduleException.objects.create(doctor=self.doctor, date=past, reason='Отпуск')
+        self.assertEqual(self.starts(past), [(14 * 60, 30), (14 * 60 + 30, 30)])
+
+    @override_settings(BOOKING_HORIZON_DAYS=2)
+    def test_horizon(self):
+        today = datetime.now().date()
+        self.assertEqual(
+            [schedule.bookable(today + timedelta(days=i)) for i in (-1, 0, 1, 2)],
+            [False, True, True, False],
+        )
+        with self.assertRaises(SlotUnavailable):
+            book_slot(self.patient, self.doctor.id, datetime.combine(today + timedelta(days=2), time(10)))
+
+    def test_invalidated_after_commit(self):
+        self.assertEqual(len(schedule.get_calendar().slot_starts(self.doctor.id, self.day)), 18)
+        with self.captureOnCommitCallbacks(execute=False) as callbacks:
+            ScheduleException.objects.create(doctor=self.doctor, date=self.day, reason='Отпуск')
+        # До коммита процесс держит прежний график и не обращается к БД
+        with self.assertNumQueries(0):
+            self.assertEqual(len(schedule.get_calendar().slot_starts(self.doctor.id, self.day)), 18)
+
+        for callback in callbacks:
+            callback()
+        self.assertEqual(schedule.get_calendar().slot_starts(self.doctor.id, self.day), [])
+
+
+class SlotIndexTests(ClinicTestCase):
+    """Битовые маски занятости в кэше (core.slots) и их сброс после коммита записи."""
+
+    def setUp(self):
+        super().setUp()
+        self.tomorrow = datetime.now().date() + timedelta(days=1)
+        self.free = [f'{minute // 60:02d}:{minute % 60:02d}' for minute in range(9 * 60 + 30, 18 * 60, 30)]
+
+    def book(self, hour):
+        with self.captureOnCommitCallbacks(execute=True):
+            return AppointmentBooking.objects.create(
+                patient=self.patient, doctor=self.doctor,
+                date_time=datetime.combine(self.tomorrow, time(hour)), status='Scheduled',
+            )
+
+    def test_free_slots_cached(self):
+        self.assertEqual(slots.free_slots(self.doctor.id, self.tomorrow), self.free)
+        with self.assertNumQueries(0):
+            self.assertEqual(slots.free_slots(self.doctor.id, self.tomorrow), self.free)
+
+    def test_booking_and_cancel(self):
+        slots.free_slots(self.doctor.id, self.tomorrow)
+        booking = self.book(10)
+        self.assertNotIn('10:00', slots.free_slots(self.doctor.id, self.tomorrow))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            booking.status = 'Canceled'
+            booking.save()
+        self.assertEqual(slots.free_slots(self.doctor.id, self.tomorrow), self.free)
+
+    def test_uncommitted_booking_not_cached(self):
+        slots.free_slots(self.doctor.id, self.tomorrow)
+        with self.captureOnCommitCallbacks(execute=False) as callbacks:
+            AppointmentBooking.objects.create(
+                patient=self.patient, doctor=self.doctor,
+                date_time=datetime.combine(self.tomorrow, time(10)), status='Scheduled',
+            )
+        # До коммита маска в кэше прежняя
+        self.assertIn('10:00', slots.free_slots(self.doctor.id, self.tomorrow))
+        for callback in callbacks:
+            callback()
+        self.assertNotIn('10:00', slots.free_slots(self.doctor.id, self.tomorrow))
+
+    def test_stale_mask_not_stored(self):
+        # Запись закоммичена между чтением маски из БД и ее сохранением в кэш
+        busy_rows = slots._busy_rows
+
+        def read_then_book(doctor_id, missing):
+            rows = list(busy_rows(doctor_id, missing))
+            self.book(10)
+            return rows
+
+        with mock.patch.object(slots, '_busy_rows', side_effect=read_then_book):
+            self.assertIn('10:00', slots.free_slots(self.doctor.id, self.tomorrow))
+        self.assertNotIn('10:00', slots.free_slots(self.doctor.id, self.tomorrow))
+
+    async def test_async_masks(self):
+        days = [self.tomorrow, self.tomorrow + timedelta(days=1)]
+        expected = await sync_to_async(slots.busy_masks)(self.doctor.id, days)
+        await sync_to_async(cache.clear)()
+        self.assertEqual(await slots.abusy_masks(self.doctor.id, days), expected)
+        self.assertEqual(await slots.afree_slots(self.doctor.id, self.tomorrow), self.free)
+
+    def test_week_endpoint(self):
+        url = reverse('ajax_week_slots')
+        params = {'doctor_id': self.doctor.id, 'start': self.tomorrow.isoformat(), 'days': 3}
+        # Все дни недели загружаются одним запросом к записям
+        slots.get_calendar()
+        with self.assertNumQueries(1):
+            week = self.client.get(url, params).json()
+        days = [(self.tomorrow + timedelta(days=i)).isoformat() for i in range(3)]
+        self.assertEqual(week, dict.fromkeys(days, self.free))
+
+        self.book(10)
+        with self.assertNumQueries(1):
+            week = self.client.get(url, params).json()
+        self.assertNotIn('10:00', week[days[0]])
+        self.assertEqual(week[days[1]], self.free)
+
+        self.assertEqual(self.client.get(url, {'doctor_id': 'x'}).json(), {})
+
+
+class ExportJobAccessTests(ClinicTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.admin = principal.resolve(self.admin_user)
+        self.doctor_principal = principal.resolve(self.doctor_user)
+        self.patient_principal = principal.resolve(self.patient_user)
+
+    def test_can_access(self):
+        own = ExportJob(kind='schedule', params={'doctors': [self.doctor.id]})
+        other = ExportJob(kind='schedule', params={'doctors': [self.doctor.id, self.doctor.id + 1]})
+        cases = [
+            (ExportJob(kind='patients'), {'admin': True, 'doctor': False, 'patient': False, 'anonymous': False}),
+            (ExportJob(kind='doctors_report'), {'admin': True, 'doctor': False, 'patient': False, 'anonymous': False}),
+            (own, {'admin': True, 'doctor': True, 'patient': False, 'anonymous': False}),
+            (other, {'admin': True, 'doctor': False, 'patient': False, 'anonymous': False}),
+        ]
+        principals = {
+            'admin': self.admin, 'doctor': self.doctor_principal,
+            'patient': self.patient_principal, 'anonymous': None,
+        }
+        for job, expected in cases:
+            for name, who in principals.items():
+                with self.subTest(kind=job.kind, params=job.params, principal=name):
+                    self.assertEqual(jobs.can_access(job, who), expected[name])
+            # Сотрудник админки (is_staff) видит любые задания
+            self.assertTrue(jobs.can_access(job, None, is_staff=True))
+
+    def test_create_forbidden_kinds(self):
+        self.login(self.doctor_user)
+        for kind in ('patients', 'doctors_report'):
+            with self.subTest(kind=kind):
+                response = self.client.post(reverse('export_job_create'), {'kind': kind})
+                self.assertEqual(response.status_code, 403)
+        self.assertFalse(ExportJob.objects.exists())
+
+    def test_doctor_exports_own_schedule(self):
+        self.login(self.doctor_user)
+        response = self.client.post(reverse('export_job_create'), {'kind': 'schedule', 'doctors': '1,2,3'})
+        self.assertEqual(response.status_code, 202)
+        job = ExportJob.objects.get()
+        self.assertEqual(job.params['doctors'], [self.doctor.id])
+
+        self.login(self.patient_user)
+        self.assertEqual(self.client.get(reverse('export_job', args=[job.id])).status_code, 403)
+        response = self.client.post(reverse('export_job_create'), {'kind': 'schedule'})
+        self.assertEqual(response.status_code, 403)
+
+    def test_stale_running_job_is_requeued(self):
+        params = {'doctors': [self.doctor.id]}
+        job = jobs.enqueue('schedule', params)
+        ExportJob.objects.filter(id=job.id).update(
+            status=ExportJob.STATUS_RUNNING, started_at=datetime.now() - jobs._timeout() - timedelta(minutes=1),
+        )
+        self.assertNotEqual(jobs.enqueue('schedule', params).id, job.id)
+        self.assertEqual(jobs.requeue_stale(), 1)
+        job.refresh_from_db()
+        self.assertEqual(job.status, ExportJob.STATUS_PENDING)
+        self.assertIsNone(job.started_at)
+
+
+class CompleteVisitsTests(ClinicTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.scheduled = list(AppointmentBooking.objects.filter(status='Scheduled').order_by('date_time')[:2])
+        self.completed = AppointmentBooking.objects.filter(status='Completed').first()
+
+    def visit(self, booking):
+        return Visit(booking.id, 'Жалобы', self.diagnosis.id, {self.services[0].id: 2}, ['Ибупрофен'])
+
+    def test_completes_all(self):
+        appointments = complete_visits([self.visit(b) for b in self.scheduled], doctor_id=self.doctor.id)
+        self.assertEqual(len(appointments), 2)
+        for booking in self.scheduled:
+            booking.refresh_from_db()
+            self.assertEqual(booking.status, 'Completed')
+            self.assertEqual(PerformedService.objects.get(appointment__booking=booking).count, 2)
+            self.assertTrue(Prescription.objects.filter(appointment__booking=booking).exists())
+
+    def test_duplicate_booking(self):
+        with self.assertRaises(VisitError):
+            complete_visits([self.visit(self.scheduled[0]), self.visit(self.scheduled[0])])
+
+    def test_all_or_nothing(self):
+        missing = Visit(10 ** 6)
+        with self.assertRaises(VisitError) as raised:
+            complete_visits([self.visit(self.scheduled[0]), self.visit(self.completed), missing])
+        self.assertEqual(set(raised.exception.errors), {self.completed.id, missing.booking_id})
+        self.scheduled[0].refresh_from_db()
+        self.assertEqual(self.scheduled[0].status, 'Scheduled')
+        self.assertFalse(Appointment.objects.filter(booking=self.scheduled[0]).exists())
+
+    def test_other_doctor(self):
+        with self.assertRaises(VisitError) as raised:
+            complete_visits([self.visit(self.scheduled[0])], doctor_id=self.doctor.id + 1)
+        self.assertEqual(set(raised.exception.errors), {self.scheduled[0].id})
+
+    def test_parse_visit(self):
+        visit = parse_visit({
+            'booking_id': 5, 'diagnosis_id': self.diagnosis.id,
+            'services': [{'service_id': self.services[0].id}, {'service_id': self.services[0].id, 'count': 2}],
+            'prescriptions': [' Парацетамол ', ''],
+        })
+        self.assertEqual(visit.services, {self.services[0].id: 3})
+        self.assertEqual(visit.prescriptions, ['Парацетамол'])
+
+        invalid = [
+            [],
+            {'booking_id': 0},
+            {'booking_id': True},
+            {'booking_id': 1, 'diagnosis_id': 10 ** 6},
+            {'booking_id': 1, 'services': [{'service_id': self.services[0].id, 'count': 0}]},
+            {'booking_id': 1, 'services': [{'service_id': 10 ** 6}]},
+            {'booking_id': 1, 'services': [{'count': 1}]},
+            {'booking_id': 1, 'prescriptions': 'Парацетамол'},
+        ]
+        for data in invalid:
+            with self.subTest(data=data), self.assertRaises(ValueError):
+                parse_visit(data)
+
+
+class BackupRoundTripTests(ClinicTestCase):
+    """Построчный снимок (core.backups) восстанавливает измененные после него строки."""
+
+    def setUp(self):
+        super().setUp()
+        self.root = tempfile.mkdtemp(prefix='test-backup-')
+        self.addCleanup(shutil.rmtree, self.root, ignore_errors=True)
+
+    def round_trip(self):
+        snapshot = backups.Snapshot('full', root=self.root)
+        snapshot.finish(counts=backups.dump_rows(snapshot))
+
+        booking = AppointmentBooking.objects.filter(status='Scheduled').order_by('date_time').first()
+        original = (booking.date_time, booking.status)
+        # Перенос на другое время меняет ключ секционированной таблицы
+        AppointmentBooking.objects.filter(id=booking.id).update(
+            date_time=booking.date_time + timedelta(hours=1), status='Canceled',
+        )
+        Patient.objects.filter(id=self.patient.id).update(full_name='Изменено')
+        total = AppointmentBooking.objects.count()
+
+        counts = backups.restore_rows(snapshot.path, backups.load_manifest(snapshot.path))
+
+        self.assertEqual(counts['appointment_bookings'], total)
+        self.assertEqual(AppointmentBooking.objects.count(), total)
+        booking = AppointmentBooking.objects.get(id=booking.id)
+        self.assertEqual((booking.date_time, booking.status), original)
+        self.assertEqual(Patient.objects.get(id=self.patient.id).full_name, self.patient.full_name)
+
+    def test_round_trip(self):
+        self.round_trip()
+
+    @skipUnless(connection.vendor == 'postgresql', 'Секционирование только в PostgreSQL')
+    def test_round_trip_partitioned(self):
+        migration = import_module('core.migrations.0008_booking_partitions')
+        with connection.schema_editor() as schema_editor:
+            migration.partition_bookings(None, schema_editor)
+        self.assertEqual(backups._conflict_fields(AppointmentBooking), ['id', 'date_time'])
+        self.round_trip()
+
+    def snapshot(self, previous=None, change_log=False):
+        marks = backups.watermarks()
+        snapshot = backups.Snapshot('incremental' if previous else 'full', root=self.root)
+        extra = {'base': previous['id'], 'deleted': backups.deleted_rows(previous)} if previous else {}
+        snapshot.finish(
+            watermarks=marks, counts=backups.dump_rows(snapshot, previous), change_log=change_log, **extra,
+        )
+        return snapshot
+
+    def restore(self, *snapshots):
+        for snapshot in snapshots:
+            backups.restore_rows(snapshot.path, backups.load_manifest(snapshot.path))
+
+    def test_incremental_without_change_log(self):
+        full = self.snapshot()
+        # Перехеширование пароля при входе — UPDATE без отметки изменения
+        User.objects.filter(id=self.patient_user.id).update(password='rehashed')
+        incremental = self.snapshot(full.manifest)
+
+        self.assertIn('users', backups.full_tables(full.manifest))
+        self.assertNotIn('patients', backups.full_tables(full.manifest))
+        self.assertEqual(incremental.manifest['counts']['users'], User.objects.count())
+        self.assertEqual(incremental.manifest['counts']['patients'], 0)
+        self.assertEqual(incremental.manifest['deleted'], {})
+
+        User.objects.filter(id=self.patient_user.id).update(password='-')
+        self.restore(full, incremental)
+        self.assertEqual(User.objects.get(id=self.patient_user.id).password, 'rehashed')
+
+    def test_incremental_with_change_log(self):
+        full = self.snapshot(change_log=True)
+        self.assertEqual(backups.full_tables(full.manifest), [])
+
+        # Журнал ведут триггеры миграции 0010 (PostgreSQL); здесь записи добавляются вручную
+        prescription_id = Prescription.objects.values_list('id', flat=True).first()
+        User.objects.filter(id=self.patient_user.id).update(password='rehashed')
+        Prescription.objects.filter(id=prescription_id).delete()
+        for table, row_id in (('users', self.patient_user.id), ('prescriptions', prescription_id)):
+            RowChange.objects.create(table_name=table, row_id=row_id, changed_at=datetime.now())
+        incremental = self.snapshot(full.manifest, change_log=True)
+
+        counts = incremental.manifest['counts']
+        self.assertEqual((counts['users'], counts['services'], counts['prescriptions']), (1, 0, 0))
+        self.assertEqual(incremental.manifest['deleted'], {'prescriptions': [prescription_id]})
+
+        # Полный снимок возвращает назначение, инкремент снова его удаляет
+        User.objects.filter(id=self.patient_user.id).update(password='-')
+        self.restore(full)
+        self.assertTrue(Prescription.objects.filter(id=prescription_id).exists())
+        self.restore(incremental)
+        self.assertFalse(Prescription.objects.filter(id=prescription_id).exists())
+        self.assertEqual(User.objects.get(id=self.patient_user.id).password, 'rehashed')
+
+        self.assertEqual(backups.trim_change_log(incremental.manifest), 0)
+        self.assertEqual(backups.trim_change_log({'created_at': (datetime.now() + timedelta(hours=1)).isoformat()}), 2)
+
+    @skipUnless(connection.vendor == 'postgresql', 'Журнал изменений только в PostgreSQL')
+    def test_change_log_triggers(self):
+        migration = import_module('core.migrations.0010_row_changes')
+        with connection.schema_editor() as schema_editor:
+            migration.install(None, schema_editor)
+        self.assertTrue(backups.change_log_enabled())
+
+        User.objects.filter(id=self.patient_user.id).update(password='rehashed')
+        Prescription.objects.filter(appointment__booking__patient=self.patient).delete()
+        logged = set(RowChange.objects.values_list('table_name', 'row_id'))
+        self.assertIn(('users', self.patient_user.id), logged)
+        self.assertEqual(len({row_id for table, row_id in logged if table == 'prescriptions'}), self.HISTORY // 2)
+
+
+class ExportAccessTests(ClinicTestCase):
+
+    def test_patients_json(self):
+        url = reverse('export_json')
+        self.assertEqual(self.client.get(url).status_code, 401)
+        self.login(self.doctor_user)
+        self.assertEqual(self.client.get(url).status_code, 403)
+
+        self.login(self.admin_user)
+        response = self.client.get(url, {'format': 'ndjson'})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(self.patient.full_name, b''.join(response.streaming_content).decode())
+
+    def test_doctors_report_csv(self):
+        url = reverse('export_csv')
+        self.assertEqual(self.client.get(url).status_code, 401)
+        for user in (self.doctor_user, self.patient_user):
+            self.login(user)
+            self.assertEqual(self.client.get(url).status_code, 403)
+
+    async def test_asgi_streams_without_buffering(self):
+        await sync_to_async(self.login)(self.admin_user)
+        cases = [('export_json', self.patient.full_name)]
+        # Отчет по врачам — SQL по схеме clinic, только PostgreSQL
+        if connection.vendor == 'postgresql':
+            cases.append(('export_csv', self.doctor.full_name))
+        for name, marker in cases:
+            with self.subTest(name=name):
+                response = await self.async_client.get(reverse(name))
+                self.assertEqual(response.status_code, 200)
+                # Асинхронный итератор: Django не вычитывает синхронный целиком через sync_to_async(list)
+                self.assertTrue(response.is_async)
+                content = b''.join([chunk async for chunk in response.streaming_content])
+                self.assertIn(marker, content.decode('utf-8'))
@@ -1,18 +1,38 @@
+from django.conf import settings
 from django.urls import path
-from . import views
+from . import metrics, views
 
 urlpatterns = [
     path('', views.dashboard_view, name='dashboard'),
     path('login/', views.login_view, name='login'),
     path('logout/', views.logout_view, name='logout'),
+    path('metrics', metrics.metrics_view, name='metrics'),
+
+    path('ajax/history/', views.history_page, name='ajax_history'),
+    path('ajax/visit/<int:booking_id>/', views.visit_details_view, name='ajax_visit'),
+
+    path('ajax/patients/', views.search_patients, name='ajax_patients'),
 
     path('book/', views.book_appointment_view, name='book_appointment'),
-    path('ajax/doctors/', views.load_doctors, name='ajax_doctors'),
-    path('ajax/slots/', views.load_slots, name='ajax_slots'),
+    path('ajax/doctors/', views.aload_doctors if settings.ASYNC_AJAX_VIEWS else views.load_doctors, name='ajax_doctors'),
+    path('ajax/slots/', views.aload_slots if settings.ASYNC_AJAX_VIEWS else views.load_slots, name='ajax_slots'),
+    path('ajax/slots/week/', views.load_week_slots, name='ajax_week_slots'),
+    path('ajax/workdays/', views.load_working_days, name='ajax_workdays'),
 
     path('doctor/complete/<int:booking_id>/', views.doctor_complete_view, name='doctor_complete'),
+    path('doctor/complete/batch/', views.complete_visits_batch, name='doctor_complete_batch'),
+    path('ajax/diagnoses/', views.load_diagnoses, name='ajax_diagnoses'),
+    path('ajax/services/', views.load_services, name='ajax_services'),
 
     path('export/json/', views.export_patients_json, name='export_json'),
     path('export/csv/', views.export_doctors_report_csv, name='export_csv'),
     path('doctor/export/excel/', views.export_my_schedule_xlsx, name='export_doctor_xlsx'),
+
+    path('export/jobs/', views.export_job_create, name='export_job_create'),
+    path('export/jobs/<int:job_id>/', views.export_job_status, name='export_job'),
+    path('export/jobs/<int:job_id>/download/', views.export_job_download, name='export_job_download'),
 ]
+
+# Поток событий слотов держит соединение открытым — только под ASGI
+if settings.ASYNC_AJAX_VIEWS:
+    urlpatterns.append(path('ajax/slots/events/', views.slot_events, name='ajax_slot_events'))
@@ -0,0 +1,22 @@
+import time
+
+from django.core.cache import cache
+
+# Номера версий в общем кэше: процессы сверяют свою копию данных с версией
+# и перестраивают ее, когда версию увеличили (обычно сигналом об изменении).
+
+
+def get_version(key):
+    return cache.get_or_set(key, time.time_ns, None)
+
+
+async def aget_version(key):
+    return await cache.aget_or_set(key, time.time_ns, None)
+
+
+def bump_version(key):
+    try:
+        cache.incr(key)
+    except ValueError:
+        # Ключ вытеснен из кэша — начинаем с нового уникального значения
+        cache.set(key, time.time_ns(), None)
@@ -1,14 +1,30 @@
-import csv
-import openpyxl
-from openpyxl.styles import Font, Alignment
-from datetime import datetime, timedelta, time
+import asyncio
+import json
+import os
+import tempfile
+from datetime import datetime
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
 from django.shortcuts import render, redirect, get_object_or_404
+from django.urls import reverse
+from django.views.decorators.http import require_POST, condition
+from django.template.loader import render_to_string
 from django.contrib import messages
-from django.http import JsonResponse, HttpResponse
-from django.db import connection
+from django.http import JsonResponse, HttpResponse, StreamingHttpResponse, FileResponse
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import quote_etag
+from django.utils.text import compress_sequence
 
-from .models import Patient, User, Doctor, AppointmentBooking, Appointment, PerformedService
+from .models import Patient, Doctor, AppointmentBooking, ExportJob
 from .forms import LoginForm, BookingForm, DoctorCompleteForm
+from .booking import book_slot, SlotTaken, SlotUnavailable
+from .visits import complete_visits, parse_visit, VisitError, BATCH_LIMIT
+from . import credentials, events, exports, jobs, lookup, patient_search, principal, queries, refcache, schedule, slots
+from .principal import role_required, ROLE_ADMIN, ROLE_DOCTOR, ROLE_PATIENT
+from .routers import use_replica
 
 
 def login_view(request):
@@ -17,13 +33,15 @@ def login_view(request):
         if form.is_valid():
             login = form.cleaned_data['login']
             password = form.cleaned_data['password']
-            try:
-                user = User.objects.get(login=login, password=password)
-                request.session['user_id'] = user.id
-                request.session['role_id'] = user.role.id
+            if not credentials.login_allowed(request, login):
+                messages.error(request, 'Слишком много попыток входа. Повторите позже.')
+                return render(request, 'login.html', {'form': form}, status=429)
+
+            user = credentials.authenticate(login, password)
+            if user is not None:
+                principal.login(request, user)
                 return redirect('dashboard')
-            except User.DoesNotExist:
-                messages.error(request, 'Неверный логин или пароль')
+            messages.error(request, 'Неверный логин или пароль')
     else:
         form = LoginForm()
     return render(request, 'login.html', {'form': form})
@@ -34,29 +52,27 @@ def logout_view(request):
     return redirect('login')
 
 
+@role_required()
 def dashboard_view(request):
-    user_id = request.session.get('user_id')
-    if not user_id: return redirect('login')
+    me = request.principal
+    context = {'user': me}
 
-    user = User.objects.get(id=user_id)
-    role_id = request.session.get('role_id')
-    context = {'user': user}
-
-    if role_id == 3:
+    if me.is_patient:
         try:
-            patient = Patient.objects.get(user=user)
+            patient = Patient.objects.get(id=me.patient_id)
 
             context['patient'] = patient
-            context['appointments'] = AppointmentBooking.objects.filter(patient=patient).order_by('-date_time')
+            context['appointments'], context['next_cursor'] = queries.keyset_page(queries.patient_history(patient))
             return render(request, 'patient_dashboard.html', context)
         except Patient.DoesNotExist:
             return HttpResponse("Ошибка: Ваш профиль пациента не найден. Обратитесь в регистратуру.")
 
-    elif role_id == 2:
+    elif me.is_doctor:
         try:
-            doctor = Doctor.objects.get(user=user)
+            doctor = queries.dashboard_doctor(me.doctor_id)
             context['doctor'] = doctor
-            context['appointments'] = AppointmentBooking.objects.filter(doctor=doctor).order_by('date_time')
+            context['appointments'], context['next_cursor'] = queries.keyset_page(queries.doctor_history(doctor))
+            context['past'], context['past_cursor'] = queries.keyset_page(queries.doctor_history(doctor, past=True))
             return render(request, 'doctor_dashboard.html', context)
         except Doctor.DoesNotExist:
             context['error'] = "Профиль врача не найден."
@@ -66,56 +82,208 @@ def dashboard_view(request):
         return redirect('/admin/')
 
 
-def load_doctors(request):
+@role_required(ROLE_PATIENT, ROLE_DOCTOR, api=True)
+@use_replica()
+def history_page(request):
+    me = request.principal
+    if me.is_patient:
+        queryset = queries.patient_history(me.patient_id)
+        template = '_patient_rows.html'
+    else:
+        queryset = queries.doctor_history(me.doctor_id, past=request.GET.get('part') == 'past')
+        template = '_doctor_rows.html'
+
+    try:
+        rows, next_cursor = queries.keyset_page(queryset, request.GET.get('after'))
+    except ValueError:
+        return JsonResponse({'error': 'bad cursor'}, status=400)
+
+    html = render_to_string(template, {'appointments': rows}, request=request)
+    return JsonResponse({'html': html, 'next': next_cursor})
+
+
+@role_required(api=True)
+@use_replica()
+def visit_details_view(request, booking_id):
+    me = request.principal
+    booking = get_object_or_404(AppointmentBooking.objects.only('patient_id', 'doctor_id'), id=booking_id)
+    if booking.patient_id != me.patient_id and booking.doctor_id != me.doctor_id:
+        return HttpResponse(status=403)
+
+    return render(request, '_visit_details.html', {'appointment': queries.visit_details(booking_id)})
+
+
+def _doctors_etag(request, version=None):
+    # Список зависит только от версии справочника врачей и фильтра
+    if version is None:
+        version = refcache.version('doctors')
+    return f"doctors-{version}-{request.GET.get('spec_id', '')}"
+
+
+def _doctors_response(request, table):
     spec_id = request.GET.get('spec_id')
     if spec_id:
-        doctors = list(Doctor.objects.filter(specialization_id=spec_id).values('id', 'full_name'))
+        try:
+            rows = table.by_specialization.get(int(spec_id), [])
+        except ValueError:
+            rows = []
     else:
-        doctors = list(Doctor.objects.all().values('id', 'full_name'))
-    return JsonResponse(doctors, safe=False)
+        rows = table.rows
+    doctors = [{'id': doctor.id, 'full_name': doctor.full_name} for doctor in rows]
+    response = JsonResponse(doctors, safe=False)
+    # Браузер каждый раз сверяет ETag и получает 304, пока справочник не изменился
+    response['Cache-Control'] = 'private, no-cache'
+    return response
 
-def load_slots(request):
+
+@condition(etag_func=_doctors_etag)
+def load_doctors(request):
+    return _doctors_response(request, refcache.get('doctors'))
+
+
+async def aload_doctors(request):
+    """Асинхронный вариант load_doctors для ASGI (см. settings.ASYNC_AJAX_VIEWS)."""
+    etag = quote_etag(_doctors_etag(request, await refcache.aversion('doctors')))
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = _doctors_response(request, await refcache.aget('doctors'))
+    response.headers.setdefault('ETag', etag)
+    return response
+
+def _lookup_view(name, label):
+    @role_required(api=True)
+    def view(request):
+        try:
+            page = max(int(request.GET.get('page', 1)), 1)
+        except ValueError:
+            page = 1
+        rows, more = lookup.get_index(name).page(request.GET.get('q', ''), page)
+        return JsonResponse({'results': [{'id': row.pk, 'text': label(row)} for row in rows], 'more': more})
+    return view
+
+
+load_diagnoses = _lookup_view('diagnoses', str)
+load_services = _lookup_view('services', str)
+
+
+@role_required(ROLE_ADMIN, api=True)
+@use_replica()
+def search_patients(request):
+    # Поиск для регистратуры: только администратор
+    patients = patient_search.search(request.GET.get('q', '')).values(
+        'id', 'full_name', 'phone', 'med_card_number', 'birth_date'
+    )[:patient_search.LIMIT]
+    return JsonResponse(list(patients), safe=False)
+
+
+def _slots_params(request):
+    """(врач, дата) из GET-параметров или None, если они не заданы или неверны."""
     doctor_id = request.GET.get('doctor_id')
     date_str = request.GET.get('date')
 
     if not doctor_id or not date_str:
-        return JsonResponse([], safe=False)
+        return None
 
     try:
-        search_date = datetime.strptime(date_str, '%Y-%m-%d').date()
+        return int(doctor_id), datetime.strptime(date_str, '%Y-%m-%d').date()
     except ValueError:
+        return None
+
+
+def load_slots(request):
+    params = _slots_params(request)
+    if params is None:
         return JsonResponse([], safe=False)
+    return JsonResponse(slots.free_slots(*params), safe=False)
 
-    bookings = AppointmentBooking.objects.filter(
-        doctor_id=doctor_id,
-        date_time__date=search_date
-    ).exclude(status='Canceled')
 
-    busy_slots = [b.date_time.strftime('%H:%M') for b in bookings]
+async def aload_slots(request):
+    params = _slots_params(request)
+    if params is None:
+        return JsonResponse([], safe=False)
+    return JsonResponse(await slots.afree_slots(*params), safe=False)
 
-    free_slots = []
-    start = datetime.combine(search_date, time(9, 0))
-    end = datetime.combine(search_date, time(18, 0))
 
-    while start < end:
-        slot_str = start.strftime('%H:%M')
-        if slot_str not in busy_slots:
-            free_slots.append(slot_str)
-        start += timedelta(minutes=30)
+SLOT_EVENTS_KEEPALIVE = 25
+# Соединение периодически закрывается: EventSource переподключится и перечитает слоты
+SLOT_EVENTS_MAX_SECONDS = 300
 
-    return JsonResponse(free_slots, safe=False)
 
+def _sse(event, data):
+    return f'event: {event}\ndata: {json.dumps(data)}\n\n'
 
-def book_appointment_view(request):
-    user_id = request.session.get('user_id')
-    if not user_id: return redirect('login')
 
-    user = User.objects.get(id=user_id)
+# Как и страница записи — только вошедшим; соединение держится минутами
+@role_required(api=True)
+async def slot_events(request):
+    """Поток событий «слот занят/освобожден» для (врач, день); только ASGI."""
+    params = _slots_params(request)
+    if params is None:
+        return JsonResponse({'error': 'doctor_id и date обязательны'}, status=400)
+
+    async def stream():
+        subscription = events.broker.subscribe(*params)
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + SLOT_EVENTS_MAX_SECONDS
+        try:
+            yield 'retry: 3000\n\n'
+            while loop.time() < deadline:
+                try:
+                    event = await asyncio.wait_for(subscription.queue.get(), SLOT_EVENTS_KEEPALIVE)
+                except TimeoutError:
+                    # Комментарий держит соединение открытым через прокси
+                    yield ': ping\n\n'
+                    continue
+                yield _sse(event['event'], {'time': event.get('time')})
+        finally:
+            events.broker.unsubscribe(subscription)
+
+    return StreamingHttpResponse(stream(), content_type='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        # nginx не должен буферизовать поток
+        'X-Accel-Buffering': 'no',
+    })
+
+
+def load_week_slots(request):
+    doctor_id = request.GET.get('doctor_id')
+    if not doctor_id:
+        return JsonResponse({})
 
     try:
-        patient = Patient.objects.get(user=user)
-    except Patient.DoesNotExist:
+        doctor_id = int(doctor_id)
+        date_str = request.GET.get('start')
+        start = datetime.strptime(date_str, '%Y-%m-%d').date() if date_str else datetime.now().date()
+        days = min(max(int(request.GET.get('days', 7)), 1), 31)
+    except ValueError:
+        return JsonResponse({})
+
+    week = slots.free_slots_range(doctor_id, start, days)
+    return JsonResponse({day.isoformat(): free for day, free in week.items()})
+
+
+def load_working_days(request):
+    doctor_id = request.GET.get('doctor_id')
+    if not doctor_id:
+        return JsonResponse([], safe=False)
+
+    try:
+        doctor_id = int(doctor_id)
+        date_str = request.GET.get('start')
+        start = datetime.strptime(date_str, '%Y-%m-%d').date() if date_str else datetime.now().date()
+        days = min(max(int(request.GET.get('days', 60)), 1), 366)
+    except ValueError:
+        return JsonResponse([], safe=False)
+
+    working = schedule.get_calendar().working_days(doctor_id, start, days)
+    return JsonResponse([day.isoformat() for day in working], safe=False)
+
+
+@role_required()
+def book_appointment_view(request):
+    if request.principal.patient_id is None:
         return redirect('dashboard')
+    patient = Patient(id=request.principal.patient_id)
 
     if request.method == 'POST':
         form = BookingForm(request.POST)
@@ -124,131 +292,264 @@ def book_appointment_view(request):
         doc_id = request.POST.get('doctor')
 
         if raw_date_time and doc_id:
-            doctor = Doctor.objects.get(id=doc_id)
-            final_dt = datetime.strptime(raw_date_time, '%Y-%m-%d %H:%M')
-
-            AppointmentBooking.objects.create(
-                patient=patient,
-                doctor=doctor,
-                date_time=final_dt,
-                status='Scheduled'
-            )
-            messages.success(request, 'Запись успешно создана!')
-            return redirect('dashboard')
+            try:
+                final_dt = datetime.strptime(raw_date_time, '%Y-%m-%d %H:%M')
+                book_slot(patient, int(doc_id), final_dt)
+            except (ValueError, SlotUnavailable):
+                messages.error(request, 'Выбранное время недоступно для записи.')
+            except SlotTaken:
+                messages.error(request, 'Это время уже занято. Выберите другой слот.')
+            else:
+                messages.success(request, 'Запись успешно создана!')
+                return redirect('dashboard')
 
     else:
         form = BookingForm()
 
-    return render(request, 'book_appointment.html', {'form': form})
+    # Без ASGI живых обновлений нет: слоты загружаются при смене врача или даты
+    slot_events_url = reverse('ajax_slot_events') if settings.ASYNC_AJAX_VIEWS else ''
+    return render(request, 'book_appointment.html', {
+        'form': form, 'slot_events_url': slot_events_url, 'horizon_days': schedule.horizon_days(),
+    })
 
 
+@role_required(ROLE_DOCTOR)
 def doctor_complete_view(request, booking_id):
-    if request.session.get('role_id') != 2:
-        return redirect('dashboard')
-
-    booking = get_object_or_404(AppointmentBooking, id=booking_id)
+    booking = get_object_or_404(
+        AppointmentBooking.objects.select_related('patient'),
+        id=booking_id, doctor_id=request.principal.doctor_id
+    )
 
     if request.method == 'POST':
         form = DoctorCompleteForm(request.POST)
         if form.is_valid():
-            appt = form.save(commit=False)
-            appt.booking = booking
-            appt.save()
-
-            services = form.cleaned_data['services']
-            for svc in services:
-                PerformedService.objects.create(appointment=appt, service=svc, count=1)
-
-            booking.status = 'Completed'
-            booking.save()
+            try:
+                complete_visits([form.visit(booking.id)], doctor_id=booking.doctor_id)
+            except VisitError:
+                messages.error(request, 'Прием уже завершен или отменен.')
+                return redirect('dashboard')
 
             messages.success(request, 'Прием завершен.')
             return redirect('dashboard')
     else:
         form = DoctorCompleteForm()
 
-    return render(request, 'doctor_complete.html', {'form': form, 'booking': booking})
+    # Введенные количества услуг возвращаются в форму при ошибке
+    posted_counts = {key: value for key, value in request.POST.items() if key.startswith('count_')}
+    return render(request, 'doctor_complete.html', {'form': form, 'booking': booking, 'posted_counts': posted_counts})
 
 
-def export_patients_json(request):
-    patients = list(Patient.objects.values('full_name', 'phone', 'med_card_number', 'birth_date'))
-    return JsonResponse(patients, safe=False, json_dumps_params={'ensure_ascii': False, 'indent': 4})
+@require_POST
+@role_required(ROLE_ADMIN, ROLE_DOCTOR, api=True)
+def complete_visits_batch(request):
+    """Пакетное завершение приемов: {"visits": [{"booking_id", "complaints", "diagnosis_id",
+    "services": [{"service_id", "count"}], "prescriptions": [...]}, ...]}. Все или ничего."""
 
+    try:
+        payload = json.loads(request.body)
+        items = payload['visits']
+        if not isinstance(items, list) or not items:
+            raise ValueError
+    except (ValueError, KeyError, TypeError):
+        return JsonResponse({'error': 'Ожидается {"visits": [...]}'}, status=400)
+    if len(items) > BATCH_LIMIT:
+        return JsonResponse({'error': f'Не более {BATCH_LIMIT} приемов за запрос'}, status=400)
+
+    visits = []
+    errors = {}
+    for index, item in enumerate(items):
+        try:
+            visits.append(parse_visit(item))
+        except ValueError as exc:
+            errors[index] = str(exc)
+    if errors:
+        return JsonResponse({'error': 'Неверные данные', 'items': errors}, status=400)
+
+    doctor_id = None
+    if request.principal.is_doctor:
+        doctor_id = request.principal.doctor_id
+        if doctor_id is None:
+            return JsonResponse({'error': 'forbidden'}, status=403)
 
-def export_doctors_report_csv(request):
-    response = HttpResponse(content_type='text/csv',
-                            headers={'Content-Disposition': 'attachment; filename="doctors_report.csv"'})
-    response.write(u'\ufeff'.encode('utf8'))
-    writer = csv.writer(response, delimiter=';')
-    writer.writerow(['ФИО Врача', 'Специализация', 'Кабинет', 'Количество приемов'])
-
-    sql_query = """
-        SELECT d.full_name, s.name, o.number, COUNT(b.id) as visit_count
-        FROM clinic.doctors d
-        JOIN clinic.specializations s ON d.specialization_id = s.id
-        LEFT JOIN clinic.offices o ON d.office_id = o.id
-        LEFT JOIN clinic.appointment_bookings b ON d.id = b.doctor_id
-        WHERE b.status = 'Completed' OR b.status IS NULL
-        GROUP BY d.full_name, s.name, o.number
-        ORDER BY visit_count DESC
+    try:
+        appointments = complete_visits(visits, doctor_id=doctor_id)
+    except VisitError as exc:
+        return JsonResponse({'error': str(exc), 'bookings': exc.errors}, status=409)
+
+    return JsonResponse({
+        'completed': [{'booking_id': a.booking_id, 'appointment_id': a.id} for a in appointments]
+    })
+
+
+async def _in_request_thread(chunks):
+    # Порции берутся в потоке представления: там открыт (серверный) курсор выгрузки.
+    # Сам итератор закрывает response.close() в конце запроса, в том же потоке.
+    next_chunk = sync_to_async(next, thread_sensitive=True)
+    done = object()
+    while (chunk := await next_chunk(chunks, done)) is not done:
+        yield chunk
+
+
+def asgi_streaming(view):
+    """Под ASGI отдает потоковый ответ асинхронным итератором.
+
+    Синхронный итератор StreamingHttpResponse Django под ASGI вычитывает целиком
+    (sync_to_async(list)) и держит всю выгрузку в памяти до первого байта ответа.
     """
-    with connection.cursor() as cursor:
-        cursor.execute(sql_query)
-        rows = cursor.fetchall()
-    for row in rows:
-        writer.writerow(row)
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        response = view(request, *args, **kwargs)
+        if isinstance(request, ASGIRequest) and response.streaming and not response.is_async:
+            response.streaming_content = _in_request_thread(iter(response.streaming_content))
+        return response
+    return wrapper
+
+
+# Персональные данные пациентов — только администратор (как и задание 'patients' в core.jobs)
+@role_required(ROLE_ADMIN, api=True)
+@use_replica()
+@asgi_streaming
+def export_patients_json(request):
+    fmt = 'ndjson' if request.GET.get('format') == 'ndjson' else 'json'
+    try:
+        filters = exports.patient_filters(request.GET)
+    except ValueError:
+        return JsonResponse({'error': 'Неверные параметры выгрузки'}, status=400)
 
+    chunks = exports.iter_patients(fmt, **filters)
+    content_type = 'application/x-ndjson' if fmt == 'ndjson' else 'application/json'
+
+    use_gzip = request.GET.get('gzip') == '1' and 'gzip' in request.headers.get('Accept-Encoding', '')
+    if use_gzip:
+        chunks = compress_sequence(chunks)
+
+    response = StreamingHttpResponse(chunks, content_type=f'{content_type}; charset=utf-8')
+    if use_gzip:
+        response['Content-Encoding'] = 'gzip'
+    patch_vary_headers(response, ('Accept-Encoding',))
     return response
 
 
+@role_required(ROLE_ADMIN, api=True)
+@use_replica()
+@asgi_streaming
+def export_doctors_report_csv(request):
+    try:
+        filters = exports.report_filters(request.GET)
+    except ValueError:
+        return JsonResponse({'error': 'Неверные параметры отчета'}, status=400)
+
+    return StreamingHttpResponse(
+        exports.iter_doctors_report_csv(**filters),
+        content_type='text/csv',
+        headers={'Content-Disposition': 'attachment; filename="doctors_report.csv"'},
+    )
+
+
+@role_required(ROLE_ADMIN, ROLE_DOCTOR)
+@use_replica()
 def export_my_schedule_xlsx(request):
-    user_id = request.session.get('user_id')
-    role_id = request.session.get('role_id')
-    if not user_id or role_id != 2:
-        return redirect('login')
+    me = request.principal
 
-    user = User.objects.get(id=user_id)
     try:
-        doctor = Doctor.objects.get(user=user)
-    except Doctor.DoesNotExist:
+        filters = exports.schedule_filters(request.GET)
+        # Администратор может выгрузить несколько врачей, каждого на свой лист
+        doctor_ids = [int(x) for x in request.GET.get('doctors', '').split(',') if x] if me.is_admin else []
+    except ValueError:
+        return JsonResponse({'error': 'Неверные параметры выгрузки'}, status=400)
+
+    if me.is_doctor:
+        doctors = list(Doctor.objects.filter(id=me.doctor_id))
+    else:
+        doctors = list(Doctor.objects.filter(id__in=doctor_ids).order_by('full_name'))
+    if not doctors:
         return redirect('dashboard')
 
-    wb = openpyxl.Workbook()
-    ws = wb.active
-    ws.title = "План приемов"
-
-    headers = ['Дата и Время', 'Пациент', 'Телефон', 'Статус', 'Жалобы (если есть)']
-    ws.append(headers)
-
-    for cell in ws[1]:
-        cell.font = Font(bold=True)
-        cell.alignment = Alignment(horizontal='center')
-
-    bookings = AppointmentBooking.objects.filter(
-        doctor=doctor,
-        status='Scheduled'
-    ).order_by('date_time')
-
-    for b in bookings:
-        date_str = b.date_time.strftime('%d.%m.%Y %H:%M')
-        complaints = "-"
-        if hasattr(b, 'appointment') and b.appointment.complaints:
-            complaints = b.appointment.complaints
-
-        ws.append([
-            date_str,
-            b.patient.full_name,
-            b.patient.phone,
-            "Ожидает приема",
-            complaints
-        ])
-
-    for column_cells in ws.columns:
-        length = max(len(str(cell.value) or "") for cell in column_cells)
-        ws.column_dimensions[column_cells[0].column_letter].width = length + 5
-
-    response = HttpResponse(content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
-    response['Content-Disposition'] = f'attachment; filename="schedule_{doctor.license_number}.xlsx"'
-
-    wb.save(response)
-    return response
\ No newline at end of file
+    filename = f"schedule_{doctors[0].license_number}.xlsx" if len(doctors) == 1 else "schedules.xlsx"
+
+    # Книга пишется во временный файл и отдается потоком, а не собирается в памяти
+    tmp = tempfile.TemporaryFile()
+    exports.write_schedule_xlsx(tmp, doctors, **filters)
+    tmp.seek(0)
+    return FileResponse(
+        tmp,
+        as_attachment=True,
+        filename=filename,
+        content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+    )
+
+
+
+def _job_response(job, status=200):
+    state = jobs.job_state(job)
+    state['status_url'] = reverse('export_job', args=[job.id])
+    state['download_url'] = reverse('export_job_download', args=[job.id]) if job.status == ExportJob.STATUS_DONE else None
+    return JsonResponse(state, status=status)
+
+
+def _job_params(kind, data, me):
+    """Параметры задания из запроса; ValueError при неверных значениях или нехватке прав."""
+    if kind == 'patients':
+        exports.patient_filters(data)
+        params = {key: data[key] for key in ('after_id', 'updated_since') if data.get(key)}
+        params['format'] = 'ndjson' if data.get('format') == 'ndjson' else 'json'
+    elif kind == 'doctors_report':
+        exports.report_filters(data)
+        params = {key: data[key] for key in ('date_from', 'date_to', 'specialization') if data.get(key)}
+    elif kind == 'schedule':
+        exports.schedule_filters(data)
+        params = {key: data[key] for key in ('date_from', 'date_to') if data.get(key)}
+        if me.is_admin:
+            params['doctors'] = sorted(int(x) for x in data.get('doctors', '').split(',') if x)
+        else:
+            params['doctors'] = [me.doctor_id] if me.doctor_id else []
+        if not params['doctors']:
+            raise ValueError('doctors')
+    else:
+        raise ValueError(kind)
+    return params
+
+
+@require_POST
+@role_required(api=True)
+def export_job_create(request):
+    kind = request.POST.get('kind')
+    if kind in jobs.KINDS and not jobs.can_create(kind, request.principal, is_staff=request.user.is_staff):
+        return JsonResponse({'error': 'forbidden'}, status=403)
+    try:
+        params = _job_params(kind, request.POST, request.principal)
+    except ValueError:
+        return JsonResponse({'error': 'Неверные параметры выгрузки'}, status=400)
+
+    return _job_response(jobs.enqueue(kind, params, request.principal.user_id), status=202)
+
+
+def _get_job(request, job_id):
+    job = get_object_or_404(ExportJob, id=job_id)
+    allowed = jobs.can_access(job, request.principal, is_staff=request.user.is_staff)
+    return job if allowed else None
+
+
+def export_job_status(request, job_id):
+    job = _get_job(request, job_id)
+    if job is None:
+        return JsonResponse({'error': 'forbidden'}, status=403)
+    return _job_response(job)
+
+
+@asgi_streaming
+def export_job_download(request, job_id):
+    job = _get_job(request, job_id)
+    if job is None:
+        return HttpResponse(status=403)
+
+    path = jobs.artifact_path(job)
+    if job.status != ExportJob.STATUS_DONE or not path or not os.path.exists(path):
+        return HttpResponse('Выгрузка еще не готова или устарела.', status=404)
+
+    return FileResponse(
+        open(path, 'rb'),
+        as_attachment=True,
+        filename=job.file_path.split('_', 1)[1],
+        content_type=jobs.KINDS[job.kind]['content_type'],
+    )
\ No newline at end of file
@@ -0,0 +1,118 @@
+
+from django.db import transaction
+
+from . import refcache, stats
+from .models import AppointmentBooking, Appointment, PerformedService, Prescription
+
+# Завершение приемов одной транзакцией: протоколы, услуги и назначения
+# вставляются пачками (bulk_create), статус записей меняется одним UPDATE.
+# Через post_save это не проходит, поэтому статистика пересчитывается здесь;
+# индекс слотов не трогаем — завершенная запись по-прежнему занимает слот.
+
+BATCH_LIMIT = 500
+
+
+class VisitError(Exception):
+    def __init__(self, message, errors=None):
+        super().__init__(message)
+        self.errors = errors or {}
+
+
+class Visit:
+    """Данные одного завершаемого приема."""
+
+    def __init__(self, booking_id, complaints='', diagnosis_id=None, services=None, prescriptions=None):
+        self.booking_id = booking_id
+        self.complaints = complaints
+        self.diagnosis_id = diagnosis_id
+        # {service_id: count}
+        self.services = services or {}
+        self.prescriptions = prescriptions or []
+
+
+def _positive_int(value):
+    if isinstance(value, bool):
+        raise ValueError(value)
+    number = int(value)
+    if number < 1:
+        raise ValueError(value)
+    return number
+
+
+def parse_visit(data):
+    """Visit из JSON-объекта пакетного API; ValueError с описанием при неверных данных."""
+    if not isinstance(data, dict):
+        raise ValueError('Ожидается объект')
+    try:
+        booking_id = _positive_int(data.get('booking_id'))
+    except (TypeError, ValueError):
+        raise ValueError('Неверный booking_id')
+
+    diagnosis_id = data.get('diagnosis_id')
+    if diagnosis_id is not None and refcache.get('diagnoses').get(diagnosis_id) is None:
+        raise ValueError(f'Неизвестный диагноз {diagnosis_id}')
+
+    services = {}
+    for item in data.get('services') or []:
+        try:
+            service_id = int(item['service_id'])
+            count = _positive_int(item.get('count', 1))
+        except (TypeError, KeyError, ValueError):
+            raise ValueError('Услуга задается как {"service_id": ..., "count": ...}')
+        if refcache.get('services').get(service_id) is None:
+            raise ValueError(f'Неизвестная услуга {service_id}')
+        services[service_id] = services.get(service_id, 0) + count
+
+    prescriptions = data.get('prescriptions') or []
+    if not isinstance(prescriptions, list) or not all(isinstance(name, str) for name in prescriptions):
+        raise ValueError('Назначения задаются списком строк')
+    prescriptions = [name.strip()[:200] for name in prescriptions if name.strip()]
+
+    return Visit(booking_id, data.get('complaints') or '', diagnosis_id, services, prescriptions)
+
+
+def complete_visits(visits, doctor_id=None):
+    """Завершить приемы атомарно: либо все, либо ни одного.
+
+    doctor_id ограничивает записи приемами этого врача (для врача — его собственные).
+    """
+    ids = [visit.booking_id for visit in visits]
+    if len(set(ids)) != len(ids):
+        raise VisitError('Запись указана несколько раз')
+
+    with transaction.atomic():
+        bookings = AppointmentBooking.objects.select_for_update().filter(id__in=ids)
+        if doctor_id is not None:
+            bookings = bookings.filter(doctor_id=doctor_id)
+        bookings = {booking.id: booking for booking in bookings.only('id', 'doctor_id', 'date_time', 'status')}
+
+        errors = {}
+        for booking_id in ids:
+            booking = bookings.get(booking_id)
+            if booking is None:
+                errors[booking_id] = 'Запись не найдена'
+            elif booking.status != 'Scheduled':
+                errors[booking_id] = 'Прием уже завершен или отменен'
+        if errors:
+            raise VisitError('Часть приемов нельзя завершить', errors)
+
+        appointments = Appointment.objects.bulk_create([
+            Appointment(booking_id=visit.booking_id, complaints=visit.complaints, diagnosis_id=visit.diagnosis_id)
+            for visit in visits
+        ])
+        PerformedService.objects.bulk_create([
+            PerformedService(appointment=appointment, service_id=service_id, count=count)
+            for appointment, visit in zip(appointments, visits)
+            for service_id, count in visit.services.items()
+        ])
+        Prescription.objects.bulk_create([
+            Prescription(appointment=appointment, medication_name=name)
+            for appointment, visit in zip(appointments, visits)
+            for name in visit.prescriptions
+        ])
+        AppointmentBooking.objects.filter(id__in=ids).update(status='Completed')
+
+        for doctor, day in {(b.doctor_id, b.date_time.date()) for b in bookings.values()}:
+            stats.refresh_after_commit(doctor, day)
+
+    return appointments
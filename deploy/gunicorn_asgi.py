@@ -0,0 +1,32 @@
+# Асинхронный профиль (ASGI, uvicorn в воркерах gunicorn):
+#   gunicorn hospital.asgi:application -c deploy/gunicorn_asgi.py
+# Для разработки достаточно: uvicorn hospital.asgi:application --reload
+#
+# Профиль обслуживает все URL, включая потоковые выгрузки (export/json/, export/csv/,
+# export/jobs/<id>/download/): они помечены core.views.asgi_streaming и под ASGI
+# отдаются асинхронным итератором по порциям, без сборки всего ответа в памяти.
+# Новые потоковые представления должны использовать тот же декоратор.
+import multiprocessing
+import os
+
+bind = os.getenv('BIND', '0.0.0.0:8000')
+workers = int(os.getenv('WEB_WORKERS', multiprocessing.cpu_count()))
+worker_class = 'uvicorn_worker.UvicornWorker'
+timeout = 60
+graceful_timeout = 30
+keepalive = 5
+
+# Кэш слотов и версии справочников должны быть общими для всех воркеров
+# (LocMemCache у каждого процесса свой, см. CACHES в hospital/settings.py)
+if not os.getenv('CACHE_LOCATION'):
+    raise RuntimeError('Укажите CACHE_LOCATION общего кэша, например redis://127.0.0.1:6379/1')
+
+raw_env = [
+    f"CACHE_BACKEND={os.getenv('CACHE_BACKEND', 'django.core.cache.backends.redis.RedisCache')}",
+    f"CACHE_LOCATION={os.getenv('CACHE_LOCATION')}",
+    'ASYNC_AJAX_VIEWS=1',
+    # Постоянные соединения Django под ASGI не переиспользуются между запросами —
+    # вместо них пул psycopg (DB_POOL=1)
+    'DB_CONN_MAX_AGE=0',
+    f"DB_POOL={os.getenv('DB_POOL', '1')}",
+]
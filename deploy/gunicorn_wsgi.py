@@ -0,0 +1,21 @@
+# Синхронный профиль (WSGI):
+#   gunicorn hospital.wsgi:application -c deploy/gunicorn_wsgi.py
+import multiprocessing
+import os
+
+bind = os.getenv('BIND', '0.0.0.0:8000')
+workers = int(os.getenv('WEB_WORKERS', multiprocessing.cpu_count() * 2 + 1))
+threads = int(os.getenv('WEB_THREADS', 1))
+timeout = 60
+graceful_timeout = 30
+keepalive = 5
+
+# Кэш слотов и версии справочников должны быть общими для всех воркеров
+# (LocMemCache у каждого процесса свой, см. CACHES в hospital/settings.py)
+if not os.getenv('CACHE_LOCATION'):
+    raise RuntimeError('Укажите CACHE_LOCATION общего кэша, например redis://127.0.0.1:6379/1')
+
+raw_env = [
+    f"CACHE_BACKEND={os.getenv('CACHE_BACKEND', 'django.core.cache.backends.redis.RedisCache')}",
+    f"CACHE_LOCATION={os.getenv('CACHE_LOCATION')}",
+]
@@ -33,23 +33,36 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
 ]
 
 MIDDLEWARE = [
+    'core.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'core.principal.PrincipalMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
 ROOT_URLCONF = 'hospital.urls'
 
+# Асинхронные версии /ajax/doctors/ и /ajax/slots/: включаются при запуске под ASGI
+# (hospital/asgi.py выставляет переменную), под WSGI остаются синхронные
+ASYNC_AJAX_VIEWS = os.getenv('ASYNC_AJAX_VIEWS') == '1'
+
+# Метрики (core.metrics): адреса, которым доступен /metrics, и сколько одинаковых
+# SQL за запрос считать признаком N+1
+METRICS_ALLOWED_IPS = os.getenv('METRICS_ALLOWED_IPS', '127.0.0.1,::1').split(',')
+METRICS_DUPLICATE_THRESHOLD = int(os.getenv('METRICS_DUPLICATE_THRESHOLD', 5))
+
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # Штатный DjangoTemplates с замером времени рендеринга (core.metrics)
+        'BACKEND': 'core.metrics.InstrumentedDjangoTemplates',
         'DIRS': [],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -68,17 +81,58 @@ WSGI_APPLICATION = 'hospital.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/6.0/ref/settings/#databases
 
-DATABASES = {
-    'default': {
+def _database(prefix):
+    """Подключение к PostgreSQL из переменных окружения <prefix>_NAME, <prefix>_HOST и т.д."""
+    database = {
         'ENGINE': 'django.db.backends.postgresql',
-        'NAME': os.getenv('DB_NAME'),
-        'USER': os.getenv('DB_USER'),
-        'PASSWORD': os.getenv('DB_PASSWORD'),
-        'HOST': os.getenv('DB_HOST'),
-        'PORT': os.getenv('DB_PORT'),
+        'NAME': os.getenv(f'{prefix}_NAME', os.getenv('DB_NAME')),
+        'USER': os.getenv(f'{prefix}_USER', os.getenv('DB_USER')),
+        'PASSWORD': os.getenv(f'{prefix}_PASSWORD', os.getenv('DB_PASSWORD')),
+        'HOST': os.getenv(f'{prefix}_HOST'),
+        'PORT': os.getenv(f'{prefix}_PORT', os.getenv('DB_PORT')),
         'OPTIONS': {
             'options': '-c search_path=clinic,public'
         },
+        # Постоянные соединения: search_path и прочее согласуются один раз на соединение,
+        # перед повторным использованием соединение проверяется
+        'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE', 60)),
+        'CONN_HEALTH_CHECKS': True,
+    }
+    if os.getenv('DB_POOL') == '1':
+        # Пул соединений psycopg 3 (пакеты psycopg и psycopg-pool); с пулом CONN_MAX_AGE должен быть 0
+        database['CONN_MAX_AGE'] = 0
+        database['OPTIONS']['pool'] = {
+            'min_size': int(os.getenv('DB_POOL_MIN', 2)),
+            'max_size': int(os.getenv('DB_POOL_MAX', 10)),
+            'timeout': float(os.getenv('DB_POOL_TIMEOUT', 10)),
+        }
+    return database
+
+
+DATABASES = {
+    'default': _database('DB'),
+}
+
+# Реплика для чтения (core.routers): используется представлениями и выгрузками под use_replica
+if os.getenv('DB_REPLICA_HOST'):
+    DATABASES['replica'] = _database('DB_REPLICA')
+    DATABASES['replica']['TEST'] = {'MIRROR': 'default'}
+
+DATABASE_ROUTERS = ['core.routers.ReplicaRouter']
+
+# Тестовая база создается по моделям, включая unmanaged-таблицы схемы clinic
+TEST_RUNNER = 'core.test_runner.ManagedModelsTestRunner'
+
+# Общий кэш (индекс слотов, версии расписания, справочников и пользователей).
+# LocMemCache по умолчанию — только для разработки в одном процессе: у каждого
+# воркера gunicorn он свой, и сброс кэша в одном воркере не виден остальным.
+# В продакшене обязателен общий бэкенд (профили deploy/ требуют CACHE_LOCATION):
+# CACHE_BACKEND=django.core.cache.backends.redis.RedisCache, CACHE_LOCATION=redis://...
+# `manage.py check --deploy` предупреждает о LocMemCache.
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv('CACHE_LOCATION', ''),
     }
 }
 
@@ -101,6 +155,30 @@ AUTH_PASSWORD_VALIDATORS = [
     },
 ]
 
+# Хеширование паролей пользователей клиники (core.credentials). Первый алгоритм
+# используется для новых хешей; стоимость PBKDF2 подбирается командой bench_login.
+# Argon2 (пакет argon2-cffi) можно поставить первым — старые хеши пересчитаются при входе.
+PASSWORD_PBKDF2_ITERATIONS = int(os.getenv('PASSWORD_PBKDF2_ITERATIONS', 600000))
+PASSWORD_HASHERS = [
+    'core.hashers.ClinicPBKDF2PasswordHasher',
+    'django.contrib.auth.hashers.Argon2PasswordHasher',
+    'django.contrib.auth.hashers.ScryptPasswordHasher',
+]
+
+# Не более N попыток входа за M секунд на один логин
+LOGIN_RATE_LIMIT = (
+    int(os.getenv('LOGIN_RATE_ATTEMPTS', 10)),
+    int(os.getenv('LOGIN_RATE_PERIOD', 60)),
+)
+# Отдельный, более мягкий лимит на адрес клиента: за NAT входит много пользователей
+LOGIN_IP_RATE_LIMIT = (
+    int(os.getenv('LOGIN_IP_RATE_ATTEMPTS', 100)),
+    int(os.getenv('LOGIN_IP_RATE_PERIOD', 60)),
+)
+# Адреса или сети (CIDR) обратных прокси, которым доверяется X-Forwarded-For
+# при определении адреса клиента (core.credentials.client_address)
+TRUSTED_PROXIES = [value.strip() for value in os.getenv('TRUSTED_PROXIES', '').split(',') if value.strip()]
+
 
 # Internationalization
 # https://docs.djangoproject.com/en/6.0/topics/i18n/
@@ -119,9 +197,36 @@ USE_TZ = False
 
 STATIC_URL = 'static/'
 
+# Фоновые выгрузки: каталог готовых файлов и срок, в течение которого
+# одинаковые запросы отдаются из уже готового файла (сек)
+EXPORT_ROOT = BASE_DIR / 'exports'
+EXPORT_CACHE_TTL = int(os.getenv('EXPORT_CACHE_TTL', 3600))
+# Задание дольше этого времени в RUNNING считается брошенным (упал воркер) и возвращается в очередь
+EXPORT_JOB_TIMEOUT = int(os.getenv('EXPORT_JOB_TIMEOUT', 2 * 3600))
+
+# Резервные копии: локальные снимки, хранилище для загрузки и политика хранения
+BACKUP_ROOT = BASE_DIR / 'backups'
+BACKUP_STORE_ROOT = os.getenv('BACKUP_STORE_ROOT', BASE_DIR / 'backup_store')
+BACKUP_RETENTION = int(os.getenv('BACKUP_RETENTION', 7))
+BACKUP_CHUNK_MB = int(os.getenv('BACKUP_CHUNK_MB', 64))
+
+# Результаты bench_suite (JSON для сравнения прогонов между версиями)
+BENCHMARK_ROOT = os.getenv('BENCHMARK_ROOT', BASE_DIR / 'benchmarks')
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/6.0/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
-LOGIN_URL = 'login'
\ No newline at end of file
+LOGIN_URL = 'login'
+
+# Запись открыта с сегодняшнего дня на столько дней вперед (календарь на странице записи, core.booking)
+BOOKING_HORIZON_DAYS = int(os.getenv('BOOKING_HORIZON_DAYS', 90))
+
+# График приема по умолчанию для врачей и кабинетов без собственных шаблонов
+CLINIC_DEFAULT_SCHEDULE = {
+    'start': '09:00',
+    'end': '18:00',
+    'slot_minutes': 30,
+    'weekdays': [0, 1, 2, 3, 4, 5, 6],
+}
\ No newline at end of file